@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+def song_deleted(instance, **kwargs):
+    from .models import User
+    User.adjust_song_counters(instance.user_id, created=-1, published=-int(instance.is_public))
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.accounts'
+    
+    def ready(self):
+        # Runs in the delete's transaction; covers admin and cascade deletes
+        post_delete.connect(song_deleted, sender='songs.Song')
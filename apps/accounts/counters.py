@@ -0,0 +1,58 @@
+"""
+Bulk reconciliation of the per-user song counters.
+
+User.total_songs_created and total_songs_published are adjusted with
+atomic F() updates in the transaction of every song change (see
+User.adjust_song_counters). Writes that bypass the app (bulk deletes,
+raw SQL, restores) can still leave them off, so a periodic task
+(PERIODIC_TASKS['user_counters']) recounts them from the songs.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def recount_song_counters(batch_size=BATCH_SIZE):
+    """
+    Recompute song counters for every user.
+
+    Users are read in keyset batches; each batch costs one grouped count
+    over its users' songs and one bulk UPDATE of the users that drifted.
+
+    Returns:
+        int: Users whose counters were corrected
+    """
+    from apps.songs.models import Song
+
+    User = get_user_model()
+    users = User.objects.order_by('pk')
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(users.filter(pk__gt=last_pk).values_list(
+            'pk', 'total_songs_created', 'total_songs_published'
+        )[:batch_size])
+        if not batch:
+            break
+
+        counts = {
+            row['user_id']: (row['created'], row['published'])
+            for row in Song.objects.filter(user_id__in=[pk for pk, _, _ in batch]).order_by()
+            .values('user_id').annotate(created=Count('pk'), published=Count('pk', filter=Q(is_public=True)))
+        }
+        drifted = []
+        for pk, created, published in batch:
+            actual = counts.get(pk, (0, 0))
+            if (created, published) != actual:
+                drifted.append(User(pk=pk, total_songs_created=actual[0], total_songs_published=actual[1]))
+        User.objects.bulk_update(drifted, ['total_songs_created', 'total_songs_published'])
+        fixed += len(drifted)
+        last_pk = batch[-1][0]
+
+    logger.info(f"[COUNTERS] Corrected song counters of {fixed} users")
+    return fixed
@@ -0,0 +1,20 @@
+"""
+Recount every user's song counters from their songs.
+
+Runs periodically in the server process (USER_COUNTER_INTERVAL); use this
+after bulk edits, or from cron with USER_COUNTER_INTERVAL=0.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.accounts.counters import recount_song_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute total_songs_created / total_songs_published for all users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per query')
+
+    def handle(self, *args, **options):
+        fixed = recount_song_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Corrected song counters of {fixed} users"))
@@ -44,15 +44,31 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
-    def increment_song_count(self):
+    @classmethod
+    def adjust_song_counters(cls, user_id, created=0, published=0):
+        """
+        Add to a user's song counters in one atomic UPDATE.
+        
+        Call inside the transaction of the song change, so the counters
+        commit or roll back with it.
+        """
+        fields = {}
+        if created:
+            fields['total_songs_created'] = models.F('total_songs_created') + created
+        if published:
+            fields['total_songs_published'] = models.F('total_songs_published') + published
+        if fields:
+            cls.objects.filter(pk=user_id).update(**fields)
+    
+    def increment_song_count(self, by=1):
         """Increment total songs created."""
-        self.total_songs_created += 1
-        self.save(update_fields=['total_songs_created'])
+        User.adjust_song_counters(self.pk, created=by)
+        self.total_songs_created += by
     
-    def increment_published_count(self):
+    def increment_published_count(self, by=1):
         """Increment total published songs."""
-        self.total_songs_published += 1
-        self.save(update_fields=['total_songs_published'])
+        User.adjust_song_counters(self.pk, published=by)
+        self.total_songs_published += by
 
 
 class UserPreferences(models.Model):
@@ -74,3 +90,17 @@ class UserPreferences(models.Model):
     
     def __str__(self):
         return f"{self.user.username}'s preferences"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket of one rate-limit key (see throttling.DatabaseBuckets)."""
+    
+    key = models.CharField(max_length=200, primary_key=True)  # scope:user:<id> or scope:ip:<address hash>
+    tokens = models.FloatField()
+    updated = models.FloatField()  # Unix time the tokens were counted at
+    
+    class Meta:
+        indexes = [models.Index(fields=['updated'])]
+    
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
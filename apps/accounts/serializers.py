@@ -102,6 +102,19 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return data
 
 
+class PublicUserSerializer(serializers.ModelSerializer):
+    """Public subset of a profile, embedded in other users' responses (songs).
+    
+    Keep in sync with apps.songs.models.SONG_OWNER_FIELDS, which limits the
+    columns loaded for it.
+    """
+    
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'avatar']
+        read_only_fields = fields
+
+
 class UserPreferencesSerializer(serializers.ModelSerializer):
     """Serializer for user preferences."""
     
@@ -0,0 +1,53 @@
+from django.test import RequestFactory, TestCase, override_settings
+
+from .models import RateLimitBucket
+from .throttling import DatabaseBuckets, TokenBucketThrottle
+
+
+class DatabaseBucketsTests(TestCase):
+
+    def setUp(self):
+        self.buckets = DatabaseBuckets()
+
+    def test_first_request_starts_full(self):
+        allowed, tokens = self.buckets.take('test:ip:a', 3, 60, 1000.0)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(tokens, 2)
+
+    def test_empty_bucket_refuses(self):
+        for _ in range(3):
+            self.assertTrue(self.buckets.take('test:ip:a', 3, 60, 1000.0)[0])
+        allowed, tokens = self.buckets.take('test:ip:a', 3, 60, 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(tokens, 0)
+        self.assertAlmostEqual(RateLimitBucket.objects.get(key='test:ip:a').tokens, 0)
+
+    def test_refills_at_the_average_rate(self):
+        for _ in range(3):
+            self.buckets.take('test:ip:a', 3, 60, 1000.0)
+        # One token every 20 seconds
+        self.assertFalse(self.buckets.take('test:ip:a', 3, 60, 1010.0)[0])
+        allowed, tokens = self.buckets.take('test:ip:a', 3, 60, 1020.0)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(tokens, 0)
+
+    def test_refill_stops_at_capacity(self):
+        self.buckets.take('test:ip:a', 3, 60, 1000.0)
+        allowed, tokens = self.buckets.take('test:ip:a', 3, 60, 5000.0)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(tokens, 2)
+
+
+class ClientAddressTests(TestCase):
+
+    def ident(self, **headers):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', **headers)
+        return TokenBucketThrottle().get_ident(request)
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        self.assertEqual(self.ident(HTTP_X_FORWARDED_FOR='203.0.113.9'), '10.0.0.1')
+
+    def test_client_cannot_prepend_addresses(self):
+        with override_settings(REST_FRAMEWORK={'NUM_PROXIES': 1}):
+            ident = self.ident(HTTP_X_FORWARDED_FOR='203.0.113.9, 198.51.100.7')
+        self.assertEqual(ident, '198.51.100.7')
@@ -0,0 +1,195 @@
+"""
+Token-bucket rate limiting for expensive endpoints.
+
+Views opt in with RateLimitMixin and a scope:
+
+    class SongCreateView(RateLimitMixin, generics.CreateAPIView):
+        throttle_scope = 'generation'
+
+settings.RATE_LIMITS gives each scope a bucket per user and per client
+IP, as (requests, seconds): a bucket holds up to `requests` tokens and
+refills at requests/seconds, so clients may burst up to the limit and
+then continue at the average rate. A request takes one token from every
+bucket that applies to it and is refused (429 with Retry-After) at the
+first empty one.
+
+Buckets live in the backend named by settings.RATE_LIMIT_BACKEND:
+
+- DatabaseBuckets (default): one row per key, taken from with a single
+  conditional UPDATE, so limits hold across server processes
+- LocalBuckets: in-process memory, for a single process
+
+Each decision is O(1): a fixed number of statements (or a dict lookup)
+whatever the traffic. Responses carry RateLimit-Limit,
+RateLimit-Remaining, RateLimit-Reset and RateLimit-Policy headers for
+the tightest bucket.
+
+Client IPs come from DRF's get_ident: REMOTE_ADDR, or the address the
+last of REST_FRAMEWORK['NUM_PROXIES'] proxies saw when that is set. IP
+keys hold a hash of the address, so keys have a fixed length.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Least
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+class LocalBuckets:
+    """Buckets in this process's memory; the least recently used are dropped."""
+
+    max_keys = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+
+    def take(self, key, capacity, period, now):
+        """
+        Take one token from the bucket `key`.
+
+        Returns:
+            tuple: (allowed, tokens left)
+        """
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * capacity / period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                # A dropped bucket comes back full
+                self._buckets.popitem(last=False)
+            return allowed, tokens
+
+
+class DatabaseBuckets:
+    """
+    Buckets in the RateLimitBucket table, shared by every process.
+
+    Refill and take happen in one conditional UPDATE evaluated by the
+    database, so concurrent requests cannot both spend the last token.
+    """
+
+    def take(self, key, capacity, period, now):
+        """
+        Take one token from the bucket `key`.
+
+        Returns:
+            tuple: (allowed, tokens left)
+        """
+        from .models import RateLimitBucket
+
+        refilled = Least(
+            Value(float(capacity)),
+            F('tokens') + (Value(now) - F('updated')) * Value(capacity / period),
+            output_field=FloatField(),
+        )
+        bucket = RateLimitBucket.objects.filter(key=key)
+        allowed = bucket.alias(refilled=refilled).filter(refilled__gte=1).update(tokens=refilled - 1, updated=now)
+        if not allowed:
+            row = bucket.values_list('tokens', 'updated').first()
+            if row is None:
+                # First request for the key: start full and take again
+                RateLimitBucket.objects.bulk_create(
+                    [RateLimitBucket(key=key, tokens=capacity, updated=now)], ignore_conflicts=True
+                )
+                allowed = bucket.alias(refilled=refilled).filter(refilled__gte=1).update(
+                    tokens=refilled - 1, updated=now
+                )
+            else:
+                tokens, updated = row
+                return False, min(capacity, tokens + (now - updated) * capacity / period)
+        tokens = bucket.values_list('tokens', flat=True).first()
+        return bool(allowed), tokens if tokens is not None else 0.0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The bucket store from settings.RATE_LIMIT_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.RATE_LIMIT_BACKEND)()
+    return _backend
+
+
+def purge_buckets():
+    """
+    Delete database buckets that have refilled completely.
+
+    A full bucket behaves like a missing one, so this only bounds the
+    table. Run by PERIODIC_TASKS['purge_rate_limits'].
+
+    Returns:
+        int: Buckets removed
+    """
+    from .models import RateLimitBucket
+
+    periods = [period for limits in settings.RATE_LIMITS.values() for _, period in limits.values()]
+    if not periods:
+        return RateLimitBucket.objects.all().delete()[0]
+    return RateLimitBucket.objects.filter(updated__lt=time.time() - max(periods)).delete()[0]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle over the user and IP buckets of the view's throttle_scope."""
+
+    def allow_request(self, request, view):
+        limits = settings.RATE_LIMITS.get(getattr(view, 'throttle_scope', None), {})
+        idents = {'ip': hashlib.sha256(self.get_ident(request).encode()).hexdigest()[:32]}
+        if request.user and request.user.is_authenticated:
+            idents['user'] = request.user.pk
+
+        now = time.time()
+        backend = get_backend()
+        self.decisions = []
+        for kind, (capacity, period) in limits.items():
+            if not capacity or kind not in idents:
+                continue
+            allowed, tokens = backend.take(f"{view.throttle_scope}:{kind}:{idents[kind]}", capacity, period, now)
+            self.decisions.append((allowed, tokens, capacity, period))
+            if not allowed:
+                break  # Leave the other buckets' tokens alone
+
+        if self.decisions:
+            # Report the bucket closest to refusing
+            _, tokens, capacity, period = min(self.decisions, key=lambda d: (d[0], d[1] / d[2]))
+            request.rate_limit = {
+                'RateLimit-Limit': str(capacity),
+                'RateLimit-Remaining': str(max(0, math.floor(tokens))),
+                'RateLimit-Reset': str(math.ceil((capacity - tokens) * period / capacity)),
+                'RateLimit-Policy': f"{capacity};w={period}",
+            }
+        return all(allowed for allowed, *_ in self.decisions)
+
+    def wait(self):
+        """Seconds until the refused bucket has a token again."""
+        return max(
+            ((1 - tokens) * period / capacity for allowed, tokens, capacity, period in self.decisions if not allowed),
+            default=None,
+        )
+
+
+class RateLimitMixin:
+    """Rate-limit a DRF view by its throttle_scope (a key of settings.RATE_LIMITS)."""
+
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        for header, value in getattr(request, 'rate_limit', {}).items():
+            response[header] = value
+        return response
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from .models import DailyUsage, GenerationUsage
+
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'jobs', 'failed_jobs', 'total_seconds', 'diffusion_seconds', 'lyrics_tokens']
+    list_filter = ['day']
+    search_fields = ['user__username']
+    ordering = ['-day', '-total_seconds']
+
+
+@admin.register(GenerationUsage)
+class GenerationUsageAdmin(admin.ModelAdmin):
+    list_display = ['song_id', 'user_id', 'succeeded', 'lyrics_seconds', 'diffusion_seconds', 'encode_seconds',
+                    'total_seconds', 'finished_at']
+    list_filter = ['succeeded', 'finished_at']
+    ordering = ['-finished_at']
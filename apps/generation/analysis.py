@@ -0,0 +1,277 @@
+"""
+Post-generation audio analysis.
+
+Runs on the PCM buffer MusicGenerator.generate already holds, so nothing
+is decoded again. Everything is vectorized NumPy/SciPy; a 3 minute stereo
+track takes a fraction of a second on CPU, next to tens of seconds of
+diffusion:
+
+- Multi-resolution min/max waveform peaks (for the cassette UI)
+- Integrated loudness (ITU-R BS.1770 / EBU R128, LUFS)
+- True peak (4x oversampled, dBTP)
+- Tempo estimate (BPM, onset autocorrelation)
+
+Peaks are packed into a small binary file (a few KB):
+
+    header   '<4sBBII'  magic b'RCWF', version, level count,
+                        sample rate, total samples
+    levels   '<II'      samples per point, point count (one per level)
+    data     int8       interleaved min/max pairs, level by level,
+                        scaled to -127..127
+"""
+import math
+import struct
+
+import numpy as np
+
+PEAKS_MAGIC = b'RCWF'
+PEAKS_VERSION = 1
+PEAK_LEVELS = (4096, 1024, 256)  # Points per level, finest first (each 4x coarser)
+
+# Weakest autocorrelation peak, as a fraction of the onset energy (lag 0),
+# taken as a pulse; steady tones and noise stay far below, beats well above
+MIN_PULSE_STRENGTH = 0.3
+
+# Energy envelope: sub-frames per hop, and the Hann smoothing span in hops
+_ENVELOPE_SUBFRAMES = 4
+_ENVELOPE_SPAN = 8
+
+_HEADER = struct.Struct('<4sBBII')
+_LEVEL = struct.Struct('<II')
+
+
+def analyze_audio(audio, sample_rate):
+    """
+    Analyze a generated track.
+
+    Args:
+        audio: PCM array shaped (samples, channels) or (samples,)
+        sample_rate: Sample rate in Hz
+
+    Returns:
+        dict with 'peaks' (packed bytes), 'loudness_lufs', 'true_peak_dbtp'
+        and 'tempo_bpm'
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim == 1:
+        audio = audio[:, None]
+
+    mono = audio.mean(axis=1)
+
+    return {
+        'peaks': pack_peaks(compute_peaks(mono), sample_rate, mono.shape[0]),
+        'loudness_lufs': integrated_loudness(audio, sample_rate),
+        'true_peak_dbtp': true_peak(audio),
+        'tempo_bpm': estimate_tempo(mono, sample_rate),
+    }
+
+
+def compute_peaks(mono, levels=PEAK_LEVELS):
+    """
+    Min/max peaks at several resolutions.
+
+    The finest level is computed from the samples; each coarser level is
+    reduced from the one before it, so the signal is only scanned once.
+
+    Returns:
+        list of (samples_per_point, mins, maxs) tuples, finest first
+    """
+    n = mono.shape[0]
+    spp = max(1, math.ceil(n / levels[0]))
+    points = math.ceil(n / spp)
+
+    # Pad with edge values so padding never creates a fake peak
+    padded = np.pad(mono, (0, points * spp - n), mode='edge') if n else np.zeros(spp, np.float32)
+    frames = padded.reshape(-1, spp)
+    mins, maxs = frames.min(axis=1), frames.max(axis=1)
+
+    result = [(spp, mins, maxs)]
+    for target in levels[1:]:
+        factor = max(1, math.ceil(mins.shape[0] / target))
+        pad = (-mins.shape[0]) % factor
+        mins = np.pad(mins, (0, pad), mode='edge').reshape(-1, factor).min(axis=1)
+        maxs = np.pad(maxs, (0, pad), mode='edge').reshape(-1, factor).max(axis=1)
+        spp *= factor
+        result.append((spp, mins, maxs))
+    return result
+
+
+def pack_peaks(levels, sample_rate, total_samples):
+    """Pack peak levels into the compact binary format (see module docstring)."""
+    parts = [_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), int(sample_rate), int(total_samples))]
+    data = []
+    for spp, mins, maxs in levels:
+        parts.append(_LEVEL.pack(spp, mins.shape[0]))
+        pairs = np.empty(mins.shape[0] * 2, dtype=np.float32)
+        pairs[0::2] = mins
+        pairs[1::2] = maxs
+        data.append(np.clip(np.round(pairs * 127), -127, 127).astype(np.int8).tobytes())
+    return b''.join(parts + data)
+
+
+def unpack_peaks(blob):
+    """
+    Read a packed peaks file.
+
+    Returns:
+        dict with 'sample_rate', 'total_samples' and 'levels', a list of
+        (samples_per_point, int8 array of interleaved min/max pairs)
+    """
+    magic, version, count, sample_rate, total = _HEADER.unpack_from(blob, 0)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Not a waveform peaks file")
+
+    offset = _HEADER.size
+    headers = []
+    for _ in range(count):
+        headers.append(_LEVEL.unpack_from(blob, offset))
+        offset += _LEVEL.size
+
+    levels = []
+    for spp, points in headers:
+        levels.append((spp, np.frombuffer(blob, dtype=np.int8, count=points * 2, offset=offset)))
+        offset += points * 2
+    return {'sample_rate': sample_rate, 'total_samples': total, 'levels': levels}
+
+
+def _k_weighting(sample_rate):
+    """BS.1770 K-weighting as two biquads (high shelf + high pass), any sample rate."""
+    # High shelf (head acoustics); constants that reproduce the published
+    # 48 kHz coefficients at any sample rate
+    G, Q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    K = math.tan(math.pi * fc / sample_rate)
+    Vh = 10 ** (G / 20)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / Q + K * K
+    shelf_b = [(Vh + Vb * K / Q + K * K) / a0, 2 * (K * K - Vh) / a0, (Vh - Vb * K / Q + K * K) / a0]
+    shelf_a = [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0]
+
+    # High pass (RLB weighting)
+    Q, fc = 0.5003270373238773, 38.13547087602444
+    K = math.tan(math.pi * fc / sample_rate)
+    a0 = 1 + K / Q + K * K
+    hp_b = [1.0, -2.0, 1.0]
+    hp_a = [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0]
+
+    return np.array([shelf_b + shelf_a, hp_b + hp_a])
+
+
+def integrated_loudness(audio, sample_rate):
+    """
+    Integrated loudness in LUFS (BS.1770-4, gated).
+
+    400 ms blocks with 75% overlap are built from 100 ms segment energies
+    of the K-weighted signal, so block energies cost one vectorized pass.
+    Returns None for silence or tracks shorter than one block.
+    """
+    from scipy.signal import sosfilt
+
+    weighted = sosfilt(_k_weighting(sample_rate).astype(audio.dtype), audio, axis=0)
+    hop = int(0.1 * sample_rate)
+    segments = weighted.shape[0] // hop
+    if segments < 4:
+        return None
+
+    # Energy per 100 ms segment, then 400 ms blocks (75% overlap) as sums
+    # of 4 consecutive segments. Channels are summed (L/R weight 1.0).
+    energy = np.square(weighted[:segments * hop], dtype=np.float64).reshape(segments, hop, -1).sum(axis=(1, 2))
+    z = (energy[:-3] + energy[1:-2] + energy[2:-1] + energy[3:]) / (4 * hop)
+
+    with np.errstate(divide='ignore'):
+        block_lufs = -0.691 + 10 * np.log10(z)
+
+    # Absolute gate at -70 LUFS, then relative gate 10 LU below
+    gated = z[block_lufs > -70]
+    if gated.size == 0:
+        return None
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10
+    gated = z[(block_lufs > -70) & (block_lufs > relative)]
+    if gated.size == 0:
+        return None
+    return round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+
+def true_peak(audio, oversample=4, taps=48):
+    """
+    True peak in dBTP (4x oversampled, BS.1770 style interpolator).
+
+    Inter-sample peaks sit next to local maxima of the sample magnitude,
+    and can only beat the sample peak where the sample is within the
+    filter's L1 gain of it. Only those neighbourhoods are interpolated,
+    as one batched matrix product per channel.
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+    from scipy.signal import firwin
+
+    sample_peak = float(np.abs(audio).max()) if audio.size else 0.0
+    if sample_peak <= 0:
+        return None
+
+    # Polyphase interpolation filter: (taps per phase, phases), time-reversed
+    h = firwin(taps, 1.0 / oversample) * oversample
+    phases = h.reshape(-1, oversample)[::-1].astype(np.float32)
+    width = phases.shape[0]
+    threshold = sample_peak / np.abs(phases).sum(axis=0).max()
+    # Filter delay in input samples; look one sample either side of it
+    delay = (taps - 1) // (2 * oversample)
+    offsets = np.arange(delay - 1, delay + 3)
+
+    peak = sample_peak
+    for channel in audio.T:
+        magnitude = np.abs(channel)
+        inner = magnitude[1:-1]
+        local_max = (inner >= threshold) & (inner >= magnitude[:-2]) & (inner >= magnitude[2:])
+        candidates = np.flatnonzero(local_max) + 1
+        if candidates.size == 0:
+            continue
+        padded = np.pad(channel, (width - 1, width)).astype(np.float32, copy=False)
+        view = sliding_window_view(padded, width)
+        # Batches bound the gathered window copy to a few MB
+        for batch in np.array_split(candidates, max(1, candidates.size // 65536)):
+            windows = view[(batch[:, None] + offsets).ravel()]
+            peak = max(peak, float(np.abs(windows @ phases).max()))
+    return round(20 * math.log10(peak), 2)
+
+
+def estimate_tempo(mono, sample_rate, hop=512, min_bpm=60, max_bpm=200):
+    """
+    Tempo estimate in BPM.
+
+    Builds an onset envelope from the rectified rise in log frame energy
+    and picks the strongest autocorrelation lag, weighted towards 120 BPM
+    to avoid half/double tempo picks. The energy is measured on quarter-hop
+    sub-frames and Hann-smoothed before decimating to the hop, so the
+    ripple of steady tones does not alias into a fake pulse. Returns None
+    when no lag reaches MIN_PULSE_STRENGTH of the lag-0 energy.
+    """
+    step = hop // _ENVELOPE_SUBFRAMES
+    subframes = mono.shape[0] // step
+    frames = subframes // _ENVELOPE_SUBFRAMES
+    if frames < 8:
+        return None
+
+    energy = (mono[:subframes * step].reshape(subframes, step) ** 2).mean(axis=1)
+    window = np.hanning(_ENVELOPE_SPAN * _ENVELOPE_SUBFRAMES + 2)[1:-1]
+    energy = np.convolve(energy, window / window.sum(), 'same')[::_ENVELOPE_SUBFRAMES][:frames]
+    onset = np.maximum(np.diff(np.log1p(1000 * energy)), 0)
+    onset -= onset.mean()
+    if not onset.any():
+        return None
+
+    # Autocorrelation via FFT
+    size = 1 << (2 * onset.shape[0] - 1).bit_length()
+    spectrum = np.fft.rfft(onset, size)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), size)[:onset.shape[0]]
+
+    frame_rate = sample_rate / hop
+    lags = np.arange(max(1, int(frame_rate * 60 / max_bpm)), int(frame_rate * 60 / min_bpm) + 1)
+    lags = lags[lags < acf.shape[0]]
+    if lags.size == 0:
+        return None
+
+    bpms = 60 * frame_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpms / 120) / 1.0) ** 2)
+    best = lags[np.argmax(acf[lags] * prior)]
+    if acf[best] < MIN_PULSE_STRENGTH * acf[0]:
+        return None
+    return round(float(60 * frame_rate / best), 1)
@@ -0,0 +1,219 @@
+"""
+Scratch directories for generation jobs and the orphaned-file sweeper.
+
+Every job writes its temporary WAV/MP3 files into its own directory under
+GENERATION_SCRATCH_DIR (``<root>/<pid>/<job_id>``), which is removed when
+the job exits, successfully or not.
+
+The sweeper catches whatever still slips through (killed processes,
+failed songs, files stored just before a crash):
+
+- scratch directories of dead processes, or older than the threshold
+- media files no live Song references, older than the threshold
+- audio of failed songs
+- cached mixtape renders older than MIXTAPE_CACHE_MAX_AGE
+"""
+import logging
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Top-level media directories holding generated artifacts
+SWEPT_PREFIXES = ('songs', 'waveforms')
+
+
+def create_scratch_dir(job_id):
+    """Create and return a fresh scratch directory for one job."""
+    path = os.path.join(settings.GENERATION_SCRATCH_DIR, str(os.getpid()), job_id)
+    shutil.rmtree(path, ignore_errors=True)  # Leftover from an earlier run of the same job
+    os.makedirs(path)
+    return path
+
+
+def remove_scratch_dir(path):
+    """Delete a job's scratch directory and everything left in it."""
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def sweep_scratch(max_age, dry_run=False):
+    """
+    Remove scratch directories of dead processes and stale jobs.
+
+    Returns:
+        tuple: (directories removed, bytes reclaimed)
+    """
+    root = settings.GENERATION_SCRATCH_DIR
+    if not os.path.isdir(root):
+        return 0, 0
+
+    cutoff = time.time() - max_age
+    removed, reclaimed = 0, 0
+    for pid_name in os.listdir(root):
+        pid_dir = os.path.join(root, pid_name)
+        if not os.path.isdir(pid_dir):
+            continue
+        dead = not pid_name.isdigit() or not _pid_alive(int(pid_name))
+        for job_name in os.listdir(pid_dir):
+            job_dir = os.path.join(pid_dir, job_name)
+            if dead or os.path.getmtime(job_dir) < cutoff:
+                reclaimed += _tree_size(job_dir)
+                removed += 1
+                if not dry_run:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+        if dead and not dry_run:
+            shutil.rmtree(pid_dir, ignore_errors=True)
+    return removed, reclaimed
+
+
+def _walk_storage(path):
+    """Yield every file name below a storage directory."""
+    try:
+        directories, files = default_storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f"{path}/{name}"
+    for directory in directories:
+        yield from _walk_storage(f"{path}/{directory}")
+
+
+def sweep_media(max_age, dry_run=False):
+    """
+    Delete generated media no live Song references.
+
+    Failed songs older than the threshold lose their audio reference first,
+    so their partial artifacts are collected too. Files younger than
+    max_age are always kept: a running job may have stored its audio but
+    not yet saved the Song row.
+
+    Returns:
+        tuple: (files removed, bytes reclaimed)
+    """
+    from apps.songs.models import Song
+    from apps.songs.storage import waveform_name
+
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+
+    failed = Song.objects.filter(status='failed', updated_at__lt=cutoff).exclude(audio_file='')
+    if not dry_run:
+        failed.update(audio_file='', audio_hash='')
+
+    live = Song.objects.exclude(status='failed').exclude(audio_file='')
+    referenced = set()
+    for audio_file, audio_hash in live.values_list('audio_file', 'audio_hash').iterator():
+        referenced.add(audio_file)
+        if audio_hash:
+            referenced.add(waveform_name(audio_hash))
+
+    removed, reclaimed = 0, 0
+    for prefix in SWEPT_PREFIXES:
+        for name in _walk_storage(prefix):
+            if name in referenced:
+                continue
+            try:
+                if default_storage.get_modified_time(name) >= cutoff:
+                    continue
+                size = default_storage.size(name)
+                if not dry_run:
+                    default_storage.delete(name)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+    return removed, reclaimed
+
+
+def sweep_mixtapes(max_age, dry_run=False):
+    """
+    Delete cached mixtape renders (apps/songs/mixtape.py) older than max_age.
+    
+    A render expires by the age of its chapters file, which is written
+    last and marks it ready, and its chapters are deleted before its
+    audio, so a render is never served without its audio. Audio left
+    without chapters (a render that crashed) expires by its own age.
+    They are re-rendered on the next request.
+    
+    Returns:
+        tuple: (files removed, bytes reclaimed)
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    removed, reclaimed = 0, 0
+    for name in _walk_storage('mixtapes'):
+        stem, ext = os.path.splitext(name)
+        if ext == '.mp3' and default_storage.exists(f"{stem}.json"):
+            continue  # Expires with its chapters
+        try:
+            if default_storage.get_modified_time(name) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        for path in [name, f"{stem}.mp3"] if ext == '.json' else [name]:
+            try:
+                size = default_storage.size(path)
+                if not dry_run:
+                    default_storage.delete(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+    return removed, reclaimed
+
+
+def sweep(max_age=None, dry_run=False):
+    """
+    Run the scratch and media sweeps.
+
+    Args:
+        max_age: Age threshold in seconds (defaults to settings.GENERATION_SWEEP_MAX_AGE)
+        dry_run: Only report what would be deleted
+
+    Returns:
+        dict: Counts and bytes reclaimed
+    """
+    max_age = settings.GENERATION_SWEEP_MAX_AGE if max_age is None else max_age
+    scratch_dirs, scratch_bytes = sweep_scratch(max_age, dry_run)
+    media_files, media_bytes = sweep_media(max_age, dry_run)
+    mixtape_files, mixtape_bytes = sweep_mixtapes(settings.MIXTAPE_CACHE_MAX_AGE, dry_run)
+    report = {
+        'scratch_dirs': scratch_dirs,
+        'media_files': media_files,
+        'mixtape_files': mixtape_files,
+        'bytes_reclaimed': scratch_bytes + media_bytes + mixtape_bytes,
+        'dry_run': dry_run,
+    }
+    logger.info(
+        f"[SWEEP] Removed {scratch_dirs} scratch dirs, {media_files} orphaned files "
+        f"and {mixtape_files} expired mixtapes, "
+        f"reclaimed {report['bytes_reclaimed'] / 1024 / 1024:.1f} MB"
+        + (" (dry run)" if dry_run else "")
+    )
+    return report
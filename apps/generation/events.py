@@ -0,0 +1,222 @@
+"""
+Per-user generation job events, pushed to the browser over Server-Sent Events.
+
+Workers publish events ('queued' with the queue position, 'stage' with
+the current stage and approximate progress, 'completed', 'failed') to
+the process-wide EventBus. The bus hands each event to the fan-out
+backend from settings.GENERATION_EVENT_FANOUT, which delivers it to the
+bus of every server process; the bus then wakes the SSE streams of that
+user (see views.job_events).
+
+LocalFanout (the default) only reaches the publishing process, which is
+enough while workers run inside the web process. RedisFanout (requires
+redis) relays events through a pub/sub channel for multi-process
+deployments.
+
+The last few events per user are kept so a reconnecting EventSource
+(Last-Event-ID) gets what it missed.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Events kept per user for Last-Event-ID replay, and users kept
+HISTORY_SIZE = 20
+HISTORY_USERS = 1000
+
+# Undelivered events per stream before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Job stages in order, with the progress reported on entering each
+STAGES = {
+    'started': 0.0,
+    'lyrics': 0.05,
+    'music': 0.15,
+    'encoding': 0.85,
+    'storing': 0.95,
+}
+
+
+class Subscription:
+    """
+    One SSE stream: a queue of events for a user, filled from any thread.
+
+    Bound to an event loop (ASGI) the queue is an asyncio.Queue; without
+    one (WSGI, where a stream holds a worker thread) a queue.Queue.
+    """
+
+    def __init__(self, user_id, loop=None):
+        self.user_id = user_id
+        self.loop = loop
+        if loop is not None:
+            self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        else:
+            self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.backlog = []
+        self.overflowed = False
+
+    def deliver(self, event):
+        if self.loop is None:
+            self._put(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # Loop already closed; the stream is gone
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (asyncio.QueueFull, queue.Full):
+            # A stalled client; the stream ends with a 'resync' event
+            self.overflowed = True
+
+
+class LocalFanout:
+    """Deliver events within this process only."""
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.dispatch(event)
+
+
+class RedisFanout:
+    """
+    Relay events through a Redis pub/sub channel to every process.
+
+    Configured with GENERATION_EVENT_REDIS_URL; a daemon thread per
+    process listens and dispatches to the local bus.
+    """
+
+    channel = 'retro-cassette:generation-events'
+
+    def __init__(self, dispatch):
+        import redis
+
+        self.dispatch = dispatch
+        self.client = redis.Redis.from_url(settings.GENERATION_EVENT_REDIS_URL)
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._listen, name='GenerationEvents', daemon=True)
+        self._thread.start()
+
+    def publish(self, event):
+        try:
+            self.client.publish(self.channel, json.dumps(event))
+        except Exception as e:
+            logger.error(f"[EVENTS] Publish failed, delivering locally only: {e}")
+            self.dispatch(event)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.error(f"[EVENTS] Listener error, reconnecting: {e}")
+                time.sleep(1)
+
+
+class EventBus:
+    """Per-user event routing within one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._history = OrderedDict()  # user_id -> deque of events
+        self._fanout = None
+        self._sequence = itertools.count()
+
+    @property
+    def fanout(self):
+        if self._fanout is None:
+            with self._lock:
+                if self._fanout is None:
+                    self._fanout = import_string(settings.GENERATION_EVENT_FANOUT)(self.dispatch)
+        return self._fanout
+
+    def start(self):
+        """Start receiving events from other processes (no-op for LocalFanout)."""
+        self.fanout.start()
+
+    def _next_id(self):
+        # Time-based so ids from different processes still sort
+        return time.time_ns() // 1000 * 1000 + next(self._sequence) % 1000
+
+    def publish(self, user_id, event_type, **data):
+        """Send an event to all streams of `user_id`, in every process."""
+        event = {'id': self._next_id(), 'type': event_type, 'user_id': user_id, **data}
+        try:
+            self.fanout.publish(event)
+        except Exception as e:
+            # Events are best effort; never fail a job over them
+            logger.error(f"[EVENTS] Failed to publish {event_type} for user {user_id}: {e}")
+
+    def dispatch(self, event):
+        """Record an event and wake this process's streams of its user."""
+        user_id = event['user_id']
+        with self._lock:
+            history = self._history.pop(user_id, None) or deque(maxlen=HISTORY_SIZE)
+            history.append(event)
+            self._history[user_id] = history
+            if len(self._history) > HISTORY_USERS:
+                self._history.popitem(last=False)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscribe(self, user_id, last_event_id=None, loop=None):
+        """
+        Open a stream for `user_id`, delivered on `loop` if given.
+
+        With `last_event_id`, `backlog` holds the remembered events after it.
+        """
+        subscription = Subscription(user_id, loop)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            if last_event_id is not None:
+                subscription.backlog = [
+                    event for event in self._history.get(user_id, ()) if event['id'] > last_event_id
+                ]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+
+bus = EventBus()
+
+
+def publish(user_id, event_type, **data):
+    """Publish a job event for `user_id` (see EventBus.publish)."""
+    bus.publish(user_id, event_type, **data)
+
+
+def start_event_bus():
+    """Start cross-process delivery; called from the WSGI/ASGI entry points."""
+    bus.start()
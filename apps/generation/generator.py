@@ -10,8 +10,24 @@ parent_dir = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.insert(0, str(parent_dir))
 
 from django.conf import settings
+from config import metrics
+import threading
+import time
 import torch
 
+# Completion tokens of each thread's last lyrics generation
+_lyrics_usage = threading.local()
+
+
+def last_lyrics_tokens():
+    """Completion tokens of this thread's last LyricsGenerator.generate, or 0 when not reported."""
+    return getattr(_lyrics_usage, 'tokens', 0)
+
+
+def _record_tokens(response):
+    usage = getattr(response, 'usage', None)
+    _lyrics_usage.tokens = getattr(usage, 'completion_tokens', None) or 0
+
 
 class LyricsGenerator:
     """Generate song lyrics using LLM."""
@@ -105,14 +121,19 @@ class LyricsGenerator:
         Returns:
             Generated lyrics as string
         """
-        if self.provider == 'openai':
-            return self._generate_openai(prompt, max_length, temperature)
-        elif self.provider == 'comet':
-            return self._generate_comet(prompt, max_length, temperature)
-        elif self.provider == 'custom':
-            return self._generate_custom(prompt, max_length, temperature)
-        else:
-            return self._generate_local(prompt, max_length, temperature)
+        _lyrics_usage.tokens = 0
+        started = time.perf_counter()
+        try:
+            if self.provider == 'openai':
+                return self._generate_openai(prompt, max_length, temperature)
+            elif self.provider == 'comet':
+                return self._generate_comet(prompt, max_length, temperature)
+            elif self.provider == 'custom':
+                return self._generate_custom(prompt, max_length, temperature)
+            else:
+                return self._generate_local(prompt, max_length, temperature)
+        finally:
+            metrics.LYRICS_SECONDS.observe(time.perf_counter() - started, self.provider)
     
     def _generate_openai(self, prompt, max_length, temperature):
         """Generate lyrics using OpenAI API."""
@@ -148,6 +169,7 @@ The style should be a comma-separated list of descriptors like:
                 temperature=temperature,
                 response_format={"type": "json_object"}
             )
+            _record_tokens(response)
             
             content = response.choices[0].message.content
             
@@ -228,6 +250,7 @@ The style should be a comma-separated list of descriptors like:
                 max_tokens=max_length,
                 temperature=temperature
             )
+            _record_tokens(response)
             
             # Extract lyrics from response
             if hasattr(response, 'choices') and len(response.choices) > 0:
@@ -318,6 +341,7 @@ The style should be a comma-separated list of descriptors like:
                 max_tokens=max_length,
                 temperature=temperature
             )
+            _record_tokens(response)
             
             content = response.choices[0].message.content
             
@@ -403,6 +427,7 @@ The style should be descriptors like: "party, hip-hop, fun, energetic, group voc
                     eos_token_id=None,  # Disable EOS token to prevent early stopping
                     no_repeat_ngram_size=3  # Prevent 3-gram repetition
                 )
+            _lyrics_usage.tokens = int(outputs.shape[1] - inputs['input_ids'].shape[1])
             
             if settings.DEBUG:
                 print(f"[LLM] Input length: {inputs['input_ids'].shape[1]} tokens")
@@ -545,7 +570,8 @@ class MusicGenerator:
                 traceback.print_exc()
             raise Exception(f"ACE-Step model failed to load: {e}")
     
-    def generate(self, lyrics, genre, mood, duration, temperature=1.0, description=''):
+    def generate(self, lyrics, genre, mood, duration, temperature=1.0, description='', scratch_dir=None,
+                 tape_seed=None):
         """
         Generate music from lyrics.
         
@@ -556,9 +582,14 @@ class MusicGenerator:
             duration: Duration in seconds
             temperature: Sampling temperature
             description: Additional style/description for generation
+            scratch_dir: Directory for temporary files (default: system temp dir)
+            tape_seed: Apply the cassette tape effects (see tape.py) with
+                this seed; None leaves the audio clean
         
         Returns:
-            Path to generated audio file
+            dict with 'file' (path to generated audio file), 'duration'
+            (seconds), 'analysis' (see analysis.analyze_audio, or None) and
+            'diffusion_seconds' (wall time of the model)
         """
         try:
             from acestep.inference import generate_music, GenerationParams, GenerationConfig
@@ -607,6 +638,7 @@ class MusicGenerator:
             )
             
             # Generate music
+            diffusion_started = time.perf_counter()
             result = generate_music(
                 dit_handler=self.dit_handler,
                 llm_handler=self.llm_handler,
@@ -615,6 +647,8 @@ class MusicGenerator:
                 save_dir=None,
                 progress=None
             )
+            diffusion_seconds = time.perf_counter() - diffusion_started
+            metrics.DIFFUSION_SECONDS.observe(diffusion_seconds)
             
             if not result.success:
                 raise Exception(f"Generation failed: {result.error or result.status_message}")
@@ -631,7 +665,7 @@ class MusicGenerator:
                 raise Exception("No audio tensor in result")
             
             # Save audio to temp file as MP3
-            output_file = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False)
+            output_file = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False, dir=scratch_dir)
             output_file.close()  # Close to allow other processes to write
             
             # Write audio file
@@ -652,14 +686,34 @@ class MusicGenerator:
                 # Mono audio, reshape to (samples, 1)
                 audio_np = audio_np.reshape(-1, 1)
             
+            if tape_seed is not None:
+                from .tape import apply_tape
+                audio_np = apply_tape(
+                    audio_np, sample_rate, tape_seed,
+                    saturation=settings.TAPE_SATURATION,
+                    wow_flutter=settings.TAPE_WOW_FLUTTER,
+                    hiss_db=settings.TAPE_HISS_DB,
+                    rolloff_hz=settings.TAPE_ROLLOFF_HZ,
+                )
+            
             # First save as WAV (temporary)
-            temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+            temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False, dir=scratch_dir)
             temp_wav.close()
             sf.write(temp_wav.name, audio_np, samplerate=sample_rate)
             
             # Calculate actual audio duration
             actual_duration = audio_np.shape[0] / sample_rate
             
+            # Analyze the in-memory buffer (waveform peaks, loudness, tempo)
+            # instead of decoding the MP3 again later
+            analysis = None
+            try:
+                from .analysis import analyze_audio
+                analysis = analyze_audio(audio_np, sample_rate)
+            except Exception as e:
+                if settings.DEBUG:
+                    print(f"[ACESTEP] Warning: audio analysis failed: {e}")
+            
             # Convert WAV to MP3
             try:
                 from pydub import AudioSegment
@@ -681,8 +735,13 @@ class MusicGenerator:
                 print(f"[ACESTEP] Actual duration: {actual_duration:.2f}s")
                 print(f"[ACESTEP] Status: {result.status_message}")
             
-            # Return both file path and actual duration
-            return {'file': output_file.name, 'duration': int(actual_duration)}
+            # Return file path, actual duration, analysis results and diffusion wall time
+            return {
+                'file': output_file.name,
+                'duration': int(actual_duration),
+                'analysis': analysis,
+                'diffusion_seconds': diffusion_seconds,
+            }
             
         except Exception as e:
             import traceback
@@ -0,0 +1,67 @@
+"""
+Benchmark for the cassette tape effects stage.
+
+Synthesizes a stereo track (tones over noise, default 3 minutes at
+48 kHz), runs apply_tape() on it with the configured TAPE_* settings and
+reports the best and mean wall time and the speed relative to real time.
+Also checks that a seed reproduces its output exactly. Fails when the
+best run exceeds --budget seconds.
+
+    python manage.py benchmark_tape --seconds 180 --rounds 5
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Time the tape effects stage on a synthetic stereo track.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=180, help='Track length')
+        parser.add_argument('--sample-rate', type=int, default=48000)
+        parser.add_argument('--rounds', type=int, default=5, help='Timed runs')
+        parser.add_argument('--budget', type=float, default=1.0, help='Maximum seconds for the best run')
+
+    def handle(self, *args, **options):
+        from apps.generation.tape import apply_tape
+
+        rate = options['sample_rate']
+        frames = int(options['seconds'] * rate)
+        rng = np.random.default_rng(0)
+        t = np.arange(frames) / rate
+        audio = np.stack([
+            0.4 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 3520 * t),
+            0.4 * np.sin(2 * np.pi * 330 * t) + 0.2 * np.sin(2 * np.pi * 2640 * t),
+        ], axis=1).astype(np.float32)
+        audio += 0.05 * rng.standard_normal(audio.shape, dtype=np.float32)
+
+        tape_options = {
+            'saturation': settings.TAPE_SATURATION,
+            'wow_flutter': settings.TAPE_WOW_FLUTTER,
+            'hiss_db': settings.TAPE_HISS_DB,
+            'rolloff_hz': settings.TAPE_ROLLOFF_HZ,
+        }
+        apply_tape(audio[:rate], rate, 1, **tape_options)  # Warm-up
+
+        timings = []
+        for _ in range(options['rounds']):
+            start = time.perf_counter()
+            out = apply_tape(audio, rate, 1, **tape_options)
+            timings.append(time.perf_counter() - start)
+
+        if out.shape != audio.shape or out.dtype != np.float32:
+            raise CommandError(f'Output is {out.dtype} {out.shape}, expected float32 {audio.shape}.')
+        if not np.array_equal(out, apply_tape(audio, rate, 1, **tape_options)):
+            raise CommandError('The same seed gave different output.')
+
+        best = min(timings)
+        self.stdout.write(
+            f"{options['seconds']:.0f}s stereo at {rate} Hz: best {best * 1000:.0f} ms, "
+            f"mean {sum(timings) / len(timings) * 1000:.0f} ms "
+            f"({options['seconds'] / best:.0f}x real time)"
+        )
+        if best > options['budget']:
+            raise CommandError(f"Best run took {best:.2f}s, over the {options['budget']:.2f}s budget.")
@@ -0,0 +1,30 @@
+"""
+Remove orphaned scratch files and unreferenced generated media.
+
+Runs hourly inside the server process (PERIODIC_TASKS); use this command
+for cron or a one-off cleanup:
+
+    python manage.py sweep_media --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from apps.generation.cleanup import sweep
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned scratch files and media no song references, and report reclaimed bytes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=None,
+                            help='Only remove files older than this many seconds (default: GENERATION_SWEEP_MAX_AGE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be removed without deleting anything')
+
+    def handle(self, *args, **options):
+        report = sweep(max_age=options['max_age'], dry_run=options['dry_run'])
+        verb = 'Would remove' if report['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['scratch_dirs']} scratch dirs, {report['media_files']} media files "
+            f"and {report['mixtape_files']} mixtape files, "
+            f"{report['bytes_reclaimed']:,} bytes reclaimed"
+        ))
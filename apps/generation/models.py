@@ -0,0 +1,86 @@
+"""
+Generation compute accounting models, and the schedule of periodic tasks
+shared by all server processes.
+"""
+from django.conf import settings
+from django.db import models
+
+# Per-job and per-day usage measures, summed into DailyUsage
+USAGE_FIELDS = ('lyrics_tokens', 'lyrics_seconds', 'diffusion_seconds', 'encode_seconds',
+                'total_seconds', 'audio_seconds')
+
+
+class GenerationUsage(models.Model):
+    """Wall time of one generation job by stage, written in bulk by the usage ledger."""
+    
+    # No foreign key constraints: accounting outlives deleted songs and users
+    song = models.ForeignKey('songs.Song', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name='+')
+    succeeded = models.BooleanField()
+    
+    lyrics_tokens = models.IntegerField(default=0)  # Completion tokens, when the provider reports them
+    lyrics_seconds = models.FloatField(default=0)
+    diffusion_seconds = models.FloatField(default=0)
+    encode_seconds = models.FloatField(default=0)  # Everything after diffusion: analysis, MP3, storage
+    total_seconds = models.FloatField(default=0)
+    audio_seconds = models.FloatField(default=0)  # Length of the generated audio
+    
+    finished_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'finished_at']),
+            models.Index(fields=['finished_at']),
+        ]
+    
+    def __str__(self):
+        return f"Job for song {self.song_id}: {self.total_seconds:.1f}s"
+
+
+class DailyUsage(models.Model):
+    """
+    One user's generation usage on one day (UTC), summed from GenerationUsage.
+    
+    Rows are incremented in bulk by UsageLedger.flush; quotas are checked
+    against total_seconds.
+    """
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_usage')
+    day = models.DateField()
+    
+    jobs = models.IntegerField(default=0)
+    failed_jobs = models.IntegerField(default=0)
+    lyrics_tokens = models.IntegerField(default=0)
+    lyrics_seconds = models.FloatField(default=0)
+    diffusion_seconds = models.FloatField(default=0)
+    encode_seconds = models.FloatField(default=0)
+    total_seconds = models.FloatField(default=0)
+    audio_seconds = models.FloatField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_usage_user_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.total_seconds:.0f}s"
+
+
+class PeriodicTaskRun(models.Model):
+    """
+    When a periodic task is next due, shared by every server process.
+    
+    The process that moves `next_run` forward with a conditional UPDATE
+    runs the task (see TaskManager.schedule_periodic); the others skip it.
+    """
+    
+    task_id = models.CharField(max_length=100, primary_key=True)
+    next_run = models.FloatField()  # Unix time
+    
+    def __str__(self):
+        return f"{self.task_id} due at {self.next_run:.0f}"
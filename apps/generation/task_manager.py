@@ -4,6 +4,7 @@ No external dependencies (Redis/Celery) required.
 """
 import logging
 import threading
+import time
 import queue
 from typing import Callable, Any, Dict
 from datetime import datetime
@@ -36,7 +37,10 @@ class TaskManager:
         self.active_tasks: Dict[str, threading.Thread] = {}
         self.max_workers = getattr(settings, 'MAX_CONCURRENT_TASKS', 3)
         self.workers = []
+        self.busy_workers = set()  # Names of workers running a task
+        self.periodic_threads = []
         self.running = False
+        self._stop_event = threading.Event()
         self._initialized = True
         
         # Start worker threads
@@ -49,6 +53,7 @@ class TaskManager:
             return
         
         self.running = True
+        self._stop_event.clear()
         logger.info(f"Starting task manager with {self.max_workers} workers")
         
         for i in range(self.max_workers):
@@ -66,6 +71,7 @@ class TaskManager:
         """Stop all worker threads."""
         logger.info("Stopping task manager...")
         self.running = False
+        self._stop_event.set()
         
         # Add sentinel values to wake up workers
         for _ in range(self.max_workers):
@@ -94,6 +100,7 @@ class TaskManager:
                 task_id, func, args, kwargs = task
                 
                 logger.info(f"{worker_name} processing task: {task_id}")
+                self.busy_workers.add(worker_name)
                 
                 try:
                     # Execute the task
@@ -104,6 +111,7 @@ class TaskManager:
                     logger.exception(e)
                 finally:
                     # Mark task as done
+                    self.busy_workers.discard(worker_name)
                     self.task_queue.task_done()
                     if task_id in self.active_tasks:
                         del self.active_tasks[task_id]
@@ -155,6 +163,54 @@ class TaskManager:
             logger.error(f"Failed to submit task {task_id}: {str(e)}")
             return False
     
+    def schedule_periodic(
+        self,
+        task_id: str,
+        interval: float,
+        func: Callable,
+        *args,
+        inline: bool = False,
+        every_process: bool = False,
+        **kwargs
+    ):
+        """
+        Submit a task every `interval` seconds.
+        
+        A run is skipped while the previous one is still active, so slow
+        runs never pile up in the queue. Unless `every_process` is set,
+        each run happens in one server process only: whichever claims it
+        first (see claim_periodic_run).
+        
+        Args:
+            task_id: Unique identifier for the task
+            interval: Seconds between submissions
+            func: The function to execute
+            *args: Positional arguments for the function
+            inline: Run in the scheduler thread instead of the worker
+                queue, for maintenance tasks that must neither wait
+                behind generation jobs nor take a worker from them
+            every_process: Run in every process, for tasks that work on
+                this process's own state (flushing in-memory buffers)
+            **kwargs: Keyword arguments for the function
+        """
+        def loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    if not every_process and not claim_periodic_run(task_id, interval):
+                        continue
+                    if not inline:
+                        self.submit_task(task_id, func, *args, **kwargs)
+                        continue
+                    func(*args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Periodic task {task_id} failed: {str(e)}")
+                    logger.exception(e)
+        
+        thread = threading.Thread(target=loop, name=f"Periodic-{task_id}", daemon=True)
+        thread.start()
+        self.periodic_threads.append(thread)
+        logger.info(f"Scheduled periodic task {task_id} every {interval}s")
+    
     def get_queue_size(self) -> int:
         """Get number of tasks waiting in queue."""
         return self.task_queue.qsize()
@@ -163,6 +219,10 @@ class TaskManager:
         """Get number of active tasks."""
         return len(self.active_tasks)
     
+    def get_busy_count(self) -> int:
+        """Get number of workers running a task."""
+        return len(self.busy_workers)
+    
     def is_task_active(self, task_id: str) -> bool:
         """Check if a task is currently running."""
         return task_id in self.active_tasks
@@ -195,3 +255,52 @@ def submit_background_task(task_id: str, func: Callable, *args, **kwargs) -> boo
     """
     manager = get_task_manager()
     return manager.submit_task(task_id, func, *args, **kwargs)
+
+
+_periodic_started = False
+
+
+def claim_periodic_run(task_id: str, interval: float) -> bool:
+    """
+    Claim the current run of a periodic task for this process.
+    
+    One conditional UPDATE moves the task's PeriodicTaskRun forward by
+    `interval` if it is due, so of the processes ticking in an interval
+    exactly one gets True.
+    """
+    from .models import PeriodicTaskRun
+    
+    now = time.time()
+    runs = PeriodicTaskRun.objects.filter(task_id=task_id)
+    if runs.filter(next_run__lte=now).update(next_run=now + interval):
+        return True
+    if runs.exists():
+        return False
+    # First run of the task: create its row due now and claim again
+    PeriodicTaskRun.objects.bulk_create([PeriodicTaskRun(task_id=task_id, next_run=now)], ignore_conflicts=True)
+    return bool(runs.filter(next_run__lte=now).update(next_run=now + interval))
+
+
+def start_periodic_tasks():
+    """
+    Schedule the tasks from settings.PERIODIC_TASKS on this process.
+    
+    Called once from the WSGI/ASGI entry points, so management commands
+    never start background jobs. Entries with an interval of 0 are disabled;
+    'inline': True runs the task in its scheduler thread, and
+    'every_process': True runs it in every process rather than in one.
+    """
+    global _periodic_started
+    if _periodic_started:
+        return
+    _periodic_started = True
+    
+    from django.utils.module_loading import import_string
+    
+    manager = get_task_manager()
+    for task_id, entry in getattr(settings, 'PERIODIC_TASKS', {}).items():
+        if entry.get('interval'):
+            manager.schedule_periodic(
+                task_id, entry['interval'], import_string(entry['task']),
+                inline=entry.get('inline', False), every_process=entry.get('every_process', False)
+            )
@@ -5,12 +5,49 @@ Uses simple threading instead of Celery - no Redis required!
 from django.conf import settings
 import logging
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from .task_manager import submit_background_task
+from .cleanup import create_scratch_dir, remove_scratch_dir
+from .events import STAGES, publish
+from config import metrics
+from .usage import JobMeter, usage_ledger
 
 logger = logging.getLogger(__name__)
 
+# Songs waiting for a worker, in submission order: song_id -> user_id
+_waiting = OrderedDict()
+# Submission time of every song not yet finished, for end-to-end latency
+_submitted = {}
+_waiting_lock = threading.Lock()
+
+
+def _enqueued(song_id, user_id):
+    """Track a submitted song and tell its owner where it is in the queue."""
+    with _waiting_lock:
+        _waiting[song_id] = user_id
+        _submitted[song_id] = time.monotonic()
+        position = len(_waiting)
+    publish(user_id, 'queued', song_id=song_id, position=position)
+
+
+def _dequeued(song_id):
+    """A worker picked up `song_id`; everyone behind it moves up one place."""
+    with _waiting_lock:
+        _waiting.pop(song_id, None)
+        behind = list(_waiting.items())
+    for position, (waiting_id, user_id) in enumerate(behind, start=1):
+        publish(user_id, 'queued', song_id=waiting_id, position=position)
+
+
+def _stage(song, stage, meter):
+    meter.stage(stage)
+    publish(song.user_id, 'stage', song_id=song.id, stage=stage, progress=STAGES[stage])
+
 
 def _generate_song_worker(song_id):
     """
@@ -21,15 +58,24 @@ def _generate_song_worker(song_id):
         song_id: ID of the Song object
     """
     from apps.songs.models import Song
-    from .generator import get_lyrics_generator, get_music_generator
+    from .generator import get_lyrics_generator, get_music_generator, last_lyrics_tokens
+    
+    _dequeued(song_id)
+    meter = None
+    succeeded = False
+    scratch_dir = None
     
     try:
+        # All temporary files go here; removed when the job exits, even on error
+        scratch_dir = create_scratch_dir(f"song_{song_id}")
         song = Song.objects.get(id=song_id)
+        meter = JobMeter(song_id, song.user_id)
         logger.info(f"[TASK] Starting generation for song {song_id}: {song.title}")
         
         # Update status
         song.status = 'generating'
-        song.save(update_fields=['status'])
+        song.save_status()
+        _stage(song, 'started', meter)
         
         # Get API key if user has their own
         api_key = None
@@ -38,6 +84,7 @@ def _generate_song_worker(song_id):
         
         # Generate lyrics if needed (user might have provided their own)
         if not song.lyrics or song.lyrics.strip() == "":
+            _stage(song, 'lyrics', meter)
             logger.info(f"[TASK] Generating lyrics for song {song_id}...")
             lyrics_gen = get_lyrics_generator(api_key=api_key)
             mood_part = f" with a {song.mood} mood" if song.mood else ""
@@ -45,9 +92,11 @@ def _generate_song_worker(song_id):
             if song.description:
                 prompt += f"\n\nStyle: {song.description}"
             song.lyrics = lyrics_gen.generate(prompt, temperature=song.temperature)
+            meter.lyrics_tokens = last_lyrics_tokens()
             song.save(update_fields=['lyrics'])
         
         # Generate music
+        _stage(song, 'music', meter)
         logger.info(f"[TASK] Generating music for song {song_id}...")
         music_gen = get_music_generator()
         
@@ -60,73 +109,81 @@ def _generate_song_worker(song_id):
             mood=song.mood or '',
             duration=duration_param,
             temperature=song.temperature,
-            description=song.description or ''
+            description=song.description or '',
+            scratch_dir=scratch_dir,
+            # Seeded by the song, so a re-run sounds the same
+            tape_seed=song.id if settings.GENERATION_TAPE_EFFECTS else None
         )
         
         # Handle both dict and string responses (backwards compatibility)
         if isinstance(generation_result, dict):
             audio_data = generation_result.get('file')
             actual_duration = generation_result.get('duration')
+            analysis = generation_result.get('analysis')
+            meter.diffusion_seconds = generation_result.get('diffusion_seconds')
         else:
             audio_data = generation_result
             actual_duration = None
+            analysis = None
         
-        # Generate proper filename: "Creator - ## - Title.mp3"
-        # Count user's existing songs for sequential number
-        from apps.songs.models import Song
-        user_song_count = Song.objects.filter(user=song.user).count()
-        song_number = str(user_song_count).zfill(2)  # Zero-padded (01, 02, etc.)
-        
-        # Sanitize title for filename
-        import re
-        safe_title = re.sub(r'[<>:"/\\|?*]', '', song.title)  # Remove invalid chars
-        safe_title = safe_title.strip()[:100]  # Limit length
-        
-        # Get username
-        username = song.user.username
-        
-        # Create filename
-        filename = f"{username} - {song_number} - {safe_title}.mp3"
-        filepath = os.path.join(settings.MEDIA_ROOT, 'songs', filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        # Write audio
+        # Write audio to a temporary file first
+        _stage(song, 'encoding', meter)
         import soundfile as sf
         import numpy as np
         if isinstance(audio_data, np.ndarray):
-            # Save as temporary WAV first
             import tempfile
-            temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+            temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False, dir=scratch_dir)
             temp_wav.close()
             sf.write(temp_wav.name, audio_data, samplerate=48000)
             
             # Convert to MP3
             try:
                 from pydub import AudioSegment
+                temp_mp3 = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False, dir=scratch_dir)
+                temp_mp3.close()
                 audio = AudioSegment.from_wav(temp_wav.name)
-                audio.export(filepath, format='mp3', bitrate='192k')
+                audio.export(temp_mp3.name, format='mp3', bitrate='192k')
                 os.unlink(temp_wav.name)  # Clean up temp WAV
+                audio_path = temp_mp3.name
             except ImportError:
                 # Fallback: use WAV if pydub not available
-                import shutil
-                shutil.move(temp_wav.name, filepath)
+                audio_path = temp_wav.name
         else:
             # If audio_data is already a path (from generator.py)
-            import shutil
-            shutil.move(audio_data, filepath)
+            audio_path = audio_data
+        
+        # Move into content-addressed storage (songs/ab/cd/<sha256>.mp3).
+        # Identical audio is stored once; the "Creator - Title.mp3" name is
+        # only produced at download time.
+        from apps.songs.storage import store_audio
+        _stage(song, 'storing', meter)
+        audio_name, audio_hash = store_audio(audio_path)
         
         # Update song
-        song.audio_file = f'songs/{filename}'
+        song.audio_file = audio_name
+        song.audio_hash = audio_hash
         song.status = 'completed'
+        update_fields = ['audio_file', 'audio_hash']
+        
+        # Store waveform peaks next to the audio (keyed by the same hash)
+        if analysis:
+            from apps.songs.storage import store_waveform
+            store_waveform(audio_hash, analysis['peaks'])
+            song.loudness_lufs = analysis['loudness_lufs']
+            song.true_peak_dbtp = analysis['true_peak_dbtp']
+            song.tempo_bpm = analysis['tempo_bpm']
+            update_fields += ['loudness_lufs', 'true_peak_dbtp', 'tempo_bpm']
         
         # Store actual duration if it was generated automatically
         if actual_duration and not song.duration:
             song.duration = actual_duration
-            song.save(update_fields=['audio_file', 'status', 'duration'])
-        else:
-            song.save(update_fields=['audio_file', 'status'])
+            update_fields.append('duration')
+        song.save_status(update_fields)
         
+        meter.audio_seconds = actual_duration or song.duration or 0
+        succeeded = True
         logger.info(f"[TASK] Song {song_id} generated successfully")
+        publish(song.user_id, 'completed', song_id=song_id, progress=1.0)
         
         return {'status': 'success', 'song_id': song_id}
         
@@ -138,34 +195,129 @@ def _generate_song_worker(song_id):
             song = Song.objects.get(id=song_id)
             song.status = 'failed'
             song.error_message = str(e)
-            song.save(update_fields=['status', 'error_message'])
+            song.save_status(['error_message'])
+            publish(song.user_id, 'failed', song_id=song_id, error=song.error_message)
         except Exception as save_error:
             logger.error(f"[TASK] Failed to update song status: {save_error}")
         
         raise
+    finally:
+        remove_scratch_dir(scratch_dir)
+        submitted = _submitted.pop(song_id, None)
+        metrics.SONGS.inc('completed' if succeeded else 'failed')
+        if meter is not None:
+            usage = meter.finish(succeeded)
+            # Buffered in memory; written in bulk by flush_usage
+            usage_ledger.record(usage)
+            if succeeded:
+                metrics.ENCODE_SECONDS.observe(usage['encode_seconds'])
+                if submitted is not None:
+                    metrics.SONG_SECONDS.observe(time.monotonic() - submitted)
 
 
-def generate_song_task(song_id):
+def generate_song_task(song_id, user_id=None):
     """
     Submit a song generation task to run in the background.
     
     Args:
         song_id: ID of the Song object
+        user_id: Owner of the song, who receives its job events
         
     Returns:
         bool: True if task was submitted successfully
     """
+    if user_id is None:
+        from apps.songs.models import Song
+        user_id = Song.objects.filter(pk=song_id).values_list('user_id', flat=True).first()
+    
     task_id = f"song_{song_id}"
+    # Tracked before submitting, so a fast worker cannot dequeue it first
+    _enqueued(song_id, user_id)
     success = submit_background_task(task_id, _generate_song_worker, song_id)
     
     if success:
         logger.info(f"Song generation task {task_id} submitted successfully")
     else:
+        _dequeued(song_id)
+        _submitted.pop(song_id, None)
         logger.error(f"Failed to submit song generation task {task_id}")
     
     return success
 
 
+# Mixtape renders run on their own small pool, never in the generation
+# worker queue: keys being rendered or waiting for a render thread
+_mixtape_pool = None
+_mixtape_keys = set()
+_mixtape_users = {}  # user_id -> renders queued or running
+_mixtape_lock = threading.Lock()
+
+
+def _render_mixtape_worker(key, user_id, title, tracks, crossfade_seconds):
+    """
+    Worker function to render a playlist mixtape.
+    Runs in a mixtape render thread.
+    """
+    from apps.songs.mixtape import render_mixtape
+    
+    scratch_dir = None
+    try:
+        scratch_dir = create_scratch_dir(f"mixtape_{key[:16]}")
+        render_mixtape(key, title, tracks, crossfade_seconds, scratch_dir)
+    except Exception as e:
+        logger.error(f"[TASK] Error rendering mixtape {key[:12]}: {e}", exc_info=True)
+    finally:
+        remove_scratch_dir(scratch_dir)
+        _mixtape_done(key, user_id)
+
+
+def _mixtape_done(key, user_id):
+    with _mixtape_lock:
+        _mixtape_keys.discard(key)
+        _mixtape_users[user_id] -= 1
+        if not _mixtape_users[user_id]:
+            del _mixtape_users[user_id]
+
+
+def mixtape_queued(key):
+    """Whether a render of `key` is queued or running in this process."""
+    return key in _mixtape_keys
+
+
+def render_mixtape_task(key, user_id, title, tracks, crossfade_seconds):
+    """
+    Submit a mixtape render to run in the background.
+    
+    Renders get MIXTAPE_RENDER_WORKERS threads of their own, so they
+    never hold a generation worker or delay queued songs. A key already
+    queued or rendering is not submitted twice, and a user has at most
+    MIXTAPE_RENDERS_PER_USER renders queued or running (per process).
+    
+    Returns:
+        bool: True if a render is queued or running, False if the user is
+        at the limit or the pool has shut down
+    """
+    global _mixtape_pool
+    with _mixtape_lock:
+        if key in _mixtape_keys:
+            return True
+        if _mixtape_users.get(user_id, 0) >= settings.MIXTAPE_RENDERS_PER_USER:
+            return False
+        if _mixtape_pool is None:
+            _mixtape_pool = ThreadPoolExecutor(
+                max_workers=settings.MIXTAPE_RENDER_WORKERS, thread_name_prefix='MixtapeRender'
+            )
+        _mixtape_keys.add(key)
+        _mixtape_users[user_id] = _mixtape_users.get(user_id, 0) + 1
+    try:
+        _mixtape_pool.submit(_render_mixtape_worker, key, user_id, title, tracks, crossfade_seconds)
+    except RuntimeError as e:  # Interpreter shutting down
+        _mixtape_done(key, user_id)
+        logger.error(f"Failed to submit mixtape render {key[:12]}: {e}")
+        return False
+    return True
+
+
 def _generate_lyrics_worker(prompt, api_key=None, temperature=0.8):
     """
     Worker function to generate lyrics.
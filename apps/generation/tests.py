@@ -0,0 +1,45 @@
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from .analysis import estimate_tempo, integrated_loudness
+from .models import PeriodicTaskRun
+from .task_manager import claim_periodic_run
+
+
+class LoudnessTests(SimpleTestCase):
+
+    def test_reference_tone(self):
+        # BS.1770: a 0 dBFS 997 Hz sine in one channel reads -3.01 LUFS
+        for sample_rate in (44100, 48000):
+            t = np.arange(sample_rate * 5) / sample_rate
+            audio = np.zeros((t.size, 2), np.float32)
+            audio[:, 0] = np.sin(2 * np.pi * 997 * t)
+            self.assertAlmostEqual(integrated_loudness(audio, sample_rate), -3.01, delta=0.1)
+
+
+class TempoTests(SimpleTestCase):
+
+    sample_rate = 48000
+
+    def test_steady_tone_has_no_tempo(self):
+        t = np.arange(self.sample_rate * 20) / self.sample_rate
+        for frequency in (55, 440, 997):
+            tone = np.sin(2 * np.pi * frequency * t).astype(np.float32)
+            self.assertIsNone(estimate_tempo(tone, self.sample_rate))
+
+    def test_click_track(self):
+        rng = np.random.default_rng(0)
+        audio = 0.3 * np.sin(2 * np.pi * 110 * np.arange(self.sample_rate * 20) / self.sample_rate)
+        period = self.sample_rate // 2  # 120 BPM
+        hit = np.exp(-np.arange(4000) / 600) * rng.standard_normal(4000)
+        for start in range(0, audio.size - hit.size, period):
+            audio[start:start + hit.size] += 0.5 * hit
+        self.assertAlmostEqual(estimate_tempo(audio.astype(np.float32), self.sample_rate), 120, delta=2)
+
+
+class PeriodicClaimTests(TestCase):
+
+    def test_one_claim_per_interval(self):
+        self.assertEqual([claim_periodic_run('sweep', 60) for _ in range(3)], [True, False, False])
+        PeriodicTaskRun.objects.filter(task_id='sweep').update(next_run=0)
+        self.assertEqual([claim_periodic_run('sweep', 60) for _ in range(3)], [True, False, False])
@@ -3,11 +3,14 @@ URL patterns for generation app.
 """
 from django.urls import path
 
-from .views import GenerateLyricsView, TaskStatusView
+from .views import EventTicketView, GenerateLyricsView, TaskStatusView, UsageView, job_events
 
 app_name = 'generation'
 
 urlpatterns = [
     path('lyrics/', GenerateLyricsView.as_view(), name='generate_lyrics'),
     path('task/<str:task_id>/', TaskStatusView.as_view(), name='task_status'),
+    path('events/ticket/', EventTicketView.as_view(), name='event_ticket'),
+    path('events/', job_events, name='job_events'),
+    path('usage/', UsageView.as_view(), name='usage'),
 ]
@@ -0,0 +1,317 @@
+"""
+Per-job compute accounting and daily generation quotas.
+
+A worker times its job with a JobMeter: wall seconds per stage (lyrics,
+diffusion, everything after diffusion as encode), the lyrics tokens when
+the LLM provider reports them, and the length of the audio produced. At
+the end of the job the meter's totals go to the process's UsageLedger,
+which only touches memory. The ledger is flushed every
+GENERATION_USAGE_FLUSH_INTERVAL seconds (PERIODIC_TASKS['flush_usage'])
+and at exit, in one transaction:
+
+- a bulk INSERT of the GenerationUsage rows
+- a bulk INSERT of missing DailyUsage rows, then one UPDATE per batch
+  adding every (user, day) delta with CASE expressions
+
+so accounting adds no queries to the job itself. Jobs of users deleted
+meanwhile are dropped; a batch that fails is retried record by record,
+and records that keep failing are dropped after MAX_FLUSH_ATTEMPTS
+flushes, so one bad record never stalls the ledger (and the quotas).
+
+Quotas (GENERATION_DAILY_QUOTA_SECONDS) are checked when a song is
+submitted: today's recorded seconds, this process's unflushed seconds
+and the predicted cost of the user's unfinished jobs, plus the predicted
+cost of the new one, must fit the quota. The prediction is the recent
+average of total seconds per second of audio.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT and rollups per UPDATE
+BATCH_SIZE = 500
+
+# Flushes a job's usage is tried in before it is dropped
+MAX_FLUSH_ATTEMPTS = 5
+
+# Recent jobs the cost prediction averages over, and how long it is reused
+COST_SAMPLE_JOBS = 200
+COST_REFRESH_SECONDS = 300
+
+
+class JobMeter:
+    """Stage wall times of one job, kept in memory until the job ends."""
+
+    def __init__(self, song_id, user_id):
+        self.song_id = song_id
+        self.user_id = user_id
+        self.seconds = {}  # stage -> wall seconds
+        self.lyrics_tokens = 0
+        self.diffusion_seconds = None  # As measured by the generator, when it reports it
+        self.audio_seconds = 0
+        self._started = self._mark = time.perf_counter()
+        self._stage = None
+
+    def stage(self, name):
+        """Close the running stage and start `name`."""
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.seconds[self._stage] = self.seconds.get(self._stage, 0) + now - self._mark
+        self._stage, self._mark = name, now
+
+    def finish(self, succeeded):
+        """
+        Close the job.
+
+        Returns:
+            dict: GenerationUsage field values
+        """
+        self.stage(None)
+        total = time.perf_counter() - self._started
+        music = self.seconds.get('music', 0)
+        diffusion = min(self.diffusion_seconds, music) if self.diffusion_seconds is not None else music
+        return {
+            'song_id': self.song_id,
+            'user_id': self.user_id,
+            'succeeded': succeeded,
+            'lyrics_tokens': self.lyrics_tokens or 0,
+            'lyrics_seconds': self.seconds.get('lyrics', 0),
+            'diffusion_seconds': diffusion,
+            'encode_seconds': music - diffusion + self.seconds.get('encoding', 0) + self.seconds.get('storing', 0),
+            'total_seconds': total,
+            'audio_seconds': self.audio_seconds if succeeded else 0,
+            'finished_at': timezone.now(),
+        }
+
+
+def _day(moment):
+    return timezone.localdate(moment)
+
+
+class UsageLedger:
+    """Per-process buffer of finished jobs' usage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._records = []  # (usage, failed flush attempts)
+        self._inflight = []
+
+    def record(self, usage):
+        """Buffer a JobMeter.finish() result."""
+        with self._lock:
+            self._records.append((usage, 0))
+
+    def pending_seconds(self, user_id, day):
+        """Seconds of `user_id` on `day` recorded here but not yet committed."""
+        with self._lock:
+            return sum(
+                usage['total_seconds'] for usage, _ in self._records + self._inflight
+                if usage['user_id'] == user_id and _day(usage['finished_at']) == day
+            )
+
+    def flush(self):
+        """
+        Write buffered usage and add it to the daily rollups.
+
+        Records of users deleted meanwhile are dropped. If the batch
+        fails, its records are written one by one, so one bad record
+        cannot hold back the others; those that still fail are put back
+        for the next flush, at most MAX_FLUSH_ATTEMPTS times.
+
+        Returns:
+            int: Jobs written
+        """
+        from django.contrib.auth import get_user_model
+
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+                self._inflight = records
+            if not records:
+                return 0
+
+            retry = []
+            try:
+                users = set(get_user_model().objects.filter(
+                    pk__in={usage['user_id'] for usage, _ in records}
+                ).values_list('pk', flat=True))
+                kept = [entry for entry in records if entry[0]['user_id'] in users]
+                if len(kept) < len(records):
+                    logger.warning(f"[USAGE] Dropped {len(records) - len(kept)} jobs of deleted users")
+                written = self._write_isolated(kept, retry)
+            except DatabaseError as e:
+                logger.error(f"[USAGE] Flush of {len(records)} jobs failed, will retry: {e}")
+                retry, written = records, 0
+
+            requeue = [(usage, attempts + 1) for usage, attempts in retry if attempts + 1 < MAX_FLUSH_ATTEMPTS]
+            if len(requeue) < len(retry):
+                logger.error(f"[USAGE] Gave up on {len(retry) - len(requeue)} jobs "
+                             f"after {MAX_FLUSH_ATTEMPTS} failed flushes")
+            with self._lock:
+                self._records[:0] = requeue
+                self._inflight = []
+
+        logger.debug(f"[USAGE] Flushed {written} jobs")
+        return written
+
+    def _write_isolated(self, records, retry):
+        """Write `records` in one batch, or one by one if the batch fails; failures go to `retry`."""
+        if not records:
+            return 0
+        try:
+            self._write([usage for usage, _ in records])
+            return len(records)
+        except DatabaseError as e:
+            if len(records) == 1:
+                logger.error(f"[USAGE] Job of song {records[0][0]['song_id']} could not be written: {e}")
+                retry.extend(records)
+                return 0
+            logger.warning(f"[USAGE] Flush of {len(records)} jobs failed, writing them one by one: {e}")
+        return sum(self._write_isolated([entry], retry) for entry in records)
+
+    def _write(self, records):
+        """Insert the GenerationUsage rows of `records` and add them to DailyUsage, in one transaction."""
+        from .models import USAGE_FIELDS, DailyUsage, GenerationUsage
+
+        rollups = {}
+        for usage in records:
+            totals = rollups.setdefault((usage['user_id'], _day(usage['finished_at'])), {
+                'jobs': 0, 'failed_jobs': 0, **{field: 0 for field in USAGE_FIELDS}
+            })
+            totals['jobs'] += 1
+            totals['failed_jobs'] += not usage['succeeded']
+            for field in USAGE_FIELDS:
+                totals[field] += usage[field]
+
+        with transaction.atomic():
+            GenerationUsage.objects.bulk_create(
+                [GenerationUsage(**usage) for usage in records], batch_size=BATCH_SIZE
+            )
+            DailyUsage.objects.bulk_create(
+                [DailyUsage(user_id=user_id, day=day) for user_id, day in rollups],
+                batch_size=BATCH_SIZE, ignore_conflicts=True
+            )
+            keys = list(rollups)
+            for start in range(0, len(keys), BATCH_SIZE):
+                self._add(keys[start:start + BATCH_SIZE], rollups)
+
+    @staticmethod
+    def _add(keys, rollups):
+        """One UPDATE adding the rollups of `keys` to their DailyUsage rows."""
+        from .models import USAGE_FIELDS, DailyUsage
+
+        rows = DailyUsage.objects.filter(
+            user_id__in={user_id for user_id, _ in keys}, day__in={day for _, day in keys}
+        ).values_list('pk', 'user_id', 'day')
+        pks = {(user_id, day): pk for pk, user_id, day in rows if (user_id, day) in rollups}
+        counts = ('jobs', 'failed_jobs', 'lyrics_tokens')
+        DailyUsage.objects.filter(pk__in=[pks[key] for key in keys]).update(**{
+            field: F(field) + Case(
+                *[When(pk=pks[key], then=Value(rollups[key][field])) for key in keys],
+                default=Value(0), output_field=IntegerField() if field in counts else FloatField()
+            )
+            for field in ('jobs', 'failed_jobs') + USAGE_FIELDS
+        })
+
+
+usage_ledger = UsageLedger()
+
+
+def flush_usage():
+    """Periodic task entry point (PERIODIC_TASKS['flush_usage'])."""
+    return usage_ledger.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        usage_ledger.flush()
+    except Exception:
+        pass  # The process is going away
+
+
+_cost = {'per_audio_second': None, 'typical_audio_seconds': None, 'at': 0.0}
+_cost_lock = threading.Lock()
+
+
+def cost_model():
+    """
+    Recent cost of generation: (seconds per second of audio, typical audio length).
+
+    Averaged over the last COST_SAMPLE_JOBS successful jobs and cached
+    for COST_REFRESH_SECONDS; the GENERATION_COST_* settings until there
+    are jobs to learn from.
+    """
+    from .models import GenerationUsage
+
+    with _cost_lock:
+        if _cost['at'] and time.monotonic() - _cost['at'] < COST_REFRESH_SECONDS:
+            return _cost['per_audio_second'], _cost['typical_audio_seconds']
+
+    recent = GenerationUsage.objects.filter(succeeded=True, audio_seconds__gt=0).order_by('-finished_at')
+    totals = GenerationUsage.objects.filter(pk__in=recent.values('pk')[:COST_SAMPLE_JOBS]).aggregate(
+        jobs=Count('pk'), total=Sum('total_seconds'), audio=Sum('audio_seconds')
+    )
+    if totals['jobs']:
+        per_audio_second = totals['total'] / totals['audio']
+        typical = totals['audio'] / totals['jobs']
+    else:
+        per_audio_second = settings.GENERATION_COST_PER_AUDIO_SECOND
+        typical = settings.GENERATION_TYPICAL_AUDIO_SECONDS
+
+    with _cost_lock:
+        _cost.update(per_audio_second=per_audio_second, typical_audio_seconds=typical, at=time.monotonic())
+    return per_audio_second, typical
+
+
+def predicted_cost(duration=None):
+    """Predicted compute seconds of a job for `duration` seconds of audio (None: automatic)."""
+    per_audio_second, typical = cost_model()
+    return per_audio_second * (duration if duration and duration > 0 else typical)
+
+
+def quota_exceeded(user_id, duration=None):
+    """
+    Check a new job of `user_id` against GENERATION_DAILY_QUOTA_SECONDS.
+
+    Returns:
+        None if it fits, else a dict with 'used', 'reserved' (unfinished
+        jobs), 'predicted', 'quota' (seconds) and 'retry_after'
+        (seconds until the quota resets at midnight)
+    """
+    from apps.songs.models import Song
+    from .models import DailyUsage
+
+    quota = settings.GENERATION_DAILY_QUOTA_SECONDS
+    if not quota:
+        return None
+
+    now = timezone.now()
+    today = _day(now)
+    midnight = timezone.make_aware(datetime.combine(today, dt_time.min))
+    used = (DailyUsage.objects.filter(user_id=user_id, day=today).values_list('total_seconds', flat=True).first()
+            or 0) + usage_ledger.pending_seconds(user_id, today)
+    unfinished = Song.objects.filter(user_id=user_id, status='generating', created_at__gte=midnight).values_list(
+        'duration', flat=True
+    )
+    reserved = sum(predicted_cost(duration) for duration in unfinished)
+    predicted = predicted_cost(duration)
+    if used + reserved + predicted <= quota:
+        return None
+    return {
+        'used': round(used),
+        'reserved': round(reserved),
+        'predicted': round(predicted),
+        'quota': quota,
+        'retry_after': int((midnight + timedelta(days=1) - now).total_seconds()) + 1,
+    }
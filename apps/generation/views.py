@@ -1,20 +1,40 @@
 """
 Views for generation endpoints.
 """
+import asyncio
+import json
+import queue
+from datetime import timedelta
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseForbidden, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.throttling import RateLimitMixin
 
+from .events import bus
+from .models import USAGE_FIELDS, DailyUsage
 from .tasks import generate_lyrics_only_task
 from .task_manager import get_task_manager
+from .usage import predicted_cost, usage_ledger
 
+# EventSource cannot send an Authorization header, so streams are opened
+# with a short-lived signed ticket from EventTicketView instead
+EVENT_TICKET_SALT = 'generation.events'
 
-class GenerateLyricsView(APIView):
-    """Generate lyrics preview without creating a song."""
+
+class GenerateLyricsView(RateLimitMixin, APIView):
+    """Generate lyrics preview without creating a song (rate-limited: RATE_LIMITS['lyrics'])."""
     
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'lyrics'
     
     def post(self, request):
         prompt = request.data.get('prompt')
@@ -119,3 +139,112 @@ class TaskStatusView(APIView):
             response_data['message'] = 'Task completed or not found'
         
         return Response(response_data)
+
+
+class UsageView(APIView):
+    """The user's generation usage: today against the quota, and the last 30 days."""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        days = list(DailyUsage.objects.filter(
+            user=request.user, day__gt=timezone.localdate() - timedelta(days=30)
+        ).values('day', 'jobs', 'failed_jobs', *USAGE_FIELDS))
+        today = days[0] if days and days[0]['day'] == timezone.localdate() else None
+        used = (today['total_seconds'] if today else 0) + usage_ledger.pending_seconds(
+            request.user.pk, timezone.localdate()
+        )
+        return Response({
+            'today': {
+                'used_seconds': round(used, 1),
+                'quota_seconds': settings.GENERATION_DAILY_QUOTA_SECONDS or None,
+                'predicted_seconds_per_song': round(predicted_cost(), 1),
+            },
+            'days': days,
+        })
+
+
+class EventTicketView(APIView):
+    """Issue a ticket for opening the user's job event stream."""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        ticket = signing.dumps(request.user.pk, salt=EVENT_TICKET_SALT)
+        return Response({
+            'ticket': ticket,
+            'url': f"{reverse('generation:job_events')}?ticket={ticket}",
+            'expires_in': settings.GENERATION_EVENT_TICKET_TTL,
+        })
+
+
+def _sse(event_type, data, event_id=None):
+    lines = [f"event: {event_type}", f"data: {json.dumps(data)}"]
+    if event_id is not None:
+        lines.insert(0, f"id: {event_id}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def job_events(request):
+    """
+    Server-Sent Events stream of the user's generation job events.
+    
+    Authenticated by ``?ticket=`` from EventTicketView. Reconnects resume
+    after the Last-Event-ID header where the events are still remembered.
+    Under ASGI an open stream is one idle coroutine; under WSGI it holds
+    a worker thread, so serve it from an ASGI server in production.
+    """
+    try:
+        user_id = signing.loads(
+            request.GET.get('ticket', ''), salt=EVENT_TICKET_SALT,
+            max_age=settings.GENERATION_EVENT_TICKET_TTL
+        )
+    except signing.BadSignature:
+        return HttpResponseForbidden('Invalid or expired ticket.')
+    
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    
+    heartbeat = settings.GENERATION_EVENT_HEARTBEAT
+    
+    async def async_stream():
+        subscription = bus.subscribe(user_id, last_event_id, loop=asyncio.get_running_loop())
+        try:
+            yield 'retry: 3000\n\n'
+            for event in subscription.backlog:
+                yield _sse(event['type'], event, event['id'])
+            while not subscription.overflowed:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'  # Keeps proxies from closing the connection
+                    continue
+                yield _sse(event['type'], event, event['id'])
+            yield _sse('resync', {})
+        finally:
+            bus.unsubscribe(subscription)
+    
+    def sync_stream():
+        subscription = bus.subscribe(user_id, last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            for event in subscription.backlog:
+                yield _sse(event['type'], event, event['id'])
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse(event['type'], event, event['id'])
+            yield _sse('resync', {})
+        finally:
+            bus.unsubscribe(subscription)
+    
+    stream = async_stream() if isinstance(request, ASGIRequest) else sync_stream()
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Unbuffered through nginx
+    return response
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+def song_deleted(instance, **kwargs):
+    from .models import LibraryStats
+    LibraryStats.objects.song_deleted(instance)
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.library'
+    
+    def ready(self):
+        # Also covers admin deletes and songs removed with their owner
+        post_delete.connect(song_deleted, sender='songs.Song')
@@ -0,0 +1,24 @@
+"""
+Rebuild per-user library stats from songs.
+
+Stats rows are kept current as songs change and built on first read;
+run this after importing songs, restoring a backup or editing songs
+outside the app. Users are processed in batches, each with one grouped
+query and one bulk upsert.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.library.models import LibraryStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute library stats for all users (or --user ids) from their songs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per query')
+
+    def handle(self, *args, **options):
+        written = LibraryStats.objects.rebuild(options['users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt library stats of {written} users"))
@@ -0,0 +1,260 @@
+"""
+Library models.
+"""
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('completed', 'generating', 'failed')
+
+# Users per grouped query in rebuild()
+BATCH_SIZE = 500
+
+
+def _empty():
+    """Field values of a LibraryStats row for a user without songs."""
+    return {
+        'total_songs': 0, **{f'{status}_songs': 0 for status in STATUSES},
+        'published_songs': 0, 'total_plays': 0, 'total_upvotes': 0, 'genres': {},
+    }
+
+
+def _aggregate(songs):
+    """
+    Library totals per user for a Song queryset, in one query.
+
+    Groups by (user, genre) with conditional counts; the per-user totals
+    are summed from the genre rows.
+
+    Returns:
+        dict: user_id -> field values of a LibraryStats row
+    """
+    rows = songs.order_by().values('user_id', 'genre').annotate(
+        songs=Count('pk'),
+        **{status: Count('pk', filter=Q(status=status)) for status in STATUSES},
+        published=Count('pk', filter=Q(is_public=True)),
+        plays=Coalesce(Sum('play_count'), 0),
+        upvotes=Coalesce(Sum('upvotes'), 0),
+    )
+    totals = {}
+    for row in rows:
+        stats = totals.setdefault(row['user_id'], _empty())
+        stats['total_songs'] += row['songs']
+        for status in STATUSES:
+            stats[f'{status}_songs'] += row[status]
+        stats['published_songs'] += row['published']
+        stats['total_plays'] += row['plays']
+        stats['total_upvotes'] += row['upvotes']
+        stats['genres'][row['genre']] = row['songs']
+    return totals
+
+
+class LibraryStatsManager(models.Manager):
+    """
+    Incremental maintenance of LibraryStats rows.
+
+    Every method is a single-row UPDATE with F() deltas (the genre counts,
+    a JSON object, are updated under a row lock), meant to run inside the
+    transaction of the song change. Users without a row are skipped;
+    their row is built from their songs on the next read.
+    """
+
+    def _apply(self, user_id, genres=None, **deltas):
+        rows = self.filter(pk=user_id)
+        fields = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if genres:
+            with transaction.atomic():
+                row = rows.select_for_update().only('genres').first()
+                if row is None:
+                    return
+                counts = dict(row.genres)
+                for genre, delta in genres.items():
+                    counts[genre] = counts.get(genre, 0) + delta
+                    if counts[genre] <= 0:
+                        del counts[genre]
+                rows.update(genres=counts, updated_at=timezone.now(), **fields)
+        elif fields:
+            rows.update(updated_at=timezone.now(), **fields)
+
+    def song_created(self, song):
+        self._apply(song.user_id, genres={song.genre: 1}, total_songs=1, **{f'{song.status}_songs': 1})
+
+    def song_deleted(self, song):
+        self._apply(
+            song.user_id, genres={song.genre: -1}, total_songs=-1,
+            published_songs=-int(song.is_public), total_plays=-song.play_count,
+            total_upvotes=-song.upvotes, **{f'{song.status}_songs': -1}
+        )
+
+    def status_changed(self, user_id, old, new):
+        if old != new:
+            self._apply(user_id, **{f'{old}_songs': -1, f'{new}_songs': 1})
+
+    def genre_changed(self, user_id, old, new):
+        if old != new:
+            self._apply(user_id, genres={old: -1, new: 1})
+
+    def published(self, user_id, delta):
+        """Call only when the song's is_public flip changed its row (see Song.publish)."""
+        self._apply(user_id, published_songs=delta)
+
+    def upvoted(self, song_id, delta):
+        """Add `delta` upvotes to the owner of a song, in one statement."""
+        from apps.songs.models import Song
+
+        self.filter(pk=models.Subquery(Song.objects.filter(pk=song_id).values('user_id')[:1])).update(
+            total_upvotes=F('total_upvotes') + delta, updated_at=timezone.now()
+        )
+
+    def played(self, song_deltas):
+        """Add flushed plays ({song_id: plays}) to their owners, one UPDATE per batch."""
+        from apps.songs.models import Song
+
+        owners = dict(Song.objects.filter(pk__in=list(song_deltas)).values_list('pk', 'user_id'))
+        per_user = {}
+        for song_id, plays in song_deltas.items():
+            if song_id in owners:
+                per_user[owners[song_id]] = per_user.get(owners[song_id], 0) + plays
+        items = list(per_user.items())
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = items[start:start + BATCH_SIZE]
+            self.filter(pk__in=[user_id for user_id, _ in batch]).update(
+                total_plays=F('total_plays') + models.Case(
+                    *[models.When(pk=user_id, then=models.Value(plays)) for user_id, plays in batch],
+                    default=models.Value(0), output_field=models.BigIntegerField()
+                ),
+                updated_at=timezone.now()
+            )
+
+    def for_user(self, user):
+        """
+        A user's stats row: one primary-key lookup, or built from their songs once.
+
+        When two first requests race, the one that loses the insert reads
+        the winner's row.
+        """
+        stats = self.filter(pk=user.pk).first()
+        if stats is None:
+            from apps.songs.models import Song
+
+            values = _aggregate(Song.objects.filter(user=user)).get(user.pk, {})
+            try:
+                with transaction.atomic():
+                    stats, _ = self.get_or_create(user=user, defaults=values)
+            except IntegrityError:
+                stats = self.get(pk=user.pk)
+        return stats
+
+    def rebuild(self, user_ids=None, batch_size=BATCH_SIZE):
+        """
+        Recompute the rows of `user_ids` (all users by default) from their songs.
+
+        One grouped query and one bulk upsert per batch of users.
+
+        Returns:
+            int: Rows written
+        """
+        from django.contrib.auth import get_user_model
+        from apps.songs.models import Song
+
+        users = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        fields = ['total_songs', *[f'{status}_songs' for status in STATUSES],
+                  'published_songs', 'total_plays', 'total_upvotes', 'genres', 'updated_at']
+
+        written = 0
+        last_pk = 0
+        while True:
+            batch = list(users.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            totals = _aggregate(Song.objects.filter(user_id__in=batch))
+            now = timezone.now()
+            self.bulk_create(
+                [LibraryStats(user_id=pk, updated_at=now, **totals.get(pk, {})) for pk in batch],
+                update_conflicts=True, unique_fields=['user'], update_fields=fields
+            )
+            written += len(batch)
+            last_pk = batch[-1]
+        return written
+
+
+    def reconcile(self, batch_size=BATCH_SIZE):
+        """
+        Correct existing rows that drifted from their users' songs.
+
+        Rows are read in keyset batches; each batch costs one grouped
+        query and one bulk UPDATE of the rows that differ, so rows being
+        updated incrementally are only rewritten when they are wrong.
+
+        Returns:
+            int: Rows corrected
+        """
+        from apps.songs.models import Song
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            rows = list(self.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not rows:
+                break
+            totals = _aggregate(Song.objects.filter(user_id__in=[row.pk for row in rows]))
+            now = timezone.now()
+            drifted = []
+            for row in rows:
+                actual = totals.get(row.pk) or _empty()
+                if any(getattr(row, name) != value for name, value in actual.items()):
+                    for name, value in actual.items():
+                        setattr(row, name, value)
+                    row.updated_at = now
+                    drifted.append(row)
+            self.bulk_update(drifted, [*_empty(), 'updated_at'])
+            fixed += len(drifted)
+            last_pk = rows[-1].pk
+
+        logger.info(f"[LIBRARY] Corrected library stats of {fixed} users")
+        return fixed
+
+
+def reconcile_library_stats():
+    """Periodic task entry point (PERIODIC_TASKS['library_stats'])."""
+    return LibraryStats.objects.reconcile()
+
+
+class LibraryStats(models.Model):
+    """
+    Per-user library totals for the dashboard.
+
+    Kept current by the song lifecycle (create, status change, publish,
+    plays, votes, delete) through LibraryStats.objects; drifted rows are
+    corrected by PERIODIC_TASKS['library_stats'], and all rows rebuilt from
+    the songs with ``manage.py rebuild_library_stats``.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='library_stats'
+    )
+    total_songs = models.IntegerField(default=0)
+    completed_songs = models.IntegerField(default=0)
+    generating_songs = models.IntegerField(default=0)
+    failed_songs = models.IntegerField(default=0)
+    published_songs = models.IntegerField(default=0)
+    total_plays = models.BigIntegerField(default=0)
+    total_upvotes = models.IntegerField(default=0)
+    genres = models.JSONField(default=dict)  # genre -> song count
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = LibraryStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'library stats'
+
+    def __str__(self):
+        return f"Library stats of {self.user_id}"
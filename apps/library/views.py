@@ -4,9 +4,8 @@ Views for user library.
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Sum
 
-from apps.songs.models import Song
+from .models import LibraryStats
 
 
 class LibraryStatsView(APIView):
@@ -15,20 +14,19 @@ class LibraryStatsView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        user = request.user
+        # One primary-key lookup; the row is maintained as songs change
+        stats = LibraryStats.objects.for_user(request.user)
         
-        # Get song stats
-        songs = Song.objects.filter(user=user)
-        
-        stats = {
-            'total_songs': songs.count(),
-            'completed_songs': songs.filter(status='completed').count(),
-            'generating_songs': songs.filter(status='generating').count(),
-            'failed_songs': songs.filter(status='failed').count(),
-            'published_songs': songs.filter(is_public=True).count(),
-            'total_plays': songs.aggregate(Sum('play_count'))['play_count__sum'] or 0,
-            'total_upvotes': songs.aggregate(Sum('upvotes'))['upvotes__sum'] or 0,
-            'genres': songs.values('genre').annotate(count=Count('genre')),
-        }
-        
-        return Response(stats)
+        return Response({
+            'total_songs': stats.total_songs,
+            'completed_songs': stats.completed_songs,
+            'generating_songs': stats.generating_songs,
+            'failed_songs': stats.failed_songs,
+            'published_songs': stats.published_songs,
+            'total_plays': stats.total_plays,
+            'total_upvotes': stats.total_upvotes,
+            'genres': [
+                {'genre': genre, 'count': count}
+                for genre, count in sorted(stats.genres.items(), key=lambda item: (-item[1], item[0]))
+            ],
+        })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Song, Vote, Playlist
+from .models import Song, SongChange, Vote, Playlist, PlaylistItem, PlayEvent
 
 
 @admin.register(Song)
@@ -7,11 +7,13 @@ class SongAdmin(admin.ModelAdmin):
     list_display = ['title', 'user', 'genre', 'status', 'is_public', 'score', 'play_count', 'created_at']
     list_filter = ['status', 'is_public', 'genre', 'mood', 'created_at']
     search_fields = ['title', 'user__username', 'lyrics']
-    readonly_fields = ['created_at', 'updated_at', 'play_count', 'upvotes', 'downvotes']
+    readonly_fields = ['created_at', 'updated_at', 'audio_hash', 'play_count', 'upvotes', 'downvotes',
+                       'score', 'hot_rank']
     
-    def score(self, obj):
-        return obj.score
-    score.short_description = 'Score'
+    # Keeps delta sync clients in step with admin edits (deletes are logged by a signal)
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        SongChange.objects.record(obj, SongChange.UPDATED if change else SongChange.CREATED)
 
 
 @admin.register(Vote)
@@ -19,10 +21,38 @@ class VoteAdmin(admin.ModelAdmin):
     list_display = ['user', 'song', 'vote_type', 'created_at']
     list_filter = ['vote_type', 'created_at']
     search_fields = ['user__username', 'song__title']
+    
+    # Admin edits bypass Vote.objects.cast/retract; recount the songs touched
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Song.objects.filter(pk__in=[obj.song_id, form.initial.get('song')]).sync_vote_counts()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Song.objects.filter(pk=obj.song_id).sync_vote_counts()
+    
+    def delete_queryset(self, request, queryset):
+        song_ids = list(queryset.values_list('song_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        Song.objects.filter(pk__in=song_ids).sync_vote_counts()
+
+
+class PlaylistItemInline(admin.TabularInline):
+    model = PlaylistItem
+    raw_id_fields = ['song']
+    ordering = ['position', 'id']
+    extra = 0
 
 
 @admin.register(Playlist)
 class PlaylistAdmin(admin.ModelAdmin):
+    inlines = [PlaylistItemInline]
     list_display = ['name', 'user', 'is_public', 'created_at']
     list_filter = ['is_public', 'created_at']
     search_fields = ['name', 'user__username']
+
+
+@admin.register(PlayEvent)
+class PlayEventAdmin(admin.ModelAdmin):
+    list_display = ['song_id', 'user_id', 'played_at']
+    list_filter = ['played_at']
@@ -1,6 +1,30 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate
+
+
+def install_search_index(using='default', **kwargs):
+    from .search import install
+    install(using)
+
+
+def invalidate_deleted_song(instance, **kwargs):
+    from .caching import invalidate
+    invalidate(instance.pk)
+
+
+def record_deleted_song(instance, **kwargs):
+    from .models import SongChange
+    SongChange.objects.record(instance, SongChange.DELETED)
 
 
 class SongsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.songs'
+    
+    def ready(self):
+        # Full-text index DDL is vendor-specific, so it is installed here
+        # rather than in a migration (see apps/songs/search.py)
+        post_migrate.connect(install_search_index, sender=self)
+        # Covers admin deletes and songs removed with their owner
+        post_delete.connect(invalidate_deleted_song, sender='songs.Song')
+        post_delete.connect(record_deleted_song, sender='songs.Song')
@@ -0,0 +1,185 @@
+"""
+Block-wise audio decoding, crossfading and MP3 encoding for streams.
+
+Songs are decoded from media storage BLOCK_FRAMES at a time, so memory
+stays bounded however long the output runs. Blocks are float32 arrays
+of shape (frames, CHANNELS) at SAMPLE_RATE, the format the generator
+writes; songs in another format are skipped. Encoding goes through
+libsndfile's MP3 support (soundfile, libsndfile >= 1.1).
+"""
+import logging
+
+import numpy as np
+import soundfile as sf
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+
+# Frames per processing block (a quarter of a second)
+BLOCK_FRAMES = SAMPLE_RATE // 4
+
+
+def read_blocks(name, block_frames=BLOCK_FRAMES):
+    """
+    Decode a stored audio file block by block.
+
+    Mono files are spread to both channels. Yields nothing for files
+    that are missing, unreadable, or not at SAMPLE_RATE.
+    """
+    try:
+        handle = default_storage.open(name, 'rb')
+    except (FileNotFoundError, OSError) as e:
+        logger.warning(f"[AUDIO] Cannot open {name}: {e}")
+        return
+    with handle:
+        try:
+            audio = sf.SoundFile(handle)
+        except (sf.LibsndfileError, RuntimeError) as e:
+            logger.warning(f"[AUDIO] Cannot decode {name}: {e}")
+            return
+        with audio:
+            if audio.samplerate != SAMPLE_RATE:
+                logger.warning(f"[AUDIO] Skipping {name}: {audio.samplerate} Hz, expected {SAMPLE_RATE} Hz")
+                return
+            for block in audio.blocks(blocksize=block_frames, dtype='float32', always_2d=True):
+                if block.shape[1] == 1:
+                    block = np.repeat(block, CHANNELS, axis=1)
+                elif block.shape[1] > CHANNELS:
+                    block = block[:, :CHANNELS]
+                yield block
+
+
+def _fade_curves(frames):
+    """Equal-power fade-out and fade-in gains, shaped (frames, 1)."""
+    t = (np.arange(frames, dtype=np.float32) + 0.5) / frames
+    return np.cos(t * (np.pi / 2))[:, None], np.sin(t * (np.pi / 2))[:, None]
+
+
+def crossfade(tracks, fade_frames, on_track=None):
+    """
+    Join tracks (iterables of blocks) into one stream of blocks.
+
+    The last `fade_frames` of each track overlap the start of the next
+    with equal-power curves; 0 joins them back to back (gapless). Only
+    about one fade length of audio is held back at any time.
+
+    Args:
+        tracks: Iterable of (item, blocks) pairs
+        fade_frames: Overlap between consecutive tracks
+        on_track: Called with (item, frame offset in the output) as each
+            track starts
+    """
+    tail = np.zeros((0, CHANNELS), np.float32)  # Held-back end of the previous track
+    position = 0  # Frames yielded so far
+    for item, blocks in tracks:
+        blocks = iter(blocks)
+
+        # The head of this track, as long as the tail it overlaps
+        head, head_frames = [], 0
+        for block in blocks:
+            head.append(block)
+            head_frames += len(block)
+            if head_frames >= max(len(tail), 1):
+                break
+        if not head_frames:
+            continue  # Nothing decoded; the tail waits for the next track
+        head = np.concatenate(head)
+
+        overlap = min(len(tail), len(head))
+        if len(tail) > overlap:
+            yield tail[:len(tail) - overlap]
+            position += len(tail) - overlap
+        if on_track:
+            on_track(item, position)
+        fade_out, fade_in = _fade_curves(overlap)
+        pending = [tail[len(tail) - overlap:] * fade_out + head[:overlap] * fade_in, head[overlap:]]
+        held = len(head)
+
+        # Stream the rest, keeping the last fade_frames back for the next overlap
+        for block in blocks:
+            pending.append(block)
+            held += len(block)
+            while pending and held - len(pending[0]) >= fade_frames:
+                out = pending.pop(0)
+                held -= len(out)
+                if len(out):
+                    yield out
+                    position += len(out)
+        rest = np.concatenate(pending) if pending else np.zeros((0, CHANNELS), np.float32)
+        split = max(len(rest) - fade_frames, 0)
+        if split:
+            yield rest[:split]
+            position += split
+        tail = rest[split:]
+    if len(tail):
+        yield tail
+
+
+class Mp3Encoder:
+    """
+    Incremental MP3 encoder: PCM blocks in, encoded bytes out.
+
+    libsndfile writes through a file-like sink; each encode() returns the
+    bytes produced for that block (possibly empty while LAME buffers).
+    The bitrate is constant: a stream has no room for the VBR header the
+    encoder writes on close, and without it decoders estimate a VBR
+    stream's length from its first frame.
+    """
+
+    class _Sink:
+        """
+        Write-only file for a stream.
+
+        Bytes past the end are kept; rewrites of bytes already handed out
+        (the header frame the encoder fills in on close) are dropped.
+        """
+
+        def __init__(self):
+            self.chunks = []
+            self.end = 0
+            self.position = 0
+
+        def write(self, data):
+            data = bytes(data)
+            if self.position >= self.end:
+                self.chunks.append(data)
+            self.end = max(self.end, self.position + len(data))
+            self.position += len(data)
+            return len(data)
+
+        def tell(self):
+            return self.position
+
+        def seek(self, offset, whence=0):
+            base = {0: 0, 1: self.position, 2: self.end}[whence]
+            self.position = base + offset
+            return self.position
+
+        def read(self, size=-1):
+            return b''
+
+    def __init__(self, samplerate=SAMPLE_RATE, channels=CHANNELS):
+        self._sink = self._Sink()
+        self._file = sf.SoundFile(
+            self._sink, 'w', samplerate=samplerate, channels=channels,
+            format='MP3', subtype='MPEG_LAYER_III',
+            # libsndfile only applies the mode with a level; 0.5 is about 160 kbps
+            compression_level=0.5, bitrate_mode='CONSTANT'
+        )
+
+    def _drain(self):
+        data = b''.join(self._sink.chunks)
+        self._sink.chunks.clear()
+        return data
+
+    def encode(self, block):
+        self._file.write(block)
+        return self._drain()
+
+    def close(self):
+        """Flush the encoder; returns the last bytes."""
+        self._file.close()
+        return self._drain()
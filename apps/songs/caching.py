@@ -0,0 +1,164 @@
+"""
+Conditional GET and a shared response cache for the public song pages.
+
+Every cacheable page hangs off a version stamp in the cache: one for the
+public feed (``songs:stamp:feed``) and one per song (``songs:stamp:<pk>``).
+A stamp is a random token plus the time it was set, and is replaced
+(never incremented) by invalidate() after publish, unpublish, votes,
+edits and deletes commit.
+
+For anonymous JSON requests, a page's ETag is a hash of its stamp token
+and URL, and its Last-Modified is the stamp time. Revalidating clients
+get a 304 from one cache read, without touching the ORM. Misses render
+the page once and store the bytes for SONG_CACHE_TTL seconds. Concurrent
+misses for the same page are coalesced, within a process by a striped
+lock and across processes by a short lease in the cache.
+
+Play counts do not invalidate: pages (and their ETags) roll over every
+SONG_CACHE_TTL seconds, which bounds how stale a count can get.
+
+The stamps only reach other processes through a shared cache backend
+(CACHE_URL); with the default per-process memory cache, run one process
+or keep SONG_CACHE_TTL short.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+FEED = 'feed'
+
+# Seconds a process waits for another process filling the same page
+LEASE_SECONDS = 5
+
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def _stamp_key(scope):
+    return f'songs:stamp:{scope}'
+
+
+def _new_stamp():
+    return (uuid.uuid4().hex, time.time())
+
+
+def stamp(scope):
+    """Current (token, modified_at) version stamp of a scope."""
+    key = _stamp_key(scope)
+    current = cache.get(key)
+    if current is None:
+        # Evicted or never set: a fresh token invalidates every page of the scope
+        cache.add(key, _new_stamp(), timeout=None)
+        current = cache.get(key) or _new_stamp()
+    return current
+
+
+def invalidate(song_id=None):
+    """
+    Expire cached pages of the public feed, and of one song if given.
+
+    Runs once the current transaction commits, so no page can be cached
+    from data older than the new stamp.
+    """
+    scopes = [FEED] if song_id is None else [FEED, song_id]
+
+    def bump():
+        cache.set_many({_stamp_key(scope): _new_stamp() for scope in scopes}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_or_fill(key, fill, timeout):
+    """
+    Cached value of `key`, computing it with fill() on a miss.
+
+    Only one caller per key computes at a time; the others wait for its
+    result. fill() returns (value, cacheable).
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _locks[hash(key) % len(_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lease = f'{key}:lease'
+        leased = cache.add(lease, 1, LEASE_SECONDS)
+        if not leased:
+            deadline = time.monotonic() + LEASE_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+        try:
+            value, cacheable = fill()
+            if cacheable:
+                cache.set(key, value, timeout)
+        finally:
+            if leased:
+                cache.delete(lease)
+    return value
+
+
+class ConditionalCacheMixin:
+    """
+    ETag / Last-Modified and a shared page cache for anonymous GETs.
+
+    Views define get_cache_scope() (FEED or a song id) and list the query
+    parameters that must bypass the cache in cache_bypass_params.
+    """
+
+    cache_bypass_params = ()
+
+    def get_cache_scope(self):
+        raise NotImplementedError
+
+    def is_cacheable(self, request):
+        return (
+            settings.SONG_CACHE_TTL > 0
+            and not request.user.is_authenticated
+            and request.accepted_renderer.format == 'json'
+            and not any(param in request.query_params for param in self.cache_bypass_params)
+        )
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        ttl = settings.SONG_CACHE_TTL
+        token, modified_at = stamp(self.get_cache_scope())
+        window = int(time.time() // ttl)
+        query = sorted(request.query_params.lists())
+        digest = hashlib.sha1(f'{token}:{window}:{request.path}:{query}'.encode()).hexdigest()
+        etag = f'"{digest}"'
+        last_modified = int(max(modified_at, window * ttl))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            def fill():
+                page = self.finalize_response(request, super(ConditionalCacheMixin, self).get(
+                    request, *args, **kwargs
+                ))
+                page.render()
+                return (page.status_code, page['Content-Type'], page.content), page.status_code == 200
+
+            status_code, content_type, content = get_or_fill(f'songs:page:{digest}', fill, ttl)
+            response = HttpResponse(content, status=status_code, content_type=content_type)
+            if status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
@@ -0,0 +1,136 @@
+"""
+Delta sync over the song change log.
+
+Every song change appends a SongChange row (created, updated, published,
+unpublished, deleted); its auto-increment id is the change token. A
+client keeps the highest token it has seen and asks for the changes
+after it (SongChangesView). Each change carries the song's current
+representation, or null when the song is gone from the client's scope,
+so applying a page is an idempotent upsert/remove per song.
+
+Compaction (PERIODIC_TASKS['compact_changes']) keeps the log bounded:
+
+- a row is dropped once a newer row exists for the same song and the
+  same visibility (`public`), since readers only need the latest one
+- tombstones older than SONG_CHANGE_RETENTION_DAYS are dropped with the
+  rest of their song's rows; the highest removed token becomes the
+  horizon, and clients still behind it must resync from the full list
+
+Votes and plays do not log changes; counters in synced songs are as of
+the song's last change.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import PUBLIC_FEED, Song, SongChange, SongChangeCompaction
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per statement during compaction
+BATCH_SIZE = 1000
+
+
+def horizon():
+    """Oldest usable token: changes at or below it may have been compacted away."""
+    return SongChangeCompaction.objects.order_by('-id').values_list('horizon', flat=True).first() or 0
+
+
+def _in_scope(rows, user, public):
+    return rows.filter(public=True) if public else rows.filter(user=user)
+
+
+def changes_since(token, user, public=False, limit=100, columns=None):
+    """
+    Changes after `token`, oldest first, one per song.
+
+    Args:
+        token: Last token the client has applied
+        user: Requesting user; their library is synced unless `public`
+        public: Sync the public feed instead
+        limit: Log rows read
+        columns: Song columns to load (see SparseFieldsetMixin.columns_for)
+
+    Returns:
+        tuple: (list of (SongChange, Song or None), next token, has_more)
+    """
+    rows = _in_scope(SongChange.objects.filter(pk__gt=token), user, public)
+    # Leave recent rows for the next call: a transaction that took its id
+    # earlier may still commit below them
+    settle = settings.SONG_CHANGES_SETTLE_SECONDS
+    if settle:
+        rows = rows.filter(changed_at__lte=timezone.now() - timedelta(seconds=settle))
+    rows = list(rows.order_by('pk')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], token, False
+
+    # Only the latest change per song matters
+    latest = {}
+    for row in rows:
+        latest.pop(row.song_id, None)
+        latest[row.song_id] = row
+
+    songs = Song.objects.for_serialization(user, columns).with_excerpt().filter(pk__in=list(latest))
+    songs = songs.filter(PUBLIC_FEED) if public else songs.filter(user=user)
+    by_id = {song.pk: song for song in songs}
+    return [(row, by_id.get(song_id)) for song_id, row in latest.items()], rows[-1].pk, has_more
+
+
+def current_token(user, public=False):
+    """Token of the newest change in scope, for clients starting from a full list."""
+    newest = _in_scope(SongChange.objects.all(), user, public).aggregate(token=Max('pk'))['token'] or 0
+    # Never behind the horizon, or the client would be sent to resync again
+    return max(newest, horizon())
+
+
+def compact_changes(retention_days=None, batch_size=BATCH_SIZE):
+    """
+    Drop superseded rows and expired tombstones from the change log.
+
+    Returns:
+        int: Rows removed
+    """
+    if retention_days is None:
+        retention_days = settings.SONG_CHANGE_RETENTION_DAYS
+    removed = 0
+
+    superseded = SongChange.objects.filter(Exists(SongChange.objects.filter(
+        song_id=OuterRef('song_id'), public=OuterRef('public'), pk__gt=OuterRef('pk')
+    )))
+    while True:
+        ids = list(superseded.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        removed += SongChange.objects.filter(pk__in=ids).delete()[0]
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    tombstones = SongChange.objects.filter(action=SongChange.DELETED, changed_at__lt=cutoff).order_by('pk')
+    expired = 0
+    while True:
+        batch = list(tombstones.values_list('pk', 'song_id')[:batch_size])
+        if not batch:
+            break
+        last_token = batch[-1][0]
+        with transaction.atomic():
+            # The horizon moves in the same transaction, so no reader
+            # can miss a tombstone without being told to resync
+            count = SongChange.objects.filter(
+                song_id__in=[song_id for _, song_id in batch], pk__lte=last_token
+            ).delete()[0]
+            SongChangeCompaction.objects.create(horizon=last_token, removed=count)
+        expired += count
+    removed += expired
+    if expired:
+        # Only the latest horizon is read
+        latest = SongChangeCompaction.objects.order_by('-id').values_list('pk', flat=True).first()
+        SongChangeCompaction.objects.filter(pk__lt=latest).delete()
+
+    if removed:
+        logger.info(f"[CHANGES] Compacted change log: {removed} rows removed ({expired} expired)")
+    return removed
@@ -2,7 +2,9 @@
 Filters for songs.
 """
 from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 from .models import Song
+from .search import search
 
 
 class SongFilter(filters.FilterSet):
@@ -12,15 +14,43 @@ class SongFilter(filters.FilterSet):
     mood = filters.MultipleChoiceFilter(choices=Song.MOOD_CHOICES)
     duration_min = filters.NumberFilter(field_name='duration', lookup_expr='gte')
     duration_max = filters.NumberFilter(field_name='duration', lookup_expr='lte')
-    min_score = filters.NumberFilter(method='filter_min_score')
+    min_score = filters.NumberFilter(field_name='score', lookup_expr='gte')
     
     class Meta:
         model = Song
         fields = ['genre', 'mood', 'duration_min', 'duration_max']
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Full-text `?search=` over title, description and lyrics (see search.py)."""
+    
+    search_param = 'search'
+    
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+    
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        return search(queryset, query)
+
+
+class SongOrderingFilter(OrderingFilter):
+    """
+    Ordering filter that defaults to relevance while searching.
+    
+    Also accepts `hot` (trending first, see ranking.py) for the hot_rank
+    column.
+    """
+    
+    ordering_aliases = {'hot': '-hot_rank', '-hot': 'hot_rank'}
+    
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = [self.ordering_aliases.get(term, term) for term in fields]
+        return super().remove_invalid_fields(queryset, fields, view, request)
     
-    def filter_min_score(self, queryset, name, value):
-        """Filter by minimum score (upvotes - downvotes)."""
-        from django.db.models import F
-        return queryset.annotate(
-            score=F('upvotes') - F('downvotes')
-        ).filter(score__gte=value)
+    def get_default_ordering(self, view):
+        if FullTextSearchFilter().get_search_query(view.request):
+            return ['-search_rank']
+        return super().get_default_ordering(view)
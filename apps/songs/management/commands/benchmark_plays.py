@@ -0,0 +1,101 @@
+"""
+Load benchmark for play counting.
+
+Builds a throwaway test database and hammers a handful of songs from
+several threads, first with the old read-modify-write counter
+(``play_count += 1; save()`` per play), then with the buffered counter
+from apps/songs/plays.py. Reports plays/s and how many increments each
+approach lost.
+
+    python manage.py benchmark_plays --plays 5000 --threads 8
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+class Command(BaseCommand):
+    help = 'Compare plays/s of read-modify-write and buffered play counting.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plays', type=int, default=5000, help='Plays per approach')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent players')
+        parser.add_argument('--songs', type=int, default=3, help='Songs played (few = hot rows)')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options['plays'], options['threads'], options['songs'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, plays, threads, song_count):
+        from django.contrib.auth import get_user_model
+        from apps.songs.models import Song
+        from apps.songs.plays import PlayCounter
+
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'x')
+        song_ids = [
+            Song.objects.create(user=user, title=f'Bench {i}', lyrics='', genre='pop',
+                                status='completed', is_public=True).pk
+            for i in range(song_count)
+        ]
+
+        def read_modify_write(song_id):
+            song = Song.objects.get(pk=song_id)
+            song.play_count += 1
+            song.save(update_fields=['play_count'])
+
+        counter = PlayCounter(threshold=500)
+
+        def buffered(song_id):
+            counter.record(song_id, user.pk)
+
+        for label, play in (('read-modify-write', read_modify_write), ('buffered', buffered)):
+            Song.objects.update(play_count=0)
+            elapsed, errors = self.hammer(play, plays, threads, song_ids)
+            if play is buffered:
+                start = time.perf_counter()
+                counter.flush()
+                elapsed += time.perf_counter() - start
+            stored = sum(Song.objects.values_list('play_count', flat=True))
+            lost = plays - errors - stored
+            self.stdout.write(
+                f"{label:<18} {plays / elapsed:>10.0f} plays/s   "
+                f"lost {lost} of {plays}" + (f", {errors} failed" if errors else '')
+            )
+
+    def hammer(self, play, plays, threads, song_ids):
+        """Run `plays` calls of play(song_id) spread over `threads` threads."""
+        per_thread = plays // threads
+        errors = [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(offset):
+            barrier.wait()
+            for i in range(per_thread):
+                try:
+                    play(song_ids[(offset + i) % len(song_ids)])
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+            connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        # Plays that did not divide evenly between threads
+        for i in range(plays - per_thread * threads):
+            play(song_ids[i % len(song_ids)])
+        return elapsed, errors[0]
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for API JSON rendering and parsing.
+
+Builds a throwaway test database, serializes full pages of songs with
+SongSerializer(many=True), then renders (and parses back) the same data
+with DRF's JSONRenderer/JSONParser and with the orjson-backed classes
+from config/renderers.py. Serialization happens once, outside the timed
+loops, so only the JSON step is compared.
+
+    python manage.py benchmark_renderers --songs 100 --rounds 200
+"""
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON renderer and parser throughput on SongSerializer pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--songs', type=int, default=100, help='Songs per page')
+        parser.add_argument('--rounds', type=int, default=200, help='Renders per renderer')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options['songs'], options['rounds'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, song_count, rounds):
+        from django.contrib.auth import get_user_model
+        from rest_framework.parsers import JSONParser
+        from rest_framework.renderers import JSONRenderer
+
+        from apps.songs.models import Song
+        from apps.songs.serializers import SongSerializer
+        from config import renderers
+
+        if renderers.orjson is None:
+            raise CommandError('orjson is not installed; nothing to compare against.')
+
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'x')
+        lyrics = '\n'.join(f'Line {n}: tape hiss and neon lights, “rewind” the night' for n in range(24))
+        Song.objects.bulk_create([
+            Song(user=user, title=f'Bench {i}', lyrics=lyrics, description='Warm analog pads ' * 8,
+                 genre='pop', mood='happy', status='completed', is_public=True, upvotes=i, score=i)
+            for i in range(song_count)
+        ])
+        data = SongSerializer(Song.objects.for_serialization(None), many=True).data
+
+        baseline = JSONRenderer().render(data)
+        if renderers.FastJSONParser().parse(io.BytesIO(baseline)) != JSONParser().parse(io.BytesIO(baseline)):
+            raise CommandError('Parsers disagree on the rendered page.')
+        if renderers.FastJSONParser().parse(io.BytesIO(renderers.FastJSONRenderer().render(data))) \
+                != JSONParser().parse(io.BytesIO(baseline)):
+            raise CommandError('Renderers disagree on the page.')
+
+        self.stdout.write(f"{song_count} songs per page, {len(baseline) / 1024:.0f} KB")
+        for label, renderer, parser in (
+            ('json (DRF)', JSONRenderer(), JSONParser()),
+            ('orjson', renderers.FastJSONRenderer(), renderers.FastJSONParser()),
+        ):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                body = renderer.render(data)
+            render_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parser.parse(io.BytesIO(body))
+            parse_s = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{label:<12} render {rounds / render_s:>8.0f} pages/s "
+                f"({len(body) * rounds / render_s / 2 ** 20:>6.0f} MB/s)   "
+                f"parse {rounds / parse_s:>8.0f} pages/s"
+            )
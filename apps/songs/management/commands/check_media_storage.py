@@ -0,0 +1,82 @@
+"""
+Round-trip check of the configured media storage backend.
+
+Run against a local S3-compatible stand-in before deploying a new node:
+
+    moto_server -p 9000        # or: docker run -p 9000:9000 minio/minio server /data
+    MEDIA_STORAGE=s3 MEDIA_S3_BUCKET=retro-cassette-media \
+    MEDIA_S3_ENDPOINT_URL=http://localhost:9000 \
+    python manage.py check_media_storage --create-bucket
+"""
+import os
+import tempfile
+import time
+import urllib.request
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.songs.storage import store_audio
+
+
+class Command(BaseCommand):
+    help = 'Upload, dedupe, fetch and delete a test file through the media storage backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=20,
+                            help='Size of the test file (large enough to force a multipart upload)')
+        parser.add_argument('--create-bucket', action='store_true',
+                            help='Create the S3 bucket if it does not exist')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        self.stdout.write(f"Backend: {storage.__class__.__name__}")
+
+        if options['create_bucket'] and hasattr(storage, 'bucket_name'):
+            try:
+                storage.client.head_bucket(Bucket=storage.bucket_name)
+            except Exception:
+                storage.client.create_bucket(Bucket=storage.bucket_name)
+                self.stdout.write(f"Created bucket {storage.bucket_name}")
+
+        payload = os.urandom(options['size_mb'] * 1024 * 1024)
+
+        def write_temp():
+            f = tempfile.NamedTemporaryFile(suffix='.mp3', delete=False)
+            f.write(payload)
+            f.close()
+            return f.name
+
+        start = time.perf_counter()
+        name, digest = store_audio(write_temp(), prefix='storage-check')
+        elapsed = time.perf_counter() - start
+        mb_s = options['size_mb'] / elapsed if elapsed else 0
+        self.stdout.write(f"Stored {name} in {elapsed:.2f}s ({mb_s:.1f} MB/s)")
+
+        try:
+            if not storage.exists(name):
+                raise CommandError("Stored file does not exist")
+            if storage.size(name) != len(payload):
+                raise CommandError("Stored file has the wrong size")
+
+            dup_path = write_temp()
+            dup_name, _ = store_audio(dup_path, prefix='storage-check')
+            if dup_name != name or os.path.exists(dup_path):
+                raise CommandError("Identical content was not deduplicated")
+            self.stdout.write("Deduplication OK")
+
+            url = storage.serve_url(name, filename='check.mp3', expires_in=60)
+            if url:
+                with urllib.request.urlopen(url) as response:
+                    if response.read() != payload:
+                        raise CommandError("Presigned GET returned different content")
+                self.stdout.write("Presigned GET OK")
+            else:
+                with storage.open(name) as f:
+                    if f.read() != payload:
+                        raise CommandError("Read back different content")
+                self.stdout.write("Read back OK")
+        finally:
+            storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS("Media storage OK"))
@@ -0,0 +1,26 @@
+"""
+Query-budget regression check for the song endpoints.
+
+Runs apps.songs.tests.QueryBudgetTests, which request each endpoint with
+one song on the page and with a full page: the query count must stay
+within the view's query_budget and must not grow with the page size.
+
+    python manage.py check_query_budgets
+
+Exits non-zero on any regression, so it can run in CI next to
+``manage.py check``.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+
+
+class Command(BaseCommand):
+    help = 'Check that song endpoints run a fixed number of SQL queries, independent of page size.'
+
+    def handle(self, *args, **options):
+        runner = get_runner(settings)(verbosity=options['verbosity'])
+        failures = runner.run_tests(['apps.songs.tests.QueryBudgetTests'])
+        if failures:
+            raise CommandError(f"{failures} endpoint(s) over query budget")
+        self.stdout.write(self.style.SUCCESS('All endpoints within query budget.'))
@@ -0,0 +1,21 @@
+"""
+(Re)install the song full-text search index.
+
+The index is installed automatically after migrate and kept in sync by
+the database; run this after restoring a backup made without it, or to
+rebuild an SQLite FTS5 index from scratch.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.songs.search import install
+
+
+class Command(BaseCommand):
+    help = 'Install and rebuild the song full-text search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias')
+
+    def handle(self, *args, **options):
+        engine = install(options['database'], rebuild=True)
+        self.stdout.write(self.style.SUCCESS(f"Search index ready ({engine})."))
@@ -0,0 +1,29 @@
+"""
+Recompute stored song scores and hot ranks.
+
+Scores are kept current on every vote and hot ranks by a periodic task;
+run this once after adding the columns to an existing database, or with
+HOT_RANK_INTERVAL=0 from cron.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from apps.songs.models import Song
+from apps.songs.ranking import recompute_hot_ranks
+
+
+class Command(BaseCommand):
+    help = 'Backfill song scores from vote tallies and recompute hot ranks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-only', action='store_true',
+                            help='Only recompute hot ranks')
+
+    def handle(self, *args, **options):
+        if not options['hot_only']:
+            fixed = Song.objects.exclude(score=F('upvotes') - F('downvotes')).update(
+                score=F('upvotes') - F('downvotes')
+            )
+            self.stdout.write(f"Fixed {fixed} song scores")
+        updated = recompute_hot_ranks()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed hot rank of {updated} songs"))
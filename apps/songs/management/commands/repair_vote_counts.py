@@ -0,0 +1,32 @@
+"""
+Recount song upvotes, downvotes and score from Vote rows.
+
+Votes keep the counters current through Vote.objects.cast/retract; run
+this after bulk deletes, user deletions or manual database edits that
+bypass it. Drifted songs are found and fixed with set-based queries (a
+grouped count subquery per vote type), never song by song.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.songs.models import Song
+
+
+class Command(BaseCommand):
+    help = 'Recompute song vote counters from Vote rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report songs whose counters are wrong')
+
+    def handle(self, *args, **options):
+        drifted = Song.objects.with_vote_drift()
+        if options['dry_run']:
+            for song in drifted.values('pk', 'upvotes', 'downvotes', 'actual_upvotes', 'actual_downvotes')[:20]:
+                self.stdout.write(
+                    f"Song {song['pk']}: {song['upvotes']}/{song['downvotes']} stored, "
+                    f"{song['actual_upvotes']}/{song['actual_downvotes']} counted"
+                )
+            self.stdout.write(f"{drifted.count()} songs need repair")
+            return
+        fixed = Song.objects.filter(pk__in=drifted.values('pk')).sync_vote_counts()
+        self.stdout.write(self.style.SUCCESS(f"Repaired vote counters of {fixed} songs"))
@@ -0,0 +1,153 @@
+"""
+Playlists rendered as one continuous tape side.
+
+The songs are decoded block by block, joined gapless or crossfaded
+(audio.crossfade) and encoded straight to a scratch file, so memory
+stays bounded whatever the playlist length. Each song becomes an ID3v2
+chapter (CHAP/CTOC frames), which podcast-style players show as a
+track list; the same chapters are stored next to the file as JSON for
+the API.
+
+Renders are cached in media storage under the SHA-256 of the ordered
+(song id, audio hash) list and the crossfade length, so an identical
+mixtape is rendered once whoever asks for it, and any edit to the
+playlist or a song's audio produces a new key. Renders run on their
+own MIXTAPE_RENDER_WORKERS threads, apart from the generation workers;
+a key already rendering is not submitted again.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+
+import soundfile as sf
+from django.core.files.storage import default_storage
+
+from .audio import CHANNELS, SAMPLE_RATE, crossfade, read_blocks
+from .storage import CHUNK_SIZE, sharded_name, store_bytes
+
+logger = logging.getLogger(__name__)
+
+# Part of every cache key; bump when the rendered output changes
+RENDER_VERSION = 1
+
+# ID3v2 CTOC entry count is one byte
+MAX_CHAPTERS = 255
+
+# Longest accepted crossfade, in seconds
+MAX_CROSSFADE = 12
+
+
+def mixtape_key(tracks, crossfade_seconds):
+    """Cache key of a render: the ordered songs, their audio and the crossfade."""
+    payload = json.dumps([
+        RENDER_VERSION, round(float(crossfade_seconds), 3),
+        [[track['id'], track['audio_hash'] or track['audio_file']] for track in tracks],
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def audio_name(key):
+    return sharded_name(key, '.mp3', 'mixtapes')
+
+
+def chapters_name(key):
+    return sharded_name(key, '.json', 'mixtapes')
+
+
+def download_name(playlist_name):
+    """Download file name of a playlist's mixtape."""
+    safe_name = re.sub(r'[<>:"/\\|?*]', '', playlist_name).strip()[:100]
+    return f"{safe_name or 'Mixtape'}.mp3"
+
+
+def load_chapters(key):
+    """Chapters of a finished render, or None while it is not rendered."""
+    try:
+        with default_storage.open(chapters_name(key), 'rb') as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, OSError):
+        return None
+
+
+def _synchsafe(size):
+    return bytes([(size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f])
+
+
+def _frame(frame_id, body):
+    return frame_id.encode('ascii') + _synchsafe(len(body)) + b'\0\0' + body
+
+
+def _text_frame(frame_id, text):
+    return _frame(frame_id, b'\x03' + text.encode('utf-8'))  # UTF-8
+
+
+def id3_chapters(title, chapters):
+    """An ID3v2.4 tag with the title and one CHAP frame per chapter."""
+    chapters = chapters[:MAX_CHAPTERS]
+    frames = [_text_frame('TIT2', title)]
+    element_ids = [f"ch{index}".encode('ascii') + b'\0' for index in range(len(chapters))]
+    frames.append(_frame('CTOC', b'toc\0' + b'\x03' + bytes([len(chapters)]) + b''.join(element_ids)))
+    for element_id, chapter in zip(element_ids, chapters):
+        frames.append(_frame('CHAP', element_id + struct.pack(
+            '>IIII', chapter['start_ms'], chapter['end_ms'], 0xFFFFFFFF, 0xFFFFFFFF
+        ) + _text_frame('TIT2', f"{chapter['artist']} - {chapter['title']}")))
+    body = b''.join(frames)
+    return b'ID3\x04\x00\x00' + _synchsafe(len(body)) + body
+
+
+def render_mixtape(key, title, tracks, crossfade_seconds, scratch_dir):
+    """
+    Render `tracks` into the cached mixtape `key`.
+
+    Args:
+        key: mixtape_key() of the tracks
+        title: Title tag of the file
+        tracks: Dicts with id, title, artist, audio_file, in play order
+        crossfade_seconds: Overlap between songs, 0 for gapless
+        scratch_dir: Directory for the intermediate file
+
+    Returns:
+        list: The chapters
+    """
+    starts = []
+    frames = 0
+    body_path = os.path.join(scratch_dir, f"{key}.body.mp3")
+    # Encoded to a real file, so the encoder can finish its seek header
+    with sf.SoundFile(body_path, 'w', samplerate=SAMPLE_RATE, channels=CHANNELS,
+                      format='MP3', subtype='MPEG_LAYER_III') as body:
+        blocks = crossfade(
+            ((track, read_blocks(track['audio_file'])) for track in tracks),
+            int(crossfade_seconds * SAMPLE_RATE),
+            lambda track, offset: starts.append((track, offset))
+        )
+        for block in blocks:
+            body.write(block)
+            frames += len(block)
+
+    chapters = []
+    for index, (track, offset) in enumerate(starts):
+        end = starts[index + 1][1] if index + 1 < len(starts) else frames
+        chapters.append({
+            'song_id': track['id'],
+            'title': track['title'],
+            'artist': track['artist'],
+            'start_ms': offset * 1000 // SAMPLE_RATE,
+            'end_ms': end * 1000 // SAMPLE_RATE,
+        })
+
+    # The tag goes first but needs the chapter times: prepend it by copying
+    out_path = os.path.join(scratch_dir, f"{key}.mp3")
+    with open(out_path, 'wb') as out, open(body_path, 'rb') as body:
+        out.write(id3_chapters(title, chapters))
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+            out.write(chunk)
+    os.unlink(body_path)
+
+    # Chapters last: their presence marks the render complete
+    default_storage.save_file(out_path, audio_name(key))
+    store_bytes(chapters_name(key), json.dumps(chapters).encode())
+    logger.info(f"[MIXTAPE] Rendered {key[:12]}: {len(chapters)} songs, {frames / SAMPLE_RATE:.0f}s")
+    return chapters
@@ -1,12 +1,109 @@
 """
 Song models.
 """
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce, NullIf, Substr
+from django.utils import timezone
+
+from apps.library.models import LibraryStats
+
+from .caching import invalidate
 
 User = get_user_model()
 
+# Owner columns embedded in song responses (see PublicUserSerializer)
+SONG_OWNER_FIELDS = ('id', 'username', 'avatar')
+
+# Rows of the public song feed (SongListView), covered by partial indexes
+PUBLIC_FEED = models.Q(is_public=True, status='completed')
+
+# Characters of description (or lyrics) sent as a list card excerpt
+EXCERPT_LENGTH = 100
+
+# Spacing of PlaylistItem positions (room for ~20 inserts between two songs)
+POSITION_GAP = 1 << 20
+
+# Songs shown per playlist in playlist lists, and their columns
+PLAYLIST_PREVIEW_SIZE = 3
+PLAYLIST_PREVIEW_FIELDS = ('id', 'title', 'genre', 'duration')
+
+
+class SongQuerySet(models.QuerySet):
+    """Query helpers that keep song serialization at a fixed query count."""
+    
+    def with_owner(self, columns=None):
+        """Load only `columns` of the song (all by default), joining the owner if listed.
+        
+        Only the owner columns embedded in responses are loaded; encrypted
+        API-key columns are never fetched, so never decrypted.
+        """
+        if columns is None:
+            columns = [f.name for f in self.model._meta.concrete_fields]
+        columns = {'id', *columns}
+        if 'user' not in columns:
+            return self.only(*columns)
+        return self.select_related('user').only(
+            *columns, *[f'user__{name}' for name in SONG_OWNER_FIELDS]
+        )
+    
+    def with_user_vote(self, user):
+        """Annotate `current_user_vote` ('up', 'down' or None) for `user`."""
+        if user is None or not user.is_authenticated:
+            return self.annotate(current_user_vote=models.Value(None, output_field=models.CharField()))
+        return self.annotate(current_user_vote=models.Subquery(
+            Vote.objects.filter(song=models.OuterRef('pk'), user=user).values('vote_type')[:1]
+        ))
+    
+    def with_excerpt(self, length=EXCERPT_LENGTH):
+        """Annotate `excerpt`: the start of the description, else of the lyrics.
+        
+        Cut in SQL, so list queries never transfer the full text columns.
+        """
+        return self.annotate(excerpt=Coalesce(
+            NullIf(Substr('description', 1, length), models.Value('')),
+            Substr('lyrics', 1, length),
+            output_field=models.CharField()
+        ))
+    
+    def for_serialization(self, user, columns=None):
+        """Everything SongSerializer reads, in a single query.
+        
+        Args:
+            user: Requesting user, for the `user_vote` field
+            columns: Song columns to load (see SparseFieldsetMixin.columns_for), all by default
+        """
+        return self.with_owner(columns).with_user_vote(user)
+    
+    @staticmethod
+    def _vote_tally(vote_type):
+        return Coalesce(models.Subquery(
+            Vote.objects.filter(song=models.OuterRef('pk'), vote_type=vote_type)
+            .order_by().values('song').annotate(n=models.Count('pk')).values('n')
+        ), 0)
+    
+    def with_vote_drift(self):
+        """Only songs whose stored tallies disagree with their Vote rows."""
+        return self.annotate(
+            actual_upvotes=self._vote_tally('up'),
+            actual_downvotes=self._vote_tally('down'),
+        ).exclude(
+            upvotes=models.F('actual_upvotes'),
+            downvotes=models.F('actual_downvotes'),
+            score=models.F('actual_upvotes') - models.F('actual_downvotes'),
+        )
+    
+    def sync_vote_counts(self):
+        """
+        Recount upvotes, downvotes and score from Vote rows, in one UPDATE.
+        
+        Returns:
+            int: Songs updated
+        """
+        up, down = self._vote_tally('up'), self._vote_tally('down')
+        return self.update(upvotes=up, downvotes=down, score=up - down)
+
 
 class Song(models.Model):
     """Model for generated songs."""
@@ -62,8 +159,14 @@ class Song(models.Model):
     
     # Files
     audio_file = models.FileField(upload_to='songs/', null=True, blank=True)
+    audio_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of audio_file
     cover_image = models.ImageField(upload_to='covers/', null=True, blank=True)
     
+    # Audio analysis (computed after generation, see apps.generation.analysis)
+    loudness_lufs = models.FloatField(null=True, blank=True)
+    true_peak_dbtp = models.FloatField(null=True, blank=True)
+    tempo_bpm = models.FloatField(null=True, blank=True)
+    
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='generating')
     error_message = models.TextField(blank=True)
@@ -76,50 +179,160 @@ class Song(models.Model):
     play_count = models.IntegerField(default=0)
     upvotes = models.IntegerField(default=0)
     downvotes = models.IntegerField(default=0)
+    # upvotes - downvotes, kept current on every vote
+    score = models.IntegerField(default=0)
+    # Time-decayed trending rank, recomputed periodically (see ranking.py)
+    hot_rank = models.FloatField(default=0)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SongQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['-created_at']),
+            # Keyset pagination: one index per ordering, tie-broken on id.
+            # Public feed orderings are partial indexes over the feed rows,
+            # so ordering=hot or min_score are plain index range scans.
+            models.Index(fields=['-created_at', '-id']),
             models.Index(fields=['user', '-created_at']),
-            models.Index(fields=['is_public', '-upvotes']),
+            models.Index(fields=['-upvotes', '-id'], condition=PUBLIC_FEED, name='song_feed_upvotes_idx'),
+            models.Index(fields=['-play_count', '-id'], condition=PUBLIC_FEED, name='song_feed_plays_idx'),
+            models.Index(fields=['title', 'id'], condition=PUBLIC_FEED, name='song_feed_title_idx'),
+            models.Index(fields=['-score', '-id'], condition=PUBLIC_FEED, name='song_feed_score_idx'),
+            models.Index(fields=['-hot_rank', '-id'], condition=PUBLIC_FEED, name='song_feed_hot_idx'),
             models.Index(fields=['genre']),
         ]
     
     def __str__(self):
         return f"{self.title} by {self.user.username}"
     
-    @property
-    def score(self):
-        """Calculate song score (upvotes - downvotes)."""
-        return self.upvotes - self.downvotes
+    def increment_play_count(self, user=None):
+        """Increment play count (buffered, see plays.py).
+        
+        Returns:
+            int: Play count including plays not yet written
+        """
+        from .plays import play_counter
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        return self.play_count + play_counter.record(self.pk, user_id)
     
-    def increment_play_count(self):
-        """Increment play count."""
-        self.play_count += 1
-        self.save(update_fields=['play_count'])
+    def save_status(self, update_fields=()):
+        """Save a status change (plus `update_fields`), keeping library stats in step."""
+        with transaction.atomic():
+            previous = Song.objects.select_for_update().filter(pk=self.pk).values_list('status', flat=True).get()
+            self.save(update_fields={'status', *update_fields})
+            LibraryStats.objects.status_changed(self.user_id, previous, self.status)
+            SongChange.objects.record(self, SongChange.UPDATED)
     
     def publish(self):
-        """Publish the song."""
-        from django.utils import timezone
+        """Publish the song.
+        
+        The flip is a conditional UPDATE, so of two concurrent calls only
+        the one that changed the row adjusts the published counters.
+        """
+        from .ranking import hot_rank
         self.is_public = True
         self.published_at = timezone.now()
-        self.save(update_fields=['is_public', 'published_at'])
-        self.user.increment_published_count()
+        self.hot_rank = hot_rank(self.score, self.published_at)
+        with transaction.atomic():
+            flipped = Song.objects.filter(pk=self.pk, is_public=False).update(is_public=True)
+            self.save(update_fields=['is_public', 'published_at', 'hot_rank'])
+            SongChange.objects.record(self, SongChange.PUBLISHED)
+            if flipped:
+                User.adjust_song_counters(self.user_id, published=1)
+                LibraryStats.objects.published(self.user_id, 1)
+        invalidate(self.pk)
     
     def unpublish(self):
-        """Unpublish the song."""
+        """Unpublish the song (a conditional UPDATE, as in publish())."""
         self.is_public = False
         self.published_at = None
-        self.save(update_fields=['is_public', 'published_at'])
+        self.hot_rank = 0
+        with transaction.atomic():
+            flipped = Song.objects.filter(pk=self.pk, is_public=True).update(is_public=False)
+            self.save(update_fields=['is_public', 'published_at', 'hot_rank'])
+            SongChange.objects.record(self, SongChange.UNPUBLISHED)
+            if flipped:
+                User.adjust_song_counters(self.user_id, published=-1)
+                LibraryStats.objects.published(self.user_id, -1)
+        invalidate(self.pk)
+
+
+class VoteManager(models.Manager):
+    """
+    Vote writes that keep the song's tallies in step.
+    
+    Each call is one transaction of conditional single-row statements and
+    F() deltas on the song, so concurrent votes never lose or double-count
+    (no read-modify-write of in-memory counters).
+    """
+    
+    def _apply(self, song_id, up=0, down=0):
+        """Apply tally deltas and return the song's (upvotes, downvotes, score)."""
+        songs = Song.objects.filter(pk=song_id)
+        if up or down:
+            songs.update(
+                upvotes=models.F('upvotes') + up,
+                downvotes=models.F('downvotes') + down,
+                score=models.F('score') + up - down,
+            )
+            if up:
+                LibraryStats.objects.upvoted(song_id, up)
+            invalidate(song_id)
+        return songs.values_list('upvotes', 'downvotes', 'score').get()
+    
+    def cast(self, user, song_id, vote_type):
+        """
+        Vote on a song, or change an existing vote.
+        
+        Returns:
+            tuple: The song's (upvotes, downvotes, score) afterwards
+        """
+        sign = 1 if vote_type == 'up' else -1
+        votes = self.filter(user=user, song_id=song_id)
+        with transaction.atomic():
+            for _ in range(2):
+                # Flip an opposite vote in place
+                if votes.exclude(vote_type=vote_type).update(vote_type=vote_type):
+                    return self._apply(song_id, up=sign, down=-sign)
+                try:
+                    with transaction.atomic():
+                        self.create(user=user, song_id=song_id, vote_type=vote_type)
+                except IntegrityError:
+                    # A vote exists: the same one (no-op), or a concurrent
+                    # opposite one created since the update (flip it)
+                    if votes.filter(vote_type=vote_type).exists():
+                        return self._apply(song_id)
+                    continue
+                return self._apply(song_id, up=int(sign > 0), down=int(sign < 0))
+            return self._apply(song_id)
+    
+    def retract(self, user, song_id):
+        """
+        Remove a user's vote on a song.
+        
+        Returns:
+            tuple: The song's (upvotes, downvotes, score), or None if there
+            was no vote
+        """
+        votes = self.filter(user=user, song_id=song_id)
+        with transaction.atomic():
+            if votes.filter(vote_type='up').delete()[0]:
+                return self._apply(song_id, up=-1)
+            if votes.filter(vote_type='down').delete()[0]:
+                return self._apply(song_id, down=-1)
+        return None
 
 
 class Vote(models.Model):
-    """Model for song votes."""
+    """Model for song votes.
+    
+    Write votes through Vote.objects.cast() / retract(), which keep the
+    song's upvotes, downvotes and score current.
+    """
     
     VOTE_TYPES = [
         ('up', 'Upvote'),
@@ -131,6 +344,8 @@ class Vote(models.Model):
     vote_type = models.CharField(max_length=4, choices=VOTE_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = VoteManager()
+    
     class Meta:
         unique_together = ['user', 'song']
         indexes = [
@@ -139,35 +354,119 @@ class Vote(models.Model):
     
     def __str__(self):
         return f"{self.user.username} {self.vote_type}voted {self.song.title}"
+
+
+class PlayEvent(models.Model):
+    """Append-only log of plays, written in bulk by the play counter."""
     
-    def save(self, *args, **kwargs):
-        """Update song vote counts when saving."""
-        # Check if this is an update or new vote
-        if self.pk:
-            old_vote = Vote.objects.get(pk=self.pk)
-            # Remove old vote count
-            if old_vote.vote_type == 'up':
-                self.song.upvotes -= 1
-            else:
-                self.song.downvotes -= 1
-        
-        # Add new vote count
-        if self.vote_type == 'up':
-            self.song.upvotes += 1
-        else:
-            self.song.downvotes += 1
-        
-        self.song.save(update_fields=['upvotes', 'downvotes'])
-        super().save(*args, **kwargs)
+    # No foreign key constraints: the log outlives deleted songs and users
+    song = models.ForeignKey(Song, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False,
+                             null=True, blank=True, related_name='+')
+    played_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['song', 'played_at']),
+        ]
+    
+    def __str__(self):
+        return f"Play of song {self.song_id} at {self.played_at}"
+
+
+class SongChangeManager(models.Manager):
+    """Writes to the song change log."""
+    
+    def record(self, song, action):
+        """Log a change of `song`; call inside the transaction that makes it."""
+        return self.create(
+            song_id=song.pk, user_id=song.user_id, action=action,
+            public=song.is_public or action == SongChange.UNPUBLISHED
+        )
+
+
+class SongChange(models.Model):
+    """
+    Change log behind the delta sync endpoint (SongChangesView).
+    
+    One row per song change; the auto-increment id is the change token.
+    Rows outlive their song (deletes leave a tombstone), so there are no
+    foreign key constraints. `public` marks changes visible to the public
+    feed: of a public song, or the unpublishing that removed it.
+    Compacted by apps/songs/changes.py.
+    """
+    
+    CREATED = 'created'
+    UPDATED = 'updated'
+    PUBLISHED = 'published'
+    UNPUBLISHED = 'unpublished'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (PUBLISHED, 'Published'),
+        (UNPUBLISHED, 'Unpublished'),
+        (DELETED, 'Deleted'),
+    ]
+    
+    song = models.ForeignKey(Song, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    action = models.CharField(max_length=12, choices=ACTION_CHOICES)
+    public = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    objects = SongChangeManager()
+    
+    class Meta:
+        indexes = [
+            # Reads: changes after a token, per owner or on the public feed
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['id'], condition=models.Q(public=True), name='songchange_public_idx'),
+            # Compaction: superseded rows and old tombstones
+            models.Index(fields=['song', 'public', 'id']),
+            models.Index(fields=['changed_at'], condition=models.Q(action='deleted'),
+                         name='songchange_tombstone_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Song {self.song_id} {self.action} at {self.changed_at}"
+
+
+class SongChangeCompaction(models.Model):
+    """A compaction run that removed tombstones; tokens below `horizon` must resync."""
+    
+    horizon = models.BigIntegerField()
+    removed = models.IntegerField(default=0)
+    ran_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Change log compacted to {self.horizon} at {self.ran_at}"
+
+
+class PlaylistQuerySet(models.QuerySet):
+    """Query helpers for playlist lists."""
+    
+    def with_summary(self, user):
+        """Annotate `song_count` and prefetch the first PLAYLIST_PREVIEW_SIZE items
+        (as `preview_items`), in two queries however many playlists there are.
+        Both leave out songs `user` cannot see: public songs and their own."""
+        visible = models.Q(items__song__is_public=True) | models.Q(items__song__user=user)
+        return self.annotate(song_count=models.Count('items', filter=visible)).prefetch_related(models.Prefetch(
+            'items',
+            queryset=PlaylistItem.objects.visible_to(user).select_related('song').only(
+                'playlist_id', 'position', *[f'song__{name}' for name in PLAYLIST_PREVIEW_FIELDS]
+            )[:PLAYLIST_PREVIEW_SIZE],
+            to_attr='preview_items'
+        ))
+
+
+class PlaylistItemQuerySet(models.QuerySet):
+    """Query helpers for playlist items."""
     
-    def delete(self, *args, **kwargs):
-        """Update song vote counts when deleting."""
-        if self.vote_type == 'up':
-            self.song.upvotes -= 1
-        else:
-            self.song.downvotes -= 1
-        self.song.save(update_fields=['upvotes', 'downvotes'])
-        super().delete(*args, **kwargs)
+    def visible_to(self, user):
+        """Items whose song `user` can see: public songs and their own. A song
+        made private after it was added stays in the playlist but is hidden."""
+        return self.filter(models.Q(song__is_public=True) | models.Q(song__user=user))
 
 
 class Playlist(models.Model):
@@ -176,14 +475,134 @@ class Playlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    songs = models.ManyToManyField(Song, related_name='playlists', blank=True)
+    songs = models.ManyToManyField(Song, through='PlaylistItem', related_name='playlists', blank=True)
     is_public = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = PlaylistQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.name} by {self.user.username}"
+    
+    def _touch(self):
+        Playlist.objects.filter(pk=self.pk).update(updated_at=timezone.now())
+    
+    def _position_at(self, index, exclude=None):
+        """
+        Position for an item placed at `index` (0-based, past the end appends)
+        among the other items. Renumbers the playlist if the neighbours at
+        that index have no room left between them.
+        """
+        items = self.items.exclude(pk=exclude) if exclude else self.items.all()
+        if index is None:
+            last = items.order_by('-position').values_list('position', flat=True).first()
+            return POSITION_GAP if last is None else last + POSITION_GAP
+        
+        start = max(index - 1, 0)
+        neighbours = list(items.values_list('position', flat=True)[start:index + 1])
+        before = neighbours.pop(0) if index > 0 and neighbours else None
+        after = neighbours[0] if neighbours else None
+        
+        if before is None and after is None:
+            # Empty playlist, or `index` past the end
+            return self._position_at(None, exclude)
+        if after is None:
+            return before + POSITION_GAP
+        if before is None:
+            return after - POSITION_GAP
+        if after - before > 1:
+            return (before + after) // 2
+        self.renumber()
+        return self._position_at(index, exclude)
+    
+    def renumber(self):
+        """Respace every item POSITION_GAP apart, keeping the order."""
+        items = list(self.items.only('id', 'position'))
+        for n, item in enumerate(items, start=1):
+            item.position = n * POSITION_GAP
+        PlaylistItem.objects.bulk_update(items, ['position'], batch_size=500)
+    
+    def add_song(self, song, index=None):
+        """
+        Insert a song at `index` (append by default). Writes one row, unless
+        the playlist has to be renumbered.
+        
+        Raises:
+            IntegrityError: The song is already in the playlist
+        """
+        with transaction.atomic():
+            item = PlaylistItem.objects.create(
+                playlist=self, song=song, position=self._position_at(index)
+            )
+            self._touch()
+        return item
+    
+    def move_item(self, item, index):
+        """Move an item to `index` among the other items."""
+        with transaction.atomic():
+            item.position = self._position_at(index, exclude=item.pk)
+            item.save(update_fields=['position'])
+            self._touch()
+        return item
+    
+    def remove_item(self, item):
+        """Remove an item; the others keep their positions."""
+        with transaction.atomic():
+            item.delete()
+            self._touch()
+    
+    def set_songs(self, song_ids):
+        """
+        Make the playlist hold exactly `song_ids`, in that order.
+        
+        Only rows that are removed, added or change position are written.
+        """
+        song_ids = list(dict.fromkeys(song_ids))
+        with transaction.atomic():
+            self.items.exclude(song_id__in=song_ids).delete()
+            existing = {item.song_id: item for item in self.items.only('id', 'song_id', 'position')}
+            added, moved = [], []
+            for n, song_id in enumerate(song_ids, start=1):
+                position = n * POSITION_GAP
+                item = existing.get(song_id)
+                if item is None:
+                    added.append(PlaylistItem(playlist=self, song_id=song_id, position=position))
+                elif item.position != position:
+                    item.position = position
+                    moved.append(item)
+            PlaylistItem.objects.bulk_update(moved, ['position'], batch_size=500)
+            PlaylistItem.objects.bulk_create(added, batch_size=500)
+
+
+class PlaylistItem(models.Model):
+    """
+    A song's place in a playlist.
+    
+    Positions are spaced POSITION_GAP apart, so adding or moving a song
+    writes a single row (midway between its new neighbours) and removing
+    one leaves the rest alone.
+    """
+    
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='items')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='playlist_items')
+    position = models.BigIntegerField()
+    added_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = PlaylistItemQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['position', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['playlist', 'song'], name='playlist_item_unique_song'),
+        ]
+        indexes = [
+            models.Index(fields=['playlist', 'position', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.song_id} in {self.playlist_id} at {self.position}"
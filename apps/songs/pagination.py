@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination for the song feed.
+
+PageNumberPagination costs a COUNT(*) over the filtered set plus an
+OFFSET scan, both linear in the depth of the page. Here a cursor holds
+the sort value and id of the last row seen, and the next page is a range
+scan from that position:
+
+    WHERE upvotes <= :v AND (upvotes < :v OR id < :id)
+    ORDER BY upvotes DESC, id DESC
+    LIMIT page_size + 1
+
+which the (-upvotes, -id) style feed indexes on Song answer in
+O(page size) at any depth. Ties on the sort value are broken by id, so
+pages are stable while rows are inserted.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count estimate for a queryset.
+
+    PostgreSQL: the planner's row estimate (EXPLAIN, nothing is scanned).
+    Other databases: an exact COUNT(*), fine at SQLite scale.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on (ordering field, id).
+
+    The ordering comes from the view's OrderingFilter (its first term),
+    so every `ordering_fields` value works in both directions. Pass
+    ``include_total=1`` for an `estimated_total` in the response.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    total_query_param = 'include_total'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.key = self.get_ordering(request, queryset, view)[0]
+        self.field = self.key.lstrip('-')
+        self.model = queryset.model
+
+        self.estimated_total = None
+        if request.query_params.get(self.total_query_param):
+            self.estimated_total = estimate_count(queryset)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+        # Scan direction: the ordering's, flipped when paging backwards
+        descending = self.key.startswith('-') != reverse
+        sign = '-' if descending else ''
+        queryset = queryset.annotate(cursor_position=F(self.field)).order_by(
+            f'{sign}{self.field}', f'{sign}pk'
+        )
+
+        if cursor is not None:
+            value, pk = cursor['value'], cursor['id']
+            if descending:
+                after = Q(**{f'{self.field}__lte': value}) & (Q(**{f'{self.field}__lt': value}) | Q(pk__lt=pk))
+            else:
+                after = Q(**{f'{self.field}__gte': value}) & (Q(**{f'{self.field}__gt': value}) | Q(pk__gt=pk))
+            queryset = queryset.filter(after)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        value = row.cursor_position
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()  # Keeps microseconds, unlike DjangoJSONEncoder
+        payload = json.dumps({'o': self.key, 'v': value, 'i': row.pk, 'r': int(reverse)})
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            data = json.loads(payload)
+            if data['o'] != self.key:
+                # Ordering changed since the cursor was issued
+                raise ValueError(data['o'])
+            value = data['v']
+            try:
+                value = self.model._meta.get_field(self.field).to_python(value)
+            except FieldDoesNotExist:
+                pass  # Annotation: compared as is
+            return {'value': value, 'id': int(data['i']), 'reverse': bool(data['r'])}
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.estimated_total is not None:
+            response['estimated_total'] = self.estimated_total
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['estimated_total'] = {
+            'type': 'integer',
+            'nullable': True,
+        }
+        return response_schema
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
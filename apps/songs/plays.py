@@ -0,0 +1,168 @@
+"""
+Write-coalescing play counter.
+
+Recording a play only touches memory: the per-song delta and a log entry
+are buffered in this process. Buffers are flushed in one transaction:
+
+- ``UPDATE ... SET play_count = play_count + CASE id ... END``, one
+  statement per BATCH_SIZE songs
+- bulk INSERTs into the append-only PlayEvent log
+
+every PLAY_FLUSH_INTERVAL seconds (PERIODIC_TASKS['flush_plays']), as
+soon as PLAY_FLUSH_THRESHOLD plays are pending, and at process exit. A
+popular song costs one row update per flush instead of one per play, and
+increments are never lost to read-modify-write races.
+
+Counts served by the API add this process's pending delta (see
+pending()); deltas still buffered in other processes show up after
+their next flush.
+
+Replays are counted at most PLAY_LIMIT_PER_LISTENER times per hour per
+song and listener (user, or client IP when anonymous), from in-memory
+token buckets (see counts_play), so the limit costs no query either.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from apps.accounts.throttling import LocalBuckets
+
+logger = logging.getLogger(__name__)
+
+# Songs per UPDATE statement and rows per INSERT
+BATCH_SIZE = 500
+
+
+class PlayCounter:
+    """Per-process buffer of play deltas and log entries."""
+
+    def __init__(self, threshold=None):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._deltas = {}
+        self._inflight = {}
+        self._events = []
+        self.threshold = threshold
+
+    def record(self, song_id, user_id=None):
+        """
+        Count one play of a song.
+
+        Returns:
+            int: Plays of this song pending in this process, this one included
+        """
+        with self._lock:
+            self._deltas[song_id] = self._deltas.get(song_id, 0) + 1
+            self._events.append((song_id, user_id, timezone.now()))
+            pending = self._deltas[song_id] + self._inflight.get(song_id, 0)
+            full = len(self._events) >= self._threshold()
+
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                pass  # Logged; the plays stay buffered for the next flush
+        return pending
+
+    def pending(self, song_id):
+        """Plays of a song recorded in this process but not yet committed."""
+        return self._deltas.get(song_id, 0) + self._inflight.get(song_id, 0)
+
+    def _threshold(self):
+        if self.threshold is None:
+            return settings.PLAY_FLUSH_THRESHOLD
+        return self.threshold
+
+    def flush(self):
+        """
+        Write pending plays to the database.
+
+        The buffers are swapped out under the lock, so plays recorded during
+        the write go to the next flush. If the write fails, the deltas are
+        merged back and retried on the next flush.
+
+        Returns:
+            int: Plays written
+        """
+        from apps.library.models import LibraryStats
+        from .models import PlayEvent, Song
+
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+                events, self._events = self._events, []
+                self._inflight = deltas
+            if not deltas:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    items = list(deltas.items())
+                    for start in range(0, len(items), BATCH_SIZE):
+                        batch = items[start:start + BATCH_SIZE]
+                        Song.objects.filter(pk__in=[song_id for song_id, _ in batch]).update(
+                            play_count=F('play_count') + Case(
+                                *[When(pk=song_id, then=Value(delta)) for song_id, delta in batch],
+                                default=Value(0), output_field=IntegerField()
+                            )
+                        )
+                    LibraryStats.objects.played(deltas)
+                    PlayEvent.objects.bulk_create(
+                        [PlayEvent(song_id=song_id, user_id=user_id, played_at=played_at)
+                         for song_id, user_id, played_at in events],
+                        batch_size=BATCH_SIZE
+                    )
+            except Exception as e:
+                with self._lock:
+                    for song_id, delta in deltas.items():
+                        self._deltas[song_id] = self._deltas.get(song_id, 0) + delta
+                    self._events[:0] = events
+                    self._inflight = {}
+                logger.error(f"[PLAYS] Flush of {len(events)} plays failed, will retry: {e}")
+                raise
+
+            with self._lock:
+                self._inflight = {}
+
+        logger.debug(f"[PLAYS] Flushed {len(events)} plays of {len(deltas)} songs")
+        return len(events)
+
+
+play_counter = PlayCounter()
+
+_listeners = LocalBuckets()
+_listeners.max_keys = 100000
+
+
+def counts_play(song_id, listener):
+    """
+    Whether a play of `song_id` by `listener` ('user:<id>' or 'ip:<address>')
+    is counted, or is over PLAY_LIMIT_PER_LISTENER for the hour.
+
+    Per process: with several server processes a listener can be counted
+    up to the limit in each.
+    """
+    limit = settings.PLAY_LIMIT_PER_LISTENER
+    if not limit:
+        return True
+    allowed, _ = _listeners.take(f"{song_id}:{listener}", limit, 3600, time.monotonic())
+    return allowed
+
+
+def flush_plays():
+    """Periodic task entry point (PERIODIC_TASKS['flush_plays'])."""
+    return play_counter.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        play_counter.flush()
+    except Exception:
+        pass  # Already logged; the process is going away
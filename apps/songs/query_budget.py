@@ -0,0 +1,66 @@
+"""
+Per-view SQL query budgets.
+
+Views declare how many queries each HTTP method may run, independent of
+page size:
+
+    class SongListView(QueryBudgetMixin, generics.ListAPIView):
+        query_budget = {'GET': 2}
+
+When QUERY_BUDGET_CHECKS is on (DEBUG by default) every request is counted
+and going over budget is logged, or raised with QUERY_BUDGET_STRICT. The
+QueryBudgetTests (run by ``manage.py test`` or the check_query_budgets
+command) request the endpoints at two page sizes with assertNumQueries,
+so an N+1 regression fails loudly.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more SQL queries than its budget allows."""
+
+
+class QueryLog:
+    """Execute wrapper collecting the SQL a connection runs."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+class QueryBudgetMixin:
+    """Count the queries of a DRF view and check them against query_budget."""
+
+    # {'GET': max queries}; methods not listed are not checked
+    query_budget = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        budget = self.query_budget.get(request.method)
+        if budget is None or not getattr(settings, 'QUERY_BUDGET_CHECKS', False):
+            return super().dispatch(request, *args, **kwargs)
+
+        queries = QueryLog()
+        with connection.execute_wrapper(queries):
+            response = super().dispatch(request, *args, **kwargs)
+
+        response['X-Query-Count'] = str(len(queries))
+        if len(queries) > budget:
+            message = (
+                f"{type(self).__name__} {request.method} ran {len(queries)} queries "
+                f"(budget {budget}): " + '; '.join(sql[:120] for sql in queries.statements)
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(f"[QUERY BUDGET] {message}")
+        return response
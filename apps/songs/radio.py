@@ -0,0 +1,270 @@
+"""
+Continuous radio streams of public songs, encoded once per station.
+
+A station (all songs, or one genre and/or mood) is a background thread
+that rotates through the trending public songs in shuffled order,
+crossfades them (audio.crossfade), encodes the result to MP3 once and
+appends the bytes to a ring buffer. Listeners only copy bytes out of
+the buffer, so a thousand listeners cost about the same CPU as one.
+
+The thread paces itself to real time, a few seconds ahead of the
+listeners. It starts with the first listener and stops once nobody has
+listened for RADIO_IDLE_SECONDS. Stations live in the serving process;
+with several processes each runs its own copy of a busy station.
+
+Listeners may ask for ICY metadata (``Icy-MetaData: 1``) to get the
+current title inline, as internet radio players expect.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .audio import BLOCK_FRAMES, SAMPLE_RATE, Mp3Encoder, crossfade, read_blocks
+
+logger = logging.getLogger(__name__)
+
+# Audio kept ahead of real time, and joined listeners start this far back
+LEAD_SECONDS = 2.0
+
+# Bytes of audio between ICY metadata blocks
+ICY_METAINT = 16000
+
+
+class RingBuffer:
+    """
+    Encoded chunks with sequence numbers; the oldest fall off the end.
+
+    Written by one station thread and read by any number of listeners,
+    each keeping the sequence number of the last chunk it sent.
+    """
+
+    def __init__(self, capacity):
+        self._chunks = deque(maxlen=capacity)
+        self._next = 0  # Sequence number of the next chunk
+        self._ready = threading.Condition()
+
+    def append(self, data):
+        with self._ready:
+            self._chunks.append(data)
+            self._next += 1
+            self._ready.notify_all()
+
+    def start(self, backlog):
+        """Sequence number a new listener starts at: `backlog` chunks back."""
+        with self._ready:
+            return max(self._next - backlog, self._next - len(self._chunks))
+
+    def read(self, position):
+        """
+        Chunks from `position` on, and the position after them.
+
+        A listener that fell behind the buffer skips to its oldest chunk.
+        """
+        with self._ready:
+            oldest = self._next - len(self._chunks)
+            position = max(position, oldest)
+            return list(self._chunks)[position - oldest:], self._next
+
+    def wait(self, position, timeout):
+        """Block until there are chunks at or after `position`."""
+        with self._ready:
+            return self._ready.wait_for(lambda: self._next > position, timeout)
+
+
+class Station:
+    """One encoded stream of a genre/mood selection."""
+
+    def __init__(self, genre='', mood=''):
+        self.genre = genre
+        self.mood = mood
+        self.fade_frames = int(settings.RADIO_CROSSFADE_SECONDS * SAMPLE_RATE)
+        chunks_per_second = SAMPLE_RATE / BLOCK_FRAMES
+        self.buffer = RingBuffer(int(settings.RADIO_BUFFER_SECONDS * chunks_per_second))
+        self.backlog = int(LEAD_SECONDS * chunks_per_second)
+        self.now_playing = None
+        self.listeners = 0
+        self.last_listener = time.monotonic()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"Radio-{self.name}", daemon=True)
+
+    @property
+    def name(self):
+        return '-'.join(part for part in (self.genre, self.mood) if part) or 'all'
+
+    def start(self):
+        self._thread.start()
+
+    def touch(self):
+        """Hold off idling while a listener connects."""
+        with self._lock:
+            self.last_listener = time.monotonic()
+
+    def join(self):
+        with self._lock:
+            self.listeners += 1
+        return self.buffer.start(self.backlog)
+
+    def leave(self):
+        with self._lock:
+            self.listeners -= 1
+            self.last_listener = time.monotonic()
+
+    def idle(self):
+        with self._lock:
+            return not self.listeners and time.monotonic() - self.last_listener > settings.RADIO_IDLE_SECONDS
+
+    def _playlist(self):
+        """Trending public songs of the selection, in shuffled order."""
+        from .models import PUBLIC_FEED, Song
+
+        songs = Song.objects.filter(PUBLIC_FEED).exclude(audio_file='').exclude(audio_file=None)
+        if self.genre:
+            songs = songs.filter(genre=self.genre)
+        if self.mood:
+            songs = songs.filter(mood=self.mood)
+        rows = list(songs.order_by('-hot_rank', '-id').values(
+            'id', 'title', 'user__username', 'audio_file'
+        )[:settings.RADIO_QUEUE_SIZE])
+        close_old_connections()
+        random.shuffle(rows)
+        return rows
+
+    def _tracks(self):
+        """Endless (song, blocks) pairs; stops when the station goes idle."""
+        while not self.stopped.is_set():
+            rows = self._playlist()
+            if not rows:
+                # Nothing to play yet: wait for songs (or idleness)
+                if self.idle() or self.stopped.wait(10):
+                    return
+                continue
+            for row in rows:
+                if self.stopped.is_set():
+                    return
+                yield row, read_blocks(row['audio_file'])
+
+    def _started(self, song, offset):
+        self.now_playing = {'id': song['id'], 'title': song['title'], 'artist': song['user__username']}
+        logger.info(f"[RADIO] {self.name}: playing song {song['id']}")
+
+    def _run(self):
+        encoder = Mp3Encoder()
+        started = time.monotonic()
+        sent = 0  # Frames encoded
+        try:
+            for block in crossfade(self._tracks(), self.fade_frames, self._started):
+                data = encoder.encode(block)
+                if data:
+                    self.buffer.append(data)
+                sent += len(block)
+
+                # Real-time pacing, LEAD_SECONDS ahead of the clock
+                ahead = sent / SAMPLE_RATE - (time.monotonic() - started)
+                if ahead > LEAD_SECONDS:
+                    time.sleep(ahead - LEAD_SECONDS)
+                if self.idle():
+                    self.stopped.set()
+                    break
+        except Exception as e:
+            logger.error(f"[RADIO] Station {self.name} failed: {e}", exc_info=True)
+        finally:
+            self.stopped.set()
+            _remove(self)
+            logger.info(f"[RADIO] Station {self.name} stopped")
+
+    def metadata(self):
+        """The ICY metadata block for the current song."""
+        title = ''
+        if self.now_playing:
+            title = f"{self.now_playing['artist']} - {self.now_playing['title']}"
+        text = f"StreamTitle='{title.replace(chr(39), '')}';".encode('utf-8')[:255 * 16]
+        blocks = -(-len(text) // 16)
+        return bytes([blocks]) + text.ljust(blocks * 16, b'\0')
+
+
+_stations = {}
+_stations_lock = threading.Lock()
+
+
+def _remove(station):
+    with _stations_lock:
+        if _stations.get((station.genre, station.mood)) is station:
+            del _stations[(station.genre, station.mood)]
+
+
+def get_station(genre='', mood=''):
+    """The running station for a selection, started if needed."""
+    with _stations_lock:
+        station = _stations.get((genre, mood))
+        if station is None or station.stopped.is_set():
+            station = Station(genre, mood)
+            _stations[(genre, mood)] = station
+            station.start()
+        station.touch()
+        return station
+
+
+def find_station(genre='', mood=''):
+    """The running station for a selection, or None."""
+    with _stations_lock:
+        return _stations.get((genre, mood))
+
+
+class Listener:
+    """
+    One client's view of a station: bytes from the ring buffer, with
+    ICY metadata inserted every ICY_METAINT bytes when `metadata` is set.
+    """
+
+    def __init__(self, station, metadata=False):
+        self.station = station
+        self.metadata = metadata
+        self.position = None
+        self._until_meta = ICY_METAINT
+
+    def _frame(self, data):
+        if not self.metadata:
+            return data
+        out = []
+        while len(data) >= self._until_meta:
+            out += [data[:self._until_meta], self.station.metadata()]
+            data = data[self._until_meta:]
+            self._until_meta = ICY_METAINT
+        self._until_meta -= len(data)
+        out.append(data)
+        return b''.join(out)
+
+    def _take(self):
+        chunks, self.position = self.station.buffer.read(self.position)
+        return self._frame(b''.join(chunks)) if chunks else b''
+
+    def __iter__(self):
+        self.position = self.station.join()
+        try:
+            while not self.station.stopped.is_set():
+                self.station.buffer.wait(self.position, timeout=5)
+                data = self._take()
+                if data:
+                    yield data
+        finally:
+            self.station.leave()
+
+    async def __aiter__(self):
+        poll = BLOCK_FRAMES / SAMPLE_RATE
+        self.position = self.station.join()
+        try:
+            while not self.station.stopped.is_set():
+                data = self._take()
+                if data:
+                    yield data
+                else:
+                    await asyncio.sleep(poll)
+        finally:
+            self.station.leave()
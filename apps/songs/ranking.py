@@ -0,0 +1,58 @@
+"""
+Time-decayed "hot" ranking for the public feed.
+
+    hot_rank = (score + 1) / (age_hours + 2) ** HOT_RANK_GRAVITY
+
+with age counted from publication. Ranks decay as songs age, so they are
+stored in Song.hot_rank and recomputed in bulk by a periodic task
+(PERIODIC_TASKS['hot_rank']) instead of at query time; ``ordering=hot``
+is then a plain scan of the partial (-hot_rank, -id) index over the
+public feed rows (condition PUBLIC_FEED, song_feed_hot_idx).
+"""
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def hot_rank(score, published_at, now=None, gravity=None):
+    """Hot rank of a song with `score` votes, published at `published_at`."""
+    if published_at is None:
+        return 0.0
+    now = now or timezone.now()
+    gravity = settings.HOT_RANK_GRAVITY if gravity is None else gravity
+    age_hours = max(0.0, (now - published_at).total_seconds() / 3600)
+    return (score + 1) / (age_hours + 2) ** gravity
+
+
+def recompute_hot_ranks(batch_size=BATCH_SIZE):
+    """
+    Recompute hot_rank for every public song.
+
+    Rows are read as (id, score, published_at) tuples and written back with
+    one bulk UPDATE per batch.
+
+    Returns:
+        int: Songs updated
+    """
+    from .models import Song
+
+    now = timezone.now()
+    public = Song.objects.filter(is_public=True).order_by('pk')
+    updated = 0
+    last_pk = 0
+    while True:
+        rows = list(public.filter(pk__gt=last_pk).values_list('pk', 'score', 'published_at')[:batch_size])
+        if not rows:
+            break
+        songs = [Song(pk=pk, hot_rank=hot_rank(score, published_at, now)) for pk, score, published_at in rows]
+        Song.objects.bulk_update(songs, ['hot_rank'])
+        updated += len(songs)
+        last_pk = rows[-1][0]
+
+    logger.info(f"[RANKING] Recomputed hot rank of {updated} songs")
+    return updated
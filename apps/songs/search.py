@@ -0,0 +1,192 @@
+"""
+Full-text search over song titles, descriptions and lyrics.
+
+The index lives in the database and is kept in sync by the database
+itself, so every write path (ORM saves, bulk updates, admin) is covered:
+
+- SQLite: an FTS5 external-content table (``songs_song_fts``, porter
+  stemming) maintained by insert/update/delete triggers, ranked by bm25
+- PostgreSQL: a stored generated ``search_vector`` tsvector column with
+  a GIN index, ranked by ts_rank_cd
+- Anything else (or SQLite built without FTS5): case-insensitive LIKE,
+  unranked
+
+The DDL is installed after every migrate (see SongsConfig.ready) and can
+be rebuilt with ``manage.py rebuild_search_index``. Titles weigh more
+than descriptions, which weigh more than lyrics.
+
+Search annotates `search_rank` (higher is better) and `search_snippet`,
+an excerpt with the matches wrapped in SNIPPET_START / SNIPPET_END
+markers (turned into <mark> tags after HTML-escaping, see serializers).
+"""
+import logging
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, CharField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'songs_song_fts'
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+SNIPPET_WORDS = 16
+SEARCH_CONFIG = 'english'
+
+_fts_available = {}
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, lyrics,
+        content='songs_song', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON songs_song BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, lyrics)
+        VALUES (new.id, new.title, new.description, new.lyrics);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON songs_song BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, lyrics)
+        VALUES ('delete', old.id, old.title, old.description, old.lyrics);
+    END""",
+    # Only reindex when indexed text changes, not on every vote or play
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description, lyrics ON songs_song BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, lyrics)
+        VALUES ('delete', old.id, old.title, old.description, old.lyrics);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, lyrics)
+        VALUES (new.id, new.title, new.description, new.lyrics);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    f"""ALTER TABLE songs_song ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(lyrics, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS songs_song_search_vector_gin ON songs_song USING gin (search_vector)",
+]
+
+
+def install(using='default', rebuild=False):
+    """
+    Create the search index for a database (idempotent).
+
+    Args:
+        using: Database alias
+        rebuild: Re-index every song (SQLite; the PostgreSQL column is
+            always current)
+
+    Returns:
+        str: Backend in use ('fts5', 'postgres' or 'like')
+    """
+    connection = connections[using]
+    if 'songs_song' not in connection.introspection.table_names():
+        return 'like'
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in _POSTGRES_DDL:
+                cursor.execute(statement)
+        return 'postgres'
+
+    if connection.vendor != 'sqlite':
+        return 'like'
+
+    created = FTS_TABLE not in connection.introspection.table_names()
+    try:
+        with connection.cursor() as cursor:
+            for statement in _SQLITE_DDL:
+                cursor.execute(statement)
+            if created or rebuild:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except Exception as e:
+        # SQLite compiled without FTS5
+        logger.warning(f"[SEARCH] FTS5 unavailable, falling back to LIKE search: {e}")
+        return 'like'
+    _fts_available.pop(using, None)
+    return 'fts5'
+
+
+def backend(using='default'):
+    """Search backend for a database: 'fts5', 'postgres' or 'like'."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor != 'sqlite':
+        return 'like'
+    if using not in _fts_available:
+        _fts_available[using] = FTS_TABLE in connection.introspection.table_names()
+    return 'fts5' if _fts_available[using] else 'like'
+
+
+def _terms(query):
+    return re.findall(r'\w+', query)
+
+
+def _fts5_query(terms):
+    """
+    Quote every term, so users cannot inject FTS5 syntax. The last term
+    also matches as a prefix of a stem, for search-as-you-type.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] = f'({quoted[-1]} OR {quoted[-1]}*)'
+    return ' AND '.join(quoted)
+
+
+def search(queryset, query):
+    """
+    Filter a Song queryset to matches for `query`, annotated with
+    `search_rank` and `search_snippet`.
+
+    The caller decides the ordering (relevance is '-search_rank').
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset.none()
+
+    engine = backend(queryset.db)
+
+    if engine == 'fts5':
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = songs_song.id', f'{FTS_TABLE} MATCH %s'],
+            params=[_fts5_query(terms)],
+        ).annotate(
+            # bm25 is lower-is-better; weights per column: title, description, lyrics
+            search_rank=RawSQL(f'-bm25({FTS_TABLE}, 10.0, 4.0, 1.0)', [], output_field=FloatField()),
+            search_snippet=RawSQL(
+                f'snippet({FTS_TABLE}, -1, %s, %s, %s, {SNIPPET_WORDS})',
+                [SNIPPET_START, SNIPPET_END, '…'], output_field=CharField()
+            ),
+        )
+
+    if engine == 'postgres':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        query = ' '.join(terms)
+        headline = (
+            f"ts_headline('{SEARCH_CONFIG}', "
+            f"coalesce(nullif(songs_song.description, ''), songs_song.lyrics), {tsquery}, %s)"
+        )
+        headline_options = (
+            f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, '
+            f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, MaxFragments=1'
+        )
+        return queryset.filter(
+            RawSQL(f'songs_song.search_vector @@ {tsquery}', [query], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank_cd(songs_song.search_vector, {tsquery})', [query],
+                               output_field=FloatField()),
+            search_snippet=RawSQL(headline, [query, headline_options], output_field=CharField()),
+        )
+
+    match = Q()
+    for term in terms:
+        match &= Q(title__icontains=term) | Q(description__icontains=term) | Q(lyrics__icontains=term)
+    return queryset.filter(match).annotate(
+        search_rank=Value(0.0, output_field=FloatField()),
+        search_snippet=Substr('lyrics', 1, 120),
+    )
@@ -1,16 +1,104 @@
 """
 Serializers for songs.
 """
+import os
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.html import escape
 from rest_framework import serializers
-from .models import Song, Vote, Playlist
-from apps.accounts.serializers import UserProfileSerializer
+from .models import PLAYLIST_PREVIEW_FIELDS, PLAYLIST_PREVIEW_SIZE, Song, SongChange, Vote, Playlist, PlaylistItem
+from .signing import signed_media_url
+from .plays import play_counter
+from .search import SNIPPET_END, SNIPPET_START
+from .storage import download_filename
+from apps.accounts.serializers import PublicUserSerializer, UserProfileSerializer
+from apps.library.models import LibraryStats
 
 
-class SongSerializer(serializers.ModelSerializer):
+class SignedFileMixin:
+    """Render a file as a signed, expiring media URL."""
+    
+    def get_download_filename(self, value):
+        return ''
+    
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = signed_media_url(value, filename=self.get_download_filename(value))
+        if url is None:
+            return None
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class SignedFileField(SignedFileMixin, serializers.FileField):
+    """File field serialized as a signed URL."""
+
+
+class SongAudioField(SignedFileField):
+    """Song audio as a signed URL with a human-friendly download name."""
+    
+    def get_download_filename(self, value):
+        ext = os.path.splitext(value.name)[1] or '.mp3'
+        return download_filename(value.instance, ext)
+
+
+class SignedImageField(SignedFileMixin, serializers.ImageField):
+    """Image field serialized as a signed URL."""
+
+
+class SparseFieldsetMixin:
+    """
+    Limit a serializer to the fields named in ``?fields=a,b,c``.
+    
+    Unknown names are ignored and 'id' is always included. Views narrow
+    their queryset to columns_for(request), so unrequested columns are
+    not read from the database either.
+    """
+    
+    # Model columns read by fields that are not simply their own column
+    # (relations are listed by name and joined)
+    field_columns = {}
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+    
+    @classmethod
+    def requested_fields(cls, request):
+        """Field names of the sparse fieldset, or None when not requested."""
+        if request is None or not request.query_params.get('fields'):
+            return None
+        names = {name.strip() for name in request.query_params['fields'].split(',')}
+        return (names & set(cls.Meta.fields)) | {'id'}
+    
+    @classmethod
+    def columns_for(cls, request):
+        """Model columns the (sparse) representation reads."""
+        names = cls.requested_fields(request) or cls.Meta.fields
+        model_fields = {f.name for f in cls.Meta.model._meta.concrete_fields}
+        columns = set()
+        for name in names:
+            columns.update(cls.field_columns.get(name, (name,) if name in model_fields else ()))
+        return columns
+
+
+class SongSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Song model."""
     
-    user = UserProfileSerializer(read_only=True)
-    score = serializers.IntegerField(read_only=True)
+    field_columns = {
+        'audio_file': ('audio_file', 'title', 'user'),  # Download name: 'Creator - Title.mp3'
+    }
+    
+    user = PublicUserSerializer(read_only=True)
+    audio_file = SongAudioField(read_only=True)
+    cover_image = SignedImageField(required=False, allow_null=True)
+    play_count = serializers.SerializerMethodField()
     user_vote = serializers.SerializerMethodField()
     
     class Meta:
@@ -19,18 +107,30 @@ class SongSerializer(serializers.ModelSerializer):
             'id', 'user', 'title', 'lyrics', 'description',
             'genre', 'mood', 'duration', 'temperature',
             'audio_file', 'cover_image', 'status', 'error_message',
+            'loudness_lufs', 'true_peak_dbtp', 'tempo_bpm',
             'is_public', 'published_at', 'play_count',
             'upvotes', 'downvotes', 'score', 'user_vote',
             'created_at', 'updated_at'
         ]
         read_only_fields = [
             'user', 'audio_file', 'status', 'error_message',
-            'play_count', 'upvotes', 'downvotes', 'published_at',
+            'loudness_lufs', 'true_peak_dbtp', 'tempo_bpm',
+            'play_count', 'upvotes', 'downvotes', 'score', 'published_at',
             'created_at', 'updated_at'
         ]
     
+    def get_play_count(self, obj):
+        """Stored count plus plays still buffered in this process."""
+        return obj.play_count + play_counter.pending(obj.pk)
+    
     def get_user_vote(self, obj):
-        """Get current user's vote on this song."""
+        """Get current user's vote on this song.
+        
+        Uses the `current_user_vote` annotation when the queryset came from
+        Song.objects.for_serialization(), so lists cost no extra queries.
+        """
+        if hasattr(obj, 'current_user_vote'):
+            return obj.current_user_vote
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             vote = Vote.objects.filter(user=request.user, song=obj).first()
@@ -38,6 +138,33 @@ class SongSerializer(serializers.ModelSerializer):
         return None
 
 
+class SongListSerializer(SongSerializer):
+    """
+    Compact song representation for lists.
+    
+    Leaves out the full lyrics, description and error message; cards show
+    `excerpt` instead (cut in SQL, see SongQuerySet.with_excerpt). The
+    full text is only served by the detail endpoint. While searching,
+    `search_snippet` holds the highlighted match.
+    """
+    
+    excerpt = serializers.CharField(read_only=True, default='')
+    search_snippet = serializers.SerializerMethodField()
+    
+    class Meta(SongSerializer.Meta):
+        fields = [
+            name for name in SongSerializer.Meta.fields
+            if name not in ('lyrics', 'description', 'error_message')
+        ] + ['excerpt', 'search_snippet']
+    
+    def get_search_snippet(self, obj):
+        """Matching excerpt when searching, HTML-escaped with matches in <mark>."""
+        snippet = getattr(obj, 'search_snippet', None)
+        if snippet is None:
+            return None
+        return escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
 class SongCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating songs."""
     
@@ -58,8 +185,11 @@ class SongCreateSerializer(serializers.ModelSerializer):
         # Set empty lyrics to empty string if not provided
         if 'lyrics' not in validated_data:
             validated_data['lyrics'] = ''
-        song = Song.objects.create(user=user, **validated_data)
-        user.increment_song_count()
+        with transaction.atomic():
+            song = Song.objects.create(user=user, **validated_data)
+            user.increment_song_count()
+            LibraryStats.objects.song_created(song)
+            SongChange.objects.record(song, SongChange.CREATED)
         return song
 
 
@@ -76,24 +206,33 @@ class VoteSerializer(serializers.ModelSerializer):
         song = validated_data['song']
         vote_type = validated_data['vote_type']
         
-        # Update or create vote
-        vote, created = Vote.objects.update_or_create(
-            user=user,
-            song=song,
-            defaults={'vote_type': vote_type}
-        )
+        # Keeps the song's tallies in step
+        Vote.objects.cast(user, song.pk, vote_type)
         
-        return vote
+        return Vote.objects.get(user=user, song=song)
+
+
+class PlaylistPreviewSerializer(serializers.ModelSerializer):
+    """The few song columns shown in a playlist preview."""
+    
+    class Meta:
+        model = Song
+        fields = list(PLAYLIST_PREVIEW_FIELDS)
 
 
 class PlaylistSerializer(serializers.ModelSerializer):
-    """Serializer for Playlists."""
+    """
+    Serializer for Playlists.
+    
+    Carries the song count and a short preview, not the songs themselves;
+    those are paged through the playlist's items endpoint.
+    """
     
     user = UserProfileSerializer(read_only=True)
-    songs = SongSerializer(many=True, read_only=True)
-    song_ids = serializers.PrimaryKeyRelatedField(
-        many=True, 
-        queryset=Song.objects.all(),
+    song_count = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
+    song_ids = serializers.ListField(
+        child=serializers.IntegerField(),
         write_only=True,
         required=False
     )
@@ -101,17 +240,44 @@ class PlaylistSerializer(serializers.ModelSerializer):
     class Meta:
         model = Playlist
         fields = [
-            'id', 'user', 'name', 'description', 'songs', 'song_ids',
+            'id', 'user', 'name', 'description', 'song_count', 'preview', 'song_ids',
             'is_public', 'created_at', 'updated_at'
         ]
         read_only_fields = ['user', 'created_at', 'updated_at']
     
+    def get_song_count(self, obj):
+        """Uses the `song_count` annotation from Playlist.objects.with_summary() when present."""
+        if hasattr(obj, 'song_count'):
+            return obj.song_count
+        return obj.items.visible_to(self.context['request'].user).count()
+    
+    def get_preview(self, obj):
+        items = getattr(obj, 'preview_items', None)
+        if items is None:
+            items = obj.items.visible_to(self.context['request'].user).select_related('song')[:PLAYLIST_PREVIEW_SIZE]
+        return PlaylistPreviewSerializer([item.song for item in items], many=True).data
+    
+    def validate_song_ids(self, value):
+        """
+        Check all ids in one query (a PrimaryKeyRelatedField runs one per id).
+        Only public songs and the user's own can be added, as with
+        PlaylistItemSerializer.
+        """
+        user = self.context['request'].user
+        found = set(Song.objects.filter(
+            Q(is_public=True) | Q(user=user), pk__in=value
+        ).values_list('pk', flat=True))
+        missing = [pk for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f'Invalid song ids: {missing}')
+        return value
+    
     def create(self, validated_data):
         song_ids = validated_data.pop('song_ids', [])
         user = self.context['request'].user
         playlist = Playlist.objects.create(user=user, **validated_data)
         if song_ids:
-            playlist.songs.set(song_ids)
+            playlist.set_songs(song_ids)
         return playlist
     
     def update(self, instance, validated_data):
@@ -121,6 +287,50 @@ class PlaylistSerializer(serializers.ModelSerializer):
         instance.save()
         
         if song_ids is not None:
-            instance.songs.set(song_ids)
+            instance.set_songs(song_ids)
         
         return instance
+
+
+class PlaylistItemSerializer(serializers.ModelSerializer):
+    """
+    A song in a playlist.
+    
+    Write `song_id` (and optionally `index`, 0-based) to add a song, or
+    just `index` to move an item.
+    """
+    
+    song = SongListSerializer(read_only=True)
+    song_id = serializers.PrimaryKeyRelatedField(
+        queryset=Song.objects.all(), source='song', write_only=True
+    )
+    index = serializers.IntegerField(min_value=0, write_only=True, required=False)
+    
+    class Meta:
+        model = PlaylistItem
+        fields = ['id', 'song', 'song_id', 'index', 'added_at']
+        read_only_fields = ['added_at']
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None:
+            # Public songs and the user's own
+            fields['song_id'].queryset = Song.objects.filter(
+                Q(is_public=True) | Q(user=request.user)
+            ).only('id')
+        if self.instance is not None:
+            fields['song_id'].read_only = True
+        return fields
+    
+    def create(self, validated_data):
+        playlist = self.context['playlist']
+        try:
+            return playlist.add_song(validated_data['song'], validated_data.get('index'))
+        except IntegrityError:
+            raise serializers.ValidationError({'song_id': ['Song is already in this playlist.']})
+    
+    def update(self, instance, validated_data):
+        if 'index' not in validated_data:
+            raise serializers.ValidationError({'index': ['This field is required.']})
+        return self.context['playlist'].move_item(instance, validated_data['index'])
@@ -0,0 +1,291 @@
+"""
+Media storage for song audio and covers.
+
+Two backends are available, selected with the MEDIA_STORAGE setting:
+
+- LocalMediaStorage: MEDIA_ROOT on local disk (single node)
+- S3MediaStorage: any S3-compatible object store (AWS S3, MinIO, moto),
+  so several generation nodes can share media without a shared filesystem
+
+Generated audio is content-addressed: files are named after the SHA-256 of
+their contents and sharded into two directory levels
+(``songs/ab/cd/abcd....mp3``), so no directory grows past a few hundred
+entries and identical audio is stored only once. Human-friendly names are
+only produced at download time (Content-Disposition).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import content_disposition_header
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@deconstructible
+class LocalMediaStorage(FileSystemStorage):
+    """Local-disk backend (MEDIA_ROOT)."""
+
+    def save_file(self, src_path, name):
+        """
+        Move a local file into storage under an exact name.
+
+        The file is moved next to its destination first (src may be on
+        another filesystem), then renamed into place atomically, so readers
+        never see a partially written file.
+        """
+        dest = self.path(name)
+        dest_dir = os.path.dirname(dest)
+        os.makedirs(dest_dir, exist_ok=True)
+
+        fd, staging = tempfile.mkstemp(dir=dest_dir, suffix='.part')
+        os.close(fd)
+        try:
+            shutil.move(src_path, staging)
+            os.replace(staging, dest)
+        except Exception:
+            if os.path.exists(staging):
+                os.unlink(staging)
+            raise
+        return name
+
+    def serve_url(self, name, filename='', as_attachment=False, expires_in=3600):
+        """Local files are served by Django/nginx directly, no redirect."""
+        return None
+
+
+@deconstructible
+class S3MediaStorage(Storage):
+    """
+    Object-store backend for S3-compatible services.
+
+    Large files are uploaded with multipart streaming uploads, parts sent
+    in parallel. Downloads are served as redirects to presigned GET URLs,
+    so audio bytes never pass through the app servers.
+
+    Requires boto3. Point endpoint_url at a local stand-in (MinIO or
+    ``moto_server``) for development and testing.
+    """
+
+    def __init__(self, bucket_name=None, endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, prefix='',
+                 multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024,
+                 max_concurrency=4):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise ImproperlyConfigured(
+                "MEDIA_STORAGE=s3 requires boto3. Install it with: pip install boto3"
+            )
+
+        if not bucket_name:
+            raise ImproperlyConfigured("MEDIA_S3_BUCKET must be set when MEDIA_STORAGE=s3")
+
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region_name or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+
+    def _key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _extra_args(self, name):
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return {'ContentType': content_type}
+
+    def _head(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _open(self, name, mode='rb'):
+        from botocore.exceptions import ClientError
+        spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 8)
+        try:
+            self.client.download_fileobj(
+                self.bucket_name, self._key(name), spool, Config=self.transfer_config
+            )
+        except ClientError as e:
+            spool.close()
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(name)
+            raise
+        spool.seek(0)
+        return File(spool, name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(
+            content, self.bucket_name, self._key(name),
+            ExtraArgs=self._extra_args(name), Config=self.transfer_config
+        )
+        return name
+
+    def save_file(self, src_path, name):
+        """
+        Upload a local file under an exact name, then remove the local copy.
+
+        Files above multipart_threshold are streamed from disk in
+        multipart_chunksize parts, max_concurrency parts at a time.
+        """
+        self.client.upload_file(
+            src_path, self.bucket_name, self._key(name),
+            ExtraArgs=self._extra_args(name), Config=self.transfer_config
+        )
+        os.unlink(src_path)
+        return name
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def get_modified_time(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['LastModified']
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip('/')
+        prefix = f"{prefix}/" if prefix else ''
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            for entry in page.get('CommonPrefixes', []):
+                directories.append(entry['Prefix'][len(prefix):].rstrip('/'))
+            for entry in page.get('Contents', []):
+                files.append(entry['Key'][len(prefix):])
+        return directories, files
+
+    def url(self, name):
+        # Point at the app's signed media route; that view redirects to a
+        # presigned URL (see serve_url)
+        return urljoin(settings.MEDIA_URL, filepath_to_uri(name))
+
+    def serve_url(self, name, filename='', as_attachment=False, expires_in=3600):
+        """Presigned GET URL for a redirect, valid for expires_in seconds."""
+        params = {'Bucket': self.bucket_name, 'Key': self._key(name)}
+        if filename:
+            params['ResponseContentDisposition'] = content_disposition_header(
+                as_attachment=as_attachment, filename=filename
+            )
+        return self.client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=max(60, int(expires_in))
+        )
+
+
+def content_hash(path):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sharded_name(digest, ext='.mp3', prefix='songs'):
+    """Storage name for a digest: '<prefix>/ab/cd/<digest><ext>'."""
+    return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def store_audio(src_path, ext='.mp3', prefix='songs'):
+    """
+    Move a finished audio file into content-addressed storage.
+
+    If a file with the same content already exists the source is discarded
+    and the existing file is reused.
+
+    Args:
+        src_path: Path of the generated (temporary) audio file
+        ext: File extension to store under
+        prefix: Top-level media directory
+
+    Returns:
+        tuple: (storage name, hex digest)
+    """
+    digest = content_hash(src_path)
+    name = sharded_name(digest, ext, prefix)
+
+    if default_storage.exists(name):
+        # Deduplicate: identical audio is already stored
+        os.unlink(src_path)
+        return name, digest
+
+    default_storage.save_file(src_path, name)
+    return name, digest
+
+
+def waveform_name(digest):
+    """Storage name of the waveform peaks for an audio digest."""
+    return sharded_name(digest, '.peaks', 'waveforms')
+
+
+def store_bytes(name, data):
+    """
+    Store `data` under exactly `name`, unless that file already exists.
+
+    For content-addressed names: Storage.save would rename a file that
+    appeared meanwhile to ``<name>_XXXX``, leaving an orphan that nothing
+    looks up. save_file writes the exact name, so a concurrent writer of
+    the same content just replaces it with identical bytes.
+    """
+    if default_storage.exists(name):
+        return name
+
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        default_storage.save_file(path, name)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+    return name
+
+
+def store_waveform(digest, peaks):
+    """Store packed waveform peaks for an audio digest (once per digest)."""
+    return store_bytes(waveform_name(digest), peaks)
+
+
+def download_filename(song, ext='.mp3'):
+    """Human-friendly download name: 'Creator - Title.mp3'."""
+    safe_title = re.sub(r'[<>:"/\\|?*]', '', song.title).strip()[:100]
+    return f"{song.user.username} - {safe_title}{ext}"
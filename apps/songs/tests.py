@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.library.models import LibraryStats
+
+from .models import Playlist, Song, Vote
+from .plays import play_counter
+from .views import SongDetailView, SongListView
+
+
+class PlaylistOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'x')
+        cls.songs = [
+            Song.objects.create(user=cls.user, title=f'Song {i}', genre='pop', status='completed', is_public=True)
+            for i in range(4)
+        ]
+
+    def order(self, playlist):
+        return list(playlist.items.values_list('song_id', flat=True))
+
+    def test_index_past_end_appends(self):
+        playlist = Playlist.objects.create(user=self.user, name='Mix')
+        for song in self.songs[:3]:
+            playlist.add_song(song)
+        playlist.add_song(self.songs[3], index=10)
+        self.assertEqual(self.order(playlist), [song.pk for song in self.songs])
+
+    def test_move_past_end(self):
+        playlist = Playlist.objects.create(user=self.user, name='Mix')
+        items = [playlist.add_song(song) for song in self.songs[:3]]
+        playlist.move_item(items[0], 5)
+        self.assertEqual(self.order(playlist), [self.songs[1].pk, self.songs[2].pk, self.songs[0].pk])
+
+
+class PlaylistAccessTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'x')
+        other = User.objects.create_user('creator', 'creator@example.com', 'x')
+        cls.public = Song.objects.create(user=other, title='Public', genre='pop', status='completed', is_public=True)
+        cls.private = Song.objects.create(user=other, title='Private', genre='pop', status='completed')
+        cls.own = Song.objects.create(user=cls.user, title='Draft', genre='pop', status='completed')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_song_ids_exclude_other_users_private_songs(self):
+        response = self.client.post('/api/songs/playlists/', {
+            'name': 'Mix', 'song_ids': [self.public.pk, self.private.pk]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Playlist.objects.exists())
+
+    def test_song_ids_accept_public_and_own_songs(self):
+        response = self.client.post('/api/songs/playlists/', {
+            'name': 'Mix', 'song_ids': [self.public.pk, self.own.pk]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_mixtape_leaves_out_other_users_private_songs(self):
+        playlist = Playlist.objects.create(user=self.user, name='Mix')
+        Song.objects.filter(pk=self.private.pk).update(audio_file='songs/ab/cd/abcd.mp3')
+        playlist.set_songs([self.private.pk])
+        response = self.client.get(f'/api/songs/playlists/{playlist.pk}/mixtape/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_songs_made_private_are_hidden_from_items_and_preview(self):
+        playlist = Playlist.objects.create(user=self.user, name='Mix')
+        playlist.set_songs([self.public.pk, self.own.pk])
+        Song.objects.filter(pk=self.public.pk).update(is_public=False)
+
+        response = self.client.get(f'/api/songs/playlists/{playlist.pk}/items/')
+        self.assertEqual([item['song']['id'] for item in response.data['results']], [self.own.pk])
+
+        response = self.client.get(f'/api/songs/playlists/{playlist.pk}/')
+        self.assertEqual(response.data['song_count'], 1)
+        self.assertEqual([song['id'] for song in response.data['preview']], [self.own.pk])
+
+
+class PublishTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'x')
+        cls.song = Song.objects.create(user=cls.user, title='Song', genre='pop', status='completed')
+
+    def published_counts(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        return user.total_songs_published, LibraryStats.objects.get(pk=self.user.pk).published_songs
+
+    def test_stale_copies_publish_once(self):
+        LibraryStats.objects.for_user(self.user)
+        first, second = Song.objects.get(pk=self.song.pk), Song.objects.get(pk=self.song.pk)
+        first.publish()
+        second.publish()
+        self.assertEqual(self.published_counts(), (1, 1))
+
+        first.unpublish()
+        second.unpublish()
+        self.assertEqual(self.published_counts(), (0, 0))
+
+
+
+class PlayLimitTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'x')
+        cls.song = Song.objects.create(user=user, title='Song', genre='pop', status='completed', is_public=True)
+
+    @override_settings(PLAY_LIMIT_PER_LISTENER=2)
+    def test_replays_past_the_limit_are_not_counted(self):
+        self.addCleanup(play_counter.flush)  # Written inside the test transaction
+        before = play_counter.pending(self.song.pk)
+        counts = [self.client.post(f'/api/songs/{self.song.pk}/play/').data['play_count'] for _ in range(4)]
+        self.assertEqual(counts, [before + 1, before + 2, before + 2, before + 2])
+
+        # Another listener has a bucket of their own
+        response = self.client.post(f'/api/songs/{self.song.pk}/play/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.data['play_count'], before + 3)
+
+
+# Measure the ORM path, not the anonymous page cache
+@override_settings(QUERY_BUDGET_CHECKS=True, QUERY_BUDGET_STRICT=False, SONG_CACHE_TTL=0)
+class QueryBudgetTests(TestCase):
+    """
+    Song endpoints run a fixed number of SQL queries, within their view's
+    query_budget: a full page must take exactly as many as a page of one
+    song (an N+1 shows up as the difference).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.listener = User.objects.create_user('budget-listener', 'listener@example.com', 'x')
+        cls.creators = [
+            User.objects.create_user(f'budget-creator-{i}', f'creator{i}@example.com', 'x',
+                                     llm_api_key='sk-not-a-real-key')
+            for i in range(3)
+        ]
+
+    def seed_songs(self, total):
+        """Top up to `total` public songs per creator, each voted on by the listener."""
+        for creator in self.creators:
+            for i in range(Song.objects.filter(user=creator).count(), total):
+                song = Song.objects.create(
+                    user=creator, title=f'Budget song {i}', lyrics='la la la', genre='pop',
+                    status='completed', is_public=True, audio_file=f'songs/budget-{creator.id}-{i}.mp3'
+                )
+                Vote.objects.create(user=self.listener, song=song, vote_type='up' if i % 2 else 'down')
+
+    def assert_fixed_queries(self, view, user, url):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+
+        self.seed_songs(1)
+        path = url()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(path).status_code, 200)
+        self.assertLessEqual(len(queries), view.query_budget['GET'])
+
+        self.seed_songs(settings.REST_FRAMEWORK.get('PAGE_SIZE') or 20)
+        path = url()
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(client.get(path).status_code, 200)
+
+    def test_songs_anonymous(self):
+        self.assert_fixed_queries(SongListView, None, lambda: '/api/songs/')
+
+    def test_songs_signed_in(self):
+        self.assert_fixed_queries(SongListView, self.listener, lambda: '/api/songs/')
+
+    def test_my_songs(self):
+        self.assert_fixed_queries(SongListView, self.creators[0], lambda: '/api/songs/?my_songs=1')
+
+    def test_song_detail(self):
+        self.assert_fixed_queries(
+            SongDetailView, self.listener, lambda: f"/api/songs/{Song.objects.latest('id').id}/"
+        )
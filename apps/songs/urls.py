@@ -5,13 +5,20 @@ from django.urls import path
 
 from .views import (
     SongListView,
+    SongChangesView,
+    RadioNowPlayingView,
+    radio_stream,
     SongDetailView,
     SongCreateView,
     SongPublishView,
     SongPlayView,
+    SongWaveformView,
     VoteView,
     PlaylistListCreateView,
     PlaylistDetailView,
+    PlaylistItemListView,
+    PlaylistItemDetailView,
+    PlaylistMixtapeView,
 )
 
 app_name = 'songs'
@@ -20,12 +27,20 @@ urlpatterns = [
     # Songs
     path('', SongListView.as_view(), name='song_list'),
     path('create/', SongCreateView.as_view(), name='song_create'),
+    path('changes/', SongChangesView.as_view(), name='song_changes'),
+    path('radio/', radio_stream, name='radio_stream'),
+    path('radio/now-playing/', RadioNowPlayingView.as_view(), name='radio_now_playing'),
     path('<int:pk>/', SongDetailView.as_view(), name='song_detail'),
     path('<int:pk>/publish/', SongPublishView.as_view(), name='song_publish'),
     path('<int:pk>/play/', SongPlayView.as_view(), name='song_play'),
+    path('<int:pk>/waveform/', SongWaveformView.as_view(), name='song_waveform'),
     path('<int:pk>/vote/', VoteView.as_view(), name='song_vote'),
     
     # Playlists
     path('playlists/', PlaylistListCreateView.as_view(), name='playlist_list'),
     path('playlists/<int:pk>/', PlaylistDetailView.as_view(), name='playlist_detail'),
+    path('playlists/<int:playlist_pk>/items/', PlaylistItemListView.as_view(), name='playlist_items'),
+    path('playlists/<int:playlist_pk>/items/<int:pk>/', PlaylistItemDetailView.as_view(),
+         name='playlist_item_detail'),
+    path('playlists/<int:playlist_pk>/mixtape/', PlaylistMixtapeView.as_view(), name='playlist_mixtape'),
 ]
@@ -1,40 +1,73 @@
 """
 Views for songs.
 """
-from rest_framework import generics, status, filters
+from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.throttling import BaseThrottle
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import content_disposition_header
+from django.views.static import serve
+import time
 
-from .models import Song, Vote, Playlist
+from apps.accounts.models import User
+from apps.accounts.throttling import RateLimitMixin
+from apps.library.models import LibraryStats
+
+from .caching import FEED, ConditionalCacheMixin, invalidate
+from .changes import changes_since, current_token, horizon
+from .models import Song, SongChange, Vote, Playlist, PlaylistItem
 from .serializers import (
     SongSerializer,
+    SongListSerializer,
     SongCreateSerializer,
     VoteSerializer,
-    PlaylistSerializer
+    PlaylistSerializer,
+    PlaylistItemSerializer
 )
-from .filters import SongFilter
+from .filters import FullTextSearchFilter, SongFilter, SongOrderingFilter
+from .pagination import KeysetPagination
+from .plays import counts_play, play_counter
+from .query_budget import QueryBudgetMixin
+from .radio import ICY_METAINT, Listener, find_station, get_station
+from .mixtape import MAX_CROSSFADE, audio_name, download_name, load_chapters, mixtape_key
+from .signing import signed_media_url, verify_signature
+from .storage import waveform_name
 
 
-class SongListView(generics.ListAPIView):
+class SongListView(QueryBudgetMixin, ConditionalCacheMixin, generics.ListAPIView):
     """List all public songs or user's songs."""
     
-    serializer_class = SongSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    serializer_class = SongListSerializer
+    pagination_class = KeysetPagination
+    query_budget = {'GET': 2}  # One page query, plus the estimate with ?include_total
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, SongOrderingFilter]
     filterset_class = SongFilter
-    search_fields = ['title', 'description', 'lyrics']
-    ordering_fields = ['created_at', 'upvotes', 'play_count', 'title']
+    ordering_fields = ['created_at', 'upvotes', 'score', 'hot_rank', 'play_count', 'title']
     ordering = ['-created_at']
+    cache_bypass_params = ['my_songs']
+    
+    def get_cache_scope(self):
+        return FEED
     
     def get_queryset(self):
+        columns = self.get_serializer_class().columns_for(self.request)
+        songs = Song.objects.for_serialization(self.request.user, columns).with_excerpt()
         if self.request.query_params.get('my_songs'):
             # User's own songs
-            return Song.objects.filter(user=self.request.user)
+            return songs.filter(user=self.request.user)
         else:
             # Public songs
-            return Song.objects.filter(is_public=True, status='completed')
+            return songs.filter(is_public=True, status='completed')
     
     def get_permissions(self):
         if self.request.query_params.get('my_songs'):
@@ -42,39 +75,79 @@ class SongListView(generics.ListAPIView):
         return [AllowAny()]
 
 
-class SongDetailView(generics.RetrieveUpdateDestroyAPIView):
-    """Retrieve, update, or delete a song."""
+class SongDetailView(QueryBudgetMixin, ConditionalCacheMixin, generics.RetrieveUpdateDestroyAPIView):
+    """Retrieve, update, or delete a song. Public songs can be read anonymously."""
     
     serializer_class = SongSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budget = {'GET': 1}
+    
+    def get_cache_scope(self):
+        return self.kwargs['pk']
     
     def get_queryset(self):
         # Users can only access their own songs or public songs
-        return Song.objects.filter(
-            Q(user=self.request.user) | Q(is_public=True)
-        )
+        columns = self.get_serializer_class().columns_for(self.request)
+        visible = Q(is_public=True)
+        if self.request.user.is_authenticated:
+            visible |= Q(user=self.request.user)
+        return Song.objects.for_serialization(self.request.user, columns).filter(visible)
+    
+    def perform_update(self, serializer):
+        song = serializer.instance
+        with transaction.atomic():
+            # Compare against the locked row, not the copy loaded before the
+            # transaction, so concurrent updates adjust the counters once
+            genre, is_public = Song.objects.select_for_update().filter(pk=song.pk).values_list(
+                'genre', 'is_public'
+            ).get()
+            super().perform_update(serializer)
+            LibraryStats.objects.genre_changed(song.user_id, genre, song.genre)
+            action = SongChange.UPDATED
+            if song.is_public != is_public:
+                delta = 1 if song.is_public else -1
+                User.adjust_song_counters(song.user_id, published=delta)
+                LibraryStats.objects.published(song.user_id, delta)
+                action = SongChange.PUBLISHED if song.is_public else SongChange.UNPUBLISHED
+            SongChange.objects.record(song, action)
+        invalidate(song.pk)
     
     def perform_destroy(self, instance):
         # Only owner can delete
-        if instance.user != self.request.user:
+        if instance.user_id != self.request.user.id:
             raise PermissionError("You can only delete your own songs.")
         instance.delete()
 
 
-class SongCreateView(generics.CreateAPIView):
-    """Create a new song."""
+class SongCreateView(RateLimitMixin, generics.CreateAPIView):
+    """Create a new song (rate-limited: RATE_LIMITS['generation'])."""
     
     serializer_class = SongCreateSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'generation'
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        song = serializer.save()
+        
+        # Daily compute quota, against the predicted cost of this song. The
+        # user row lock makes concurrent requests check one after the other,
+        # each seeing the songs the earlier ones reserved
+        from apps.generation.usage import quota_exceeded
+        with transaction.atomic():
+            User.objects.select_for_update().filter(pk=request.user.pk).values_list('pk', flat=True).get()
+            over = quota_exceeded(request.user.pk, serializer.validated_data.get('duration'))
+            if over:
+                return Response(
+                    {'error': 'Daily generation quota reached.', **over},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(over['retry_after'])}
+                )
+            song = serializer.save()
         
         # Trigger background generation task
         from apps.generation.tasks import generate_song_task
-        generate_song_task(song.id)
+        generate_song_task(song.id, song.user_id)
         
         return Response(
             SongSerializer(song).data,
@@ -122,16 +195,24 @@ class SongPublishView(APIView):
 
 
 class SongPlayView(APIView):
-    """Increment play count."""
+    """
+    Increment play count (buffered and written in bulk, see plays.py).
+    
+    Replays past PLAY_LIMIT_PER_LISTENER per hour are answered with the
+    count but not counted.
+    """
+    
+    permission_classes = [AllowAny]
     
     def post(self, request, pk):
+        songs = Song.objects.only('id', 'play_count')
         try:
-            song = Song.objects.get(pk=pk, is_public=True)
+            song = songs.get(pk=pk, is_public=True)
         except Song.DoesNotExist:
             # Also allow owner to play their own unpublished songs
             if request.user.is_authenticated:
                 try:
-                    song = Song.objects.get(pk=pk, user=request.user)
+                    song = songs.get(pk=pk, user=request.user)
                 except Song.DoesNotExist:
                     return Response(
                         {'error': 'Song not found.'},
@@ -143,8 +224,174 @@ class SongPlayView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
         
-        song.increment_play_count()
-        return Response({'play_count': song.play_count})
+        if request.user.is_authenticated:
+            listener = f"user:{request.user.pk}"
+        else:
+            listener = f"ip:{BaseThrottle().get_ident(request)}"
+        if not counts_play(song.pk, listener):
+            return Response({'play_count': song.play_count + play_counter.pending(song.pk)})
+        
+        play_count = song.increment_play_count(request.user)
+        return Response({'play_count': play_count})
+
+
+class SongWaveformView(APIView):
+    """
+    Precomputed waveform peaks (binary, see apps.generation.analysis).
+    
+    The peaks of an audio hash never change, but the song behind this URL
+    can get new audio or be made private, so responses are only cached
+    for SONG_CACHE_TTL seconds and then revalidated with the hash as ETag
+    (a 304 without reading storage).
+    """
+    
+    permission_classes = [AllowAny]
+    
+    def get(self, request, pk):
+        visible = Q(is_public=True)
+        if request.user.is_authenticated:
+            visible |= Q(user=request.user)
+        song = Song.objects.filter(visible, pk=pk).only('id', 'is_public', 'audio_hash').first()
+        if song is None or not song.audio_hash:
+            return Response(
+                {'error': 'Waveform not found.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        etag = f'"{song.audio_hash}"'
+        cache_control = f"{'public' if song.is_public else 'private'}, max-age={settings.SONG_CACHE_TTL}"
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            try:
+                with default_storage.open(waveform_name(song.audio_hash)) as f:
+                    peaks = f.read()
+            except FileNotFoundError:
+                return Response(
+                    {'error': 'Waveform not found.'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            response = HttpResponse(peaks, content_type='application/octet-stream')
+        
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+
+class SongChangesView(QueryBudgetMixin, APIView):
+    """
+    Delta sync: songs changed after a change token (see changes.py).
+    
+    ``?since=<token>`` returns the changes after it; without `since`,
+    only the current token (fetch the full list after taking it).
+    ``?scope=public`` syncs the public feed instead of the user's songs.
+    """
+    
+    query_budget = {'GET': 3}  # Horizon, log rows, their songs
+    max_limit = 500
+    
+    def get_permissions(self):
+        if self.request.query_params.get('scope') == 'public':
+            return [AllowAny()]
+        return [IsAuthenticated()]
+    
+    def get(self, request):
+        public = request.query_params.get('scope') == 'public'
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({'token': current_token(request.user, public), 'has_more': False, 'changes': []})
+        try:
+            since = int(since)
+            limit = min(int(request.query_params.get('limit', 100)), self.max_limit)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be integers.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if since < horizon():
+            return Response(
+                {'error': 'Change token expired; fetch the full list and sync from the new token.',
+                 'token': current_token(request.user, public)},
+                status=status.HTTP_410_GONE
+            )
+        
+        columns = SongListSerializer.columns_for(request)
+        changes, token, has_more = changes_since(since, request.user, public, max(limit, 1), columns)
+        songs = SongListSerializer(
+            [song for _, song in changes if song is not None], many=True, context={'request': request}
+        ).data
+        by_id = {song['id']: song for song in songs}
+        return Response({
+            'token': token,
+            'has_more': has_more,
+            'changes': [
+                {
+                    'token': change.pk,
+                    'action': change.action,
+                    'song_id': change.song_id,
+                    'changed_at': change.changed_at,
+                    'song': by_id.get(change.song_id),
+                }
+                for change, _ in changes
+            ],
+        })
+
+
+def _radio_selection(params):
+    """(genre, mood) from query parameters, or raise ValueError."""
+    genre, mood = params.get('genre', ''), params.get('mood', '')
+    if genre and genre not in dict(Song.GENRE_CHOICES):
+        raise ValueError(f'Unknown genre: {genre}')
+    if mood and mood not in dict(Song.MOOD_CHOICES):
+        raise ValueError(f'Unknown mood: {mood}')
+    return genre, mood
+
+
+def radio_stream(request):
+    """
+    Continuous MP3 stream of public songs, optionally by ``?genre=`` and ``?mood=``.
+    
+    Every listener of a station gets the same encoded bytes (see radio.py).
+    Sends ICY metadata (the current title) when asked with ``Icy-MetaData: 1``.
+    """
+    try:
+        genre, mood = _radio_selection(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    station = get_station(genre, mood)
+    listener = Listener(station, metadata=request.headers.get('Icy-MetaData') == '1')
+    # Under WSGI a listener holds a worker thread; ASGI serves it from the event loop
+    stream = aiter(listener) if isinstance(request, ASGIRequest) else iter(listener)
+    response = StreamingHttpResponse(stream, content_type='audio/mpeg')
+    response['Cache-Control'] = 'no-cache, no-store'
+    response['X-Accel-Buffering'] = 'no'
+    response['icy-name'] = f'Retro Cassette Radio ({station.name})'
+    if listener.metadata:
+        response['icy-metaint'] = str(ICY_METAINT)
+    return response
+
+
+class RadioNowPlayingView(APIView):
+    """Current song and listener count of a running radio station."""
+    
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        try:
+            genre, mood = _radio_selection(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        station = find_station(genre, mood)
+        if station is None:
+            return Response({'error': 'Station is not on air.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'station': station.name,
+            'listeners': station.listeners,
+            'now_playing': station.now_playing,
+        })
 
 
 class VoteView(APIView):
@@ -153,9 +400,7 @@ class VoteView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        try:
-            song = Song.objects.get(pk=pk, is_public=True)
-        except Song.DoesNotExist:
+        if not Song.objects.filter(pk=pk, is_public=True).exists():
             return Response(
                 {'error': 'Song not found.'},
                 status=status.HTTP_404_NOT_FOUND
@@ -168,41 +413,31 @@ class VoteView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        serializer = VoteSerializer(
-            data={'song': pk, 'vote_type': vote_type},
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        
-        # Refresh song data
-        song.refresh_from_db()
+        upvotes, downvotes, score = Vote.objects.cast(request.user, pk, vote_type)
         
         return Response({
             'message': 'Vote recorded.',
-            'upvotes': song.upvotes,
-            'downvotes': song.downvotes,
-            'score': song.score
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'score': score
         })
     
     def delete(self, request, pk):
         """Remove vote."""
-        try:
-            vote = Vote.objects.get(user=request.user, song_id=pk)
-            vote.delete()
-            
-            song = Song.objects.get(pk=pk)
-            return Response({
-                'message': 'Vote removed.',
-                'upvotes': song.upvotes,
-                'downvotes': song.downvotes,
-                'score': song.score
-            })
-        except Vote.DoesNotExist:
+        tallies = Vote.objects.retract(request.user, pk)
+        if tallies is None:
             return Response(
                 {'error': 'Vote not found.'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        upvotes, downvotes, score = tallies
+        return Response({
+            'message': 'Vote removed.',
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'score': score
+        })
 
 
 class PlaylistListCreateView(generics.ListCreateAPIView):
@@ -212,7 +447,10 @@ class PlaylistListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        user = self.request.user
+        return Playlist.objects.filter(user=user).select_related('user').with_summary(user).order_by(
+            '-created_at', '-id'
+        )
 
 
 class PlaylistDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -222,4 +460,197 @@ class PlaylistDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        user = self.request.user
+        return Playlist.objects.filter(user=user).select_related('user').with_summary(user)
+
+
+class PlaylistItemsMixin:
+    """Items of one of the user's playlists (URL kwarg `playlist_pk`)."""
+    
+    serializer_class = PlaylistItemSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_playlist(self):
+        if not hasattr(self, '_playlist'):
+            self._playlist = get_object_or_404(
+                Playlist.objects.only('id'), pk=self.kwargs['playlist_pk'], user=self.request.user
+            )
+        return self._playlist
+    
+    def get_queryset(self):
+        return PlaylistItem.objects.filter(playlist=self.get_playlist())
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['playlist'] = self.get_playlist()
+        return context
+    
+    def load_songs(self, items):
+        """Attach each item's song, loaded as the compact list representation in one query."""
+        columns = SongListSerializer.columns_for(None)
+        user = self.request.user
+        songs = Song.objects.for_serialization(user, columns).filter(
+            Q(is_public=True) | Q(user=user)
+        ).with_excerpt().in_bulk(
+            [item.song_id for item in items]
+        )
+        items = [item for item in items if item.song_id in songs]
+        for item in items:
+            item.song = songs[item.song_id]
+        return items
+    
+    def perform_create(self, serializer):
+        serializer.save()
+        self.load_songs([serializer.instance])
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        self.load_songs([serializer.instance])
+
+
+class PlaylistItemPagination(KeysetPagination):
+    """Playlist items in playlist order."""
+    
+    ordering = 'position'
+
+
+class PlaylistItemListView(QueryBudgetMixin, PlaylistItemsMixin, generics.ListCreateAPIView):
+    """Page through a playlist in order, or add a song to it."""
+    
+    pagination_class = PlaylistItemPagination
+    query_budget = {'GET': 3}  # Playlist, page of items, their songs
+    
+    def list(self, request, *args, **kwargs):
+        items = self.paginate_queryset(
+            self.get_queryset().visible_to(request.user).only('id', 'song_id', 'position', 'added_at')
+        )
+        serializer = self.get_serializer(self.load_songs(items), many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class PlaylistItemDetailView(PlaylistItemsMixin, generics.UpdateAPIView, generics.DestroyAPIView):
+    """Move a song within a playlist (PATCH `index`), or remove it."""
+    
+    http_method_names = ['patch', 'delete', 'options']
+    
+    def perform_destroy(self, instance):
+        self.get_playlist().remove_item(instance)
+
+
+class PlaylistMixtapeView(RateLimitMixin, APIView):
+    """
+    The playlist rendered as one audio file with chapters (see mixtape.py).
+    
+    ``?crossfade=<seconds>`` overlaps the songs (rounded to whole seconds);
+    0 joins them gapless. Answers 202 while the render runs; poll until it
+    is 200. Only requests that start a render are rate-limited
+    (RATE_LIMITS['mixtape']).
+    """
+    
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'mixtape'
+    
+    def check_throttles(self, request):
+        # Polls and cached renders are free; see get()
+        pass
+    
+    def get(self, request, playlist_pk):
+        playlist = get_object_or_404(Playlist.objects.only('id', 'name'), pk=playlist_pk, user=request.user)
+        try:
+            crossfade = float(request.query_params.get('crossfade', settings.MIXTAPE_CROSSFADE_SECONDS))
+        except ValueError:
+            crossfade = -1
+        if not 0 <= crossfade <= MAX_CROSSFADE:
+            return Response(
+                {'error': f'crossfade must be between 0 and {MAX_CROSSFADE} seconds.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Whole seconds, so near-identical values share one cached render
+        crossfade = round(crossfade)
+        
+        # Songs made private since they were added are left out
+        items = playlist.items.filter(
+            Q(song__is_public=True) | Q(song__user=request.user), song__status='completed'
+        ).exclude(song__audio_file='').order_by(
+            'position', 'id'
+        ).values('song_id', 'song__title', 'song__user__username', 'song__audio_file', 'song__audio_hash')
+        tracks = [
+            {
+                'id': item['song_id'],
+                'title': item['song__title'],
+                'artist': item['song__user__username'],
+                'audio_file': item['song__audio_file'],
+                'audio_hash': item['song__audio_hash'],
+            }
+            for item in items
+        ]
+        if not tracks:
+            return Response(
+                {'error': 'Playlist has no finished songs.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        key = mixtape_key(tracks, crossfade)
+        chapters = load_chapters(key)
+        if chapters is None:
+            from apps.generation.tasks import mixtape_queued, render_mixtape_task
+            if not mixtape_queued(key):
+                super().check_throttles(request)
+                if not render_mixtape_task(key, request.user.pk, playlist.name, tracks, crossfade):
+                    return Response(
+                        {'error': 'Too many mixtapes rendering; try again when they are done.'},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS
+                    )
+            return Response({'status': 'rendering', 'key': key}, status=status.HTTP_202_ACCEPTED)
+        
+        # Signed like song audio, and served by the same media route
+        audio = FieldFile(None, Song._meta.get_field('audio_file'), audio_name(key))
+        return Response({
+            'status': 'ready',
+            'key': key,
+            'url': request.build_absolute_uri(signed_media_url(audio, filename=download_name(playlist.name))),
+            'duration': chapters[-1]['end_ms'] / 1000 if chapters else 0,
+            'chapters': chapters,
+        })
+
+
+def serve_signed_media(request, path):
+    """
+    Serve a song's audio or cover (or a mixtape) from a signed, expiring URL.
+    
+    Authorization is a constant-time HMAC check of the path and expiry,
+    so no session/JWT authentication or database query is needed. Object
+    storage backends answer with a redirect to a presigned URL; local files
+    are sent by Django, or handed off to the front proxy when
+    MEDIA_ACCEL_REDIRECT is set (nginx X-Accel-Redirect).
+    """
+    expires = request.GET.get('expires')
+    filename = request.GET.get('filename', '')
+    if not verify_signature(settings.MEDIA_SIGNING_KEY, path, expires,
+                            request.GET.get('signature'), filename):
+        return HttpResponseForbidden('Invalid or expired media signature.')
+    
+    max_age = max(0, int(expires) - int(time.time()))
+    as_attachment = bool(request.GET.get('download'))
+    
+    redirect_url = default_storage.serve_url(
+        path, filename=filename, as_attachment=as_attachment, expires_in=max_age
+    )
+    if redirect_url:
+        response = HttpResponseRedirect(redirect_url)
+    elif settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse()
+        del response['Content-Type']  # Let nginx pick it from the file
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + path
+    else:
+        response = serve(request, path, document_root=default_storage.location)
+    
+    # Storage names are content hashes; the friendly name is only
+    # produced here, at download time
+    if filename and not redirect_url:
+        response['Content-Disposition'] = content_disposition_header(
+            as_attachment=as_attachment, filename=filename
+        )
+    
+    response['Cache-Control'] = f'private, max-age={max_age}'
+    return response
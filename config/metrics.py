@@ -0,0 +1,324 @@
+"""
+Process metrics in the Prometheus text format, served at /metrics.
+
+Counters and histograms are recorded into a per-thread shard: each
+thread only ever writes its own dict, so recording is a dict update with
+no lock and worker threads never wait on each other or on a scrape. A
+scrape adds the shards together; shards of threads that have exited are
+folded into a retired total first. Gauges are read when scraped.
+
+    SONGS.inc('completed')
+    DIFFUSION_SECONDS.observe(41.7)
+
+What is measured:
+
+- generation_queue_depth, generation_workers, generation_workers_busy
+- generation_lyrics_seconds{provider}, generation_diffusion_seconds,
+  generation_encode_seconds, generation_song_seconds (submission to
+  completed song)
+- generation_songs_total{status}
+- http_request_seconds{view,method}, http_requests_total{view,method,status}
+  and http_request_queries{view,method}, for every request (MetricsMiddleware)
+- db_queries_total{alias}, every query of the process, workers included
+
+Values are per process: with several server processes, scrape each one.
+The endpoint is off unless METRICS_ENABLED is set, and requires
+``Authorization: Bearer <METRICS_TOKEN>``; only with DEBUG on may the
+token be left empty.
+"""
+import bisect
+import hmac
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# A new shard sweeps out exited threads' shards once this many are registered
+SWEEP_SHARDS = 64
+
+_registry = []
+_shards = []  # (thread, shard) of every thread that has recorded
+_retired = {}  # Totals of exited threads
+_new_shards = 0
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _merge(into, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            total = into.get(key)
+            into[key] = value[:] if total is None else [a + b for a, b in zip(total, value)]
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _sweep():
+    """Fold the shards of exited threads into _retired. Called with _shards_lock held."""
+    alive = []
+    for thread, shard in _shards:
+        if thread.is_alive():
+            alive.append((thread, shard))
+        else:
+            _merge(_retired, shard)
+    _shards[:] = alive
+
+
+def _shard():
+    """This thread's dict of (metric, labels) -> value."""
+    try:
+        return _local.shard
+    except AttributeError:
+        global _new_shards
+        shard = _local.shard = {}
+        with _shards_lock:
+            _new_shards += 1
+            if _new_shards % SWEEP_SHARDS == 0:
+                # Thread-per-request servers would otherwise grow the list without bound
+                _sweep()
+            _shards.append((threading.current_thread(), shard))
+        return shard
+
+
+def _snapshot():
+    """Sum of all shards."""
+    with _shards_lock:
+        _sweep()
+        totals = dict(_retired)
+        shards = [shard for _, shard in _shards]
+    for shard in shards:
+        # dict.copy() is a single step under the GIL, so a thread writing
+        # its shard meanwhile cannot break the iteration
+        _merge(totals, shard.copy())
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with a fixed tuple of label names."""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    """A monotonically increasing count."""
+
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = _shard()
+        key = (self, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def expose(self, totals):
+        lines = self.header()
+        for (metric, labels), value in sorted(totals.items(), key=_sort_key):
+            if metric is self:
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets (upper bounds in seconds, or units)."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        shard = _shard()
+        key = (self, labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One count per bucket, one for +Inf, then the sum
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def expose(self, totals):
+        lines = self.header()
+        for (metric, labels), counts in sorted(totals.items(), key=_sort_key):
+            if metric is not self:
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(counts[-1])}")
+            # The count is the +Inf bucket, so the two always agree
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """A value read from `read()` at scrape time."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def expose(self, totals):
+        return self.header() + [f"{self.name} {_format_value(self.read())}"]
+
+
+def _sort_key(item):
+    (metric, labels), _ = item
+    return tuple(str(label) for label in labels)
+
+
+def render():
+    """The text exposition of every registered metric."""
+    totals = _snapshot()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.expose(totals))
+    return '\n'.join(lines) + '\n'
+
+
+def _task_manager():
+    # The web process may not run workers; never start them from a scrape
+    from apps.generation import task_manager
+    return task_manager._task_manager
+
+
+def _queue_depth():
+    manager = _task_manager()
+    return manager.get_queue_size() if manager else 0
+
+
+def _workers():
+    manager = _task_manager()
+    return len(manager.workers) if manager else 0
+
+
+def _workers_busy():
+    manager = _task_manager()
+    return manager.get_busy_count() if manager else 0
+
+
+# Seconds; LLM calls and diffusion run for seconds to minutes, requests for milliseconds
+STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+QUEUE_DEPTH = Gauge('generation_queue_depth', 'Jobs waiting for a worker.', _queue_depth)
+WORKERS = Gauge('generation_workers', 'Worker threads of this process.', _workers)
+WORKERS_BUSY = Gauge('generation_workers_busy', 'Worker threads running a job.', _workers_busy)
+LYRICS_SECONDS = Histogram(
+    'generation_lyrics_seconds', 'Lyrics generation time by LLM provider.', STAGE_BUCKETS, ['provider']
+)
+DIFFUSION_SECONDS = Histogram('generation_diffusion_seconds', 'Music model (diffusion) time.', STAGE_BUCKETS)
+ENCODE_SECONDS = Histogram(
+    'generation_encode_seconds', 'Time after diffusion: effects, analysis, MP3 encoding and storage.',
+    STAGE_BUCKETS
+)
+SONG_SECONDS = Histogram(
+    'generation_song_seconds', 'Time from song submission to completed song, queueing included.', STAGE_BUCKETS
+)
+SONGS = Counter('generation_songs_total', 'Finished generation jobs by outcome.', ['status'])
+REQUEST_SECONDS = Histogram(
+    'http_request_seconds', 'Request latency by view.', REQUEST_BUCKETS, ['view', 'method']
+)
+REQUESTS = Counter('http_requests_total', 'Responses by view and status code.', ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'http_request_queries', 'SQL queries per request by view.', QUERY_BUCKETS, ['view', 'method']
+)
+DB_QUERIES = Counter('db_queries_total', 'SQL queries executed by this process.', ['alias'])
+
+
+def _count_query(execute, sql, params, many, context):
+    DB_QUERIES.inc(context['connection'].alias)
+    _local.queries = getattr(_local, 'queries', 0) + 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_counter(sender, connection, **kwargs):
+    """Count the queries of every new database connection."""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+# Connections opened before this module was imported (checks at startup)
+for _connection in connections.all(initialized_only=True):
+    _install_query_counter(None, _connection)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    return view.__name__ if view else match.view_name or match.func.__name__
+
+
+class MetricsMiddleware:
+    """Record latency, status and query count of every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = getattr(_local, 'queries', 0)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view = _view_name(request)
+        REQUEST_SECONDS.observe(elapsed, view, request.method)
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(getattr(_local, 'queries', 0) - queries, view, request.method)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        # Never public in production, even when enabled by mistake
+        return HttpResponse('METRICS_TOKEN is not set\n', status=401, content_type='text/plain')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -5,6 +5,7 @@ Django settings for Retro Cassette Music Generator project.
 from pathlib import Path
 import environ
 import os
+import tempfile
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',  # First, so it times the whole request
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -84,6 +86,13 @@ DATABASES = {
     'default': env.db('DATABASE_URL', default='sqlite:///db.sqlite3')
 }
 
+# Cache (song page cache and its version stamps, see apps/songs/caching.py)
+# Use a shared backend (e.g. redis://localhost:6379/1, requires redis) when
+# running more than one process; the default memory cache is per process
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -118,6 +127,42 @@ STATIC_ROOT = env('STATIC_ROOT', default=BASE_DIR / 'staticfiles')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = env('MEDIA_ROOT', default=BASE_DIR / 'media')
 
+# Signed media URLs (song audio and covers)
+# URLs are valid for between MEDIA_URL_TTL and 2 * MEDIA_URL_TTL seconds
+MEDIA_SIGNING_KEY = env('MEDIA_SIGNING_KEY', default=SECRET_KEY)
+MEDIA_URL_TTL = env.int('MEDIA_URL_TTL', default=3600)
+# Internal nginx location for X-Accel-Redirect (e.g. '/protected-media/'), empty to serve from Django
+MEDIA_ACCEL_REDIRECT = env('MEDIA_ACCEL_REDIRECT', default='')
+
+# Media storage backend
+# local: MEDIA_ROOT on local disk (default)
+# s3: S3-compatible object store (AWS S3, MinIO, moto) - requires boto3
+MEDIA_STORAGE = env('MEDIA_STORAGE', default='local')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'apps.songs.storage.LocalMediaStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+if MEDIA_STORAGE == 's3':
+    STORAGES['default'] = {
+        'BACKEND': 'apps.songs.storage.S3MediaStorage',
+        'OPTIONS': {
+            'bucket_name': env('MEDIA_S3_BUCKET', default=None),
+            'endpoint_url': env('MEDIA_S3_ENDPOINT_URL', default=None),  # e.g. http://localhost:9000 for MinIO
+            'region_name': env('MEDIA_S3_REGION', default=None),
+            'access_key': env('MEDIA_S3_ACCESS_KEY', default=None),
+            'secret_key': env('MEDIA_S3_SECRET_KEY', default=None),
+            'prefix': env('MEDIA_S3_PREFIX', default=''),
+            'multipart_chunksize': env.int('MEDIA_S3_PART_SIZE', default=8 * 1024 * 1024),
+            'max_concurrency': env.int('MEDIA_S3_MAX_CONCURRENCY', default=4),
+        },
+    }
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -130,10 +175,30 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson-backed JSON (config/renderers.py); falls back to DRF's json module path
+    'DEFAULT_RENDERER_CLASSES': (
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Proxies in front of the app that append to X-Forwarded-For (1 behind
+    # nginx). Per-IP rate limits read the client address from that header;
+    # with 0 they use REMOTE_ADDR, as a header a client sends is not trusted.
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0),
 }
 
+# SQL query budgets per view (apps/songs/query_budget.py)
+# Checks count queries on every request, so they are on in DEBUG only by default
+QUERY_BUDGET_CHECKS = env.bool('QUERY_BUDGET_CHECKS', default=DEBUG)
+# Raise instead of logging a warning when a view goes over budget
+QUERY_BUDGET_STRICT = env.bool('QUERY_BUDGET_STRICT', default=False)
+
 # JWT Settings
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -181,8 +246,151 @@ FIELD_ENCRYPTION_KEY = env('ENCRYPTION_KEY', default='8xyRCz-6DvW4H7nL9qN2Y3mP5t
 # Using simple threading for async tasks (no external services needed)
 MAX_CONCURRENT_TASKS = env.int('MAX_CONCURRENT_TASKS', default=3)
 
+# Per-job scratch directories for temporary WAV/MP3 files
+GENERATION_SCRATCH_DIR = env('GENERATION_SCRATCH_DIR', default=os.path.join(tempfile.gettempdir(), 'retro-cassette-scratch'))
+
+# Job events pushed to the browser (apps/generation/events.py)
+# apps.generation.events.LocalFanout: this process only (workers run in the web process)
+# apps.generation.events.RedisFanout: every process, via GENERATION_EVENT_REDIS_URL (requires redis)
+GENERATION_EVENT_FANOUT = env('GENERATION_EVENT_FANOUT', default='apps.generation.events.LocalFanout')
+GENERATION_EVENT_REDIS_URL = env('GENERATION_EVENT_REDIS_URL', default='redis://localhost:6379/2')
+# Seconds a stream ticket can be used to (re)connect, and between keep-alive comments
+GENERATION_EVENT_TICKET_TTL = env.int('GENERATION_EVENT_TICKET_TTL', default=3600)
+GENERATION_EVENT_HEARTBEAT = env.int('GENERATION_EVENT_HEARTBEAT', default=15)
+
+# Cassette tape effects on generated audio (apps/generation/tape.py)
+GENERATION_TAPE_EFFECTS = env.bool('GENERATION_TAPE_EFFECTS', default=False)
+# Saturation and wow/flutter depth (0-1), hiss level (dBFS RMS) and roll-off corner (Hz)
+TAPE_SATURATION = env.float('TAPE_SATURATION', default=0.4)
+TAPE_WOW_FLUTTER = env.float('TAPE_WOW_FLUTTER', default=0.5)
+TAPE_HISS_DB = env.float('TAPE_HISS_DB', default=-64.0)
+TAPE_ROLLOFF_HZ = env.float('TAPE_ROLLOFF_HZ', default=12000.0)
+
+# Compute accounting and quotas (apps/generation/usage.py)
+# Generation seconds (wall time of all stages) per user per day (UTC); 0 disables
+GENERATION_DAILY_QUOTA_SECONDS = env.int('GENERATION_DAILY_QUOTA_SECONDS', default=3600)
+# Predicted cost until finished jobs give a measured one: seconds per second of
+# audio, and the audio length assumed for songs with automatic duration
+GENERATION_COST_PER_AUDIO_SECOND = env.float('GENERATION_COST_PER_AUDIO_SECOND', default=0.5)
+GENERATION_TYPICAL_AUDIO_SECONDS = env.int('GENERATION_TYPICAL_AUDIO_SECONDS', default=120)
+
+# Orphaned file sweeper: files/dirs younger than this (seconds) are never removed
+GENERATION_SWEEP_MAX_AGE = env.int('GENERATION_SWEEP_MAX_AGE', default=6 * 3600)
+
+# Periodic background tasks (interval in seconds, 0 disables)
+# 'inline': True runs a task in its own scheduler thread; without it the task
+# is queued for the generation workers and waits behind (and holds a slot
+# like) a song job, so maintenance tasks should be inline.
+# Each run happens in one server process (claimed through the
+# PeriodicTaskRun table); 'every_process': True runs a task in all of them,
+# for flushes of per-process buffers.
+PERIODIC_TASKS = {
+    'sweep_media': {
+        'task': 'apps.generation.cleanup.sweep',
+        'interval': env.int('GENERATION_SWEEP_INTERVAL', default=3600),
+        'inline': True,
+    },
+    'hot_rank': {
+        'task': 'apps.songs.ranking.recompute_hot_ranks',
+        'interval': env.int('HOT_RANK_INTERVAL', default=300),
+        'inline': True,  # Keeps ordering=hot at most one interval old under load
+    },
+    'flush_plays': {
+        'task': 'apps.songs.plays.flush_plays',
+        'interval': env.int('PLAY_FLUSH_INTERVAL', default=5),
+        'inline': True,  # Must not wait behind generation jobs
+        'every_process': True,
+    },
+    'user_counters': {
+        'task': 'apps.accounts.counters.recount_song_counters',
+        'interval': env.int('USER_COUNTER_INTERVAL', default=86400),
+        'inline': True,
+    },
+    'library_stats': {
+        'task': 'apps.library.models.reconcile_library_stats',
+        'interval': env.int('LIBRARY_STATS_RECONCILE_INTERVAL', default=86400),
+        'inline': True,
+    },
+    'compact_changes': {
+        'task': 'apps.songs.changes.compact_changes',
+        'interval': env.int('SONG_CHANGE_COMPACT_INTERVAL', default=86400),
+        'inline': True,
+    },
+    'flush_usage': {
+        'task': 'apps.generation.usage.flush_usage',
+        'interval': env.int('GENERATION_USAGE_FLUSH_INTERVAL', default=30),
+        'inline': True,
+        'every_process': True,
+    },
+    'purge_rate_limits': {
+        'task': 'apps.accounts.throttling.purge_buckets',
+        'interval': env.int('RATE_LIMIT_PURGE_INTERVAL', default=3600),
+        'inline': True,
+    },
+}
+
+# Buffered play counts are also flushed once this many plays are pending
+PLAY_FLUSH_THRESHOLD = env.int('PLAY_FLUSH_THRESHOLD', default=500)
+# Plays counted per song per listener (user, or IP when anonymous) per hour; 0 disables
+PLAY_LIMIT_PER_LISTENER = env.int('PLAY_LIMIT_PER_LISTENER', default=20)
+
+# Trending ("hot") feed: rank = (score + 1) / (age_hours + 2) ** gravity
+# Higher gravity makes older songs drop faster
+HOT_RANK_GRAVITY = env.float('HOT_RANK_GRAVITY', default=1.8)
+
+# Anonymous song list/detail pages are cached this many seconds (0 disables)
+# Publishing, votes, edits and deletes invalidate them; play counts can lag this long
+SONG_CACHE_TTL = env.int('SONG_CACHE_TTL', default=30)
+
+# Delta sync change log (apps/songs/changes.py)
+# Deleted songs are reported for this many days; older tokens must resync
+SONG_CHANGE_RETENTION_DAYS = env.int('SONG_CHANGE_RETENTION_DAYS', default=30)
+# Changes are served once this many seconds old, so a slow transaction
+# committing an earlier token is not skipped (0 on SQLite is safe)
+SONG_CHANGES_SETTLE_SECONDS = env.int('SONG_CHANGES_SETTLE_SECONDS', default=2)
+
+# Radio streams (apps/songs/radio.py)
+RADIO_CROSSFADE_SECONDS = env.float('RADIO_CROSSFADE_SECONDS', default=4.0)
+# Encoded audio kept for listeners that fall behind
+RADIO_BUFFER_SECONDS = env.int('RADIO_BUFFER_SECONDS', default=30)
+# A station stops encoding this long after its last listener leaves
+RADIO_IDLE_SECONDS = env.int('RADIO_IDLE_SECONDS', default=30)
+# Trending songs a station rotates through
+RADIO_QUEUE_SIZE = env.int('RADIO_QUEUE_SIZE', default=200)
+
+# Playlist mixtapes (apps/songs/mixtape.py)
+# Default overlap between songs in seconds (0: gapless); clients may pass ?crossfade=
+MIXTAPE_CROSSFADE_SECONDS = env.float('MIXTAPE_CROSSFADE_SECONDS', default=0.0)
+# Cached renders older than this (seconds) are removed by the sweeper
+MIXTAPE_CACHE_MAX_AGE = env.int('MIXTAPE_CACHE_MAX_AGE', default=7 * 86400)
+# Render threads, separate from the generation workers (MAX_CONCURRENT_TASKS)
+MIXTAPE_RENDER_WORKERS = env.int('MIXTAPE_RENDER_WORKERS', default=1)
+# Renders one user may have queued or running in a process
+MIXTAPE_RENDERS_PER_USER = env.int('MIXTAPE_RENDERS_PER_USER', default=2)
+
 # File Upload Settings
 MAX_UPLOAD_SIZE = env.int('MAX_UPLOAD_SIZE', default=10485760)  # 10MB
 
-# Rate Limiting
+# Rate Limiting (apps/accounts/throttling.py), token buckets per hour; 0 disables one
+# Song creation per user and per client IP
 GENERATION_RATE_LIMIT = env.int('GENERATION_RATE_LIMIT', default=10)
+GENERATION_IP_RATE_LIMIT = env.int('GENERATION_IP_RATE_LIMIT', default=30)
+# Lyrics previews per user and per client IP
+LYRICS_RATE_LIMIT = env.int('LYRICS_RATE_LIMIT', default=30)
+LYRICS_IP_RATE_LIMIT = env.int('LYRICS_IP_RATE_LIMIT', default=100)
+# Mixtape renders started per user (cached renders and polls are not counted)
+MIXTAPE_RATE_LIMIT = env.int('MIXTAPE_RATE_LIMIT', default=20)
+# {scope: {'user' | 'ip': (requests, seconds)}}; views pick a scope with throttle_scope
+RATE_LIMITS = {
+    'generation': {'user': (GENERATION_RATE_LIMIT, 3600), 'ip': (GENERATION_IP_RATE_LIMIT, 3600)},
+    'lyrics': {'user': (LYRICS_RATE_LIMIT, 3600), 'ip': (LYRICS_IP_RATE_LIMIT, 3600)},
+    'mixtape': {'user': (MIXTAPE_RATE_LIMIT, 3600)},
+}
+# apps.accounts.throttling.DatabaseBuckets: shared by all processes (one UPDATE per bucket)
+# apps.accounts.throttling.LocalBuckets: per-process memory (single-process deployments)
+RATE_LIMIT_BACKEND = env('RATE_LIMIT_BACKEND', default='apps.accounts.throttling.DatabaseBuckets')
+
+# Prometheus metrics at /metrics (config/metrics.py)
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+# Scrapers must send "Authorization: Bearer <token>"; required unless DEBUG
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
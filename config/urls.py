@@ -2,12 +2,15 @@
 URL configuration for Retro Cassette Music Generator project.
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from django.http import JsonResponse
 
+from apps.songs.views import serve_signed_media
+from config.metrics import metrics_view
+
 def api_status(request):
     """Simple API status endpoint for health checks"""
     return JsonResponse({'status': 'ok', 'message': 'API is running'})
@@ -22,6 +25,16 @@ urlpatterns = [
     path('api/library/', include('apps.library.urls')),
     path('api/generation/', include('apps.generation.urls')),
     
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
+    
+    # Song audio, covers and mixtapes (signed, expiring URLs)
+    re_path(
+        r'^%s(?P<path>(?:songs|covers|mixtapes)/.+)$' % settings.MEDIA_URL.lstrip('/'),
+        serve_signed_media,
+        name='signed-media'
+    ),
+    
     # Frontend
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
 ]
@@ -9,3 +9,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Background jobs (orphaned file sweeper, ...) run in server processes only
+from apps.generation.task_manager import start_periodic_tasks  # noqa: E402
+from apps.generation.events import start_event_bus  # noqa: E402
+start_periodic_tasks()
+start_event_bus()
@@ -286,12 +286,21 @@ class API {
     }
 
     async recordPlay(id) {
+        // Anonymous plays are counted too; signed-in plays are attributed in the play log
         return this.request(`/songs/${id}/play/`, {
             method: 'POST',
-            auth: false,
         });
     }
 
+    async getWaveform(id) {
+        // Binary peaks file (see apps/generation/analysis.py), cached by the browser
+        const response = await fetch(`${this.baseURL}/songs/${id}/waveform/`, {
+            headers: this.token ? { 'Authorization': `Bearer ${this.token}` } : {},
+        });
+        if (!response.ok) return null;
+        return response.arrayBuffer();
+    }
+
     async voteSong(id, voteType) {
         return this.request(`/songs/${id}/vote/`, {
             method: 'POST',
@@ -332,6 +341,11 @@ class API {
         return this.request(`/generation/task/${taskId}/`);
     }
 
+    // Ticket for opening the job event stream (EventSource cannot send headers)
+    async getEventTicket() {
+        return this.request('/generation/events/ticket/', { method: 'POST' });
+    }
+
     // Library endpoints
     async getLibraryStats() {
         return this.request('/library/stats/');
@@ -56,6 +56,7 @@ class Player {
             </div>
             
             ${song.audio_file ? `
+                <canvas class="waveform" id="waveformCanvas" width="600" height="60"></canvas>
                 <audio controls class="audio-player" id="audioPlayer">
                     <source src="${song.audio_file}" type="audio/wav">
                     Your browser does not support audio playback.
@@ -125,6 +126,63 @@ class Player {
         if (audio) {
             this.audio = audio;
             audio.volume = 0.7;
+            this.loadWaveform(song.id);
+            audio.addEventListener('timeupdate', () => this.drawWaveform());
+        }
+    }
+
+    async loadWaveform(id) {
+        this.waveform = null;
+        try {
+            const buffer = await api.getWaveform(id);
+            if (buffer && this.currentSong && this.currentSong.id === id) {
+                this.waveform = this.parseWaveform(buffer);
+                this.drawWaveform();
+            }
+        } catch (error) {
+            console.error('Failed to load waveform:', error);
+        }
+    }
+
+    parseWaveform(buffer) {
+        // Layout: 'RCWF', version, level count, sample rate, total samples,
+        // then (samples per point, point count) per level, then int8 min/max pairs
+        const view = new DataView(buffer);
+        const levelCount = view.getUint8(5);
+        const levels = [];
+        let offset = 14;
+        for (let i = 0; i < levelCount; i++) {
+            levels.push({ points: view.getUint32(offset + 4, true) });
+            offset += 8;
+        }
+        for (const level of levels) {
+            level.data = new Int8Array(buffer, offset, level.points * 2);
+            offset += level.points * 2;
+        }
+        return levels;
+    }
+
+    drawWaveform() {
+        const canvas = document.getElementById('waveformCanvas');
+        if (!canvas || !this.waveform) return;
+
+        // Coarsest level that still has a point per pixel
+        const level = [...this.waveform].reverse().find(l => l.points >= canvas.width) || this.waveform[0];
+        const ctx = canvas.getContext('2d');
+        const mid = canvas.height / 2;
+        const progress = this.audio && this.audio.duration ? this.audio.currentTime / this.audio.duration : 0;
+
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        for (let x = 0; x < canvas.width; x++) {
+            const start = Math.floor(x * level.points / canvas.width);
+            const end = Math.max(start + 1, Math.floor((x + 1) * level.points / canvas.width));
+            let min = 127, max = -127;
+            for (let i = start; i < end; i++) {
+                min = Math.min(min, level.data[i * 2]);
+                max = Math.max(max, level.data[i * 2 + 1]);
+            }
+            ctx.fillStyle = x / canvas.width < progress ? '#e8a33d' : '#8b7355';
+            ctx.fillRect(x, mid - (max / 127) * mid, 1, Math.max(1, ((max - min) / 127) * mid));
         }
     }
 
@@ -5,6 +5,9 @@ class SongsManager {
         this.currentView = 'my';
         this.currentFilters = {};
         this.songs = [];
+        this.events = null;
+        this.eventsCheck = null;
+        this.watching = new Set();
         
         this.initEventListeners();
     }
@@ -174,7 +177,7 @@ class SongsManager {
                         ${song.genre} ${song.mood ? `• ${song.mood}` : ''} • ${durationDisplay}
                     </div>
                     <div class="song-description">
-                        ${escapeHtml(song.description || song.lyrics?.substring(0, 100) || '')}
+                        ${song.search_snippet || escapeHtml(song.excerpt || '')}
                     </div>
                 </div>
                 <div class="cassette-reels">
@@ -241,8 +244,8 @@ class SongsManager {
             form.reset();
             this.showDashboard();
             
-            // Poll for completion
-            this.pollSongStatus(song.id);
+            // Live status updates until it finishes
+            this.watchSong(song.id);
         } catch (error) {
             showToast(error.message || 'Failed to create song', 'error');
         } finally {
@@ -331,6 +334,100 @@ class SongsManager {
         }
     }
 
+    watchSong(id) {
+        this.watching.add(id);
+        if (!window.EventSource) {
+            this.pollSongStatus(id);
+            return;
+        }
+        this.openEventStream();
+    }
+
+    // One stream per page for all of the user's jobs (see apps/generation/events.py)
+    async openEventStream() {
+        if (this.events) return;
+        this.events = 'connecting';
+
+        try {
+            const { url } = await api.getEventTicket();
+            this.events = new EventSource(url);
+        } catch (error) {
+            console.error('Failed to open job event stream:', error);
+            this.events = null;
+            this.watching.forEach(id => this.pollSongStatus(id));
+            return;
+        }
+
+        this.events.addEventListener('queued', (e) => {
+            const event = JSON.parse(e.data);
+            this.setSongStatus(event.song_id, 'generating', `queued #${event.position}`);
+        });
+        this.events.addEventListener('stage', (e) => {
+            const event = JSON.parse(e.data);
+            this.setSongStatus(event.song_id, 'generating', `${event.stage} ${Math.round(event.progress * 100)}%`);
+        });
+        this.events.addEventListener('completed', (e) => {
+            showToast('Song generated successfully!', 'success');
+            this.songFinished(JSON.parse(e.data).song_id);
+        });
+        this.events.addEventListener('failed', (e) => {
+            const event = JSON.parse(e.data);
+            showToast(`Song generation failed: ${event.error}`, 'error');
+            this.songFinished(event.song_id);
+        });
+        this.events.addEventListener('resync', () => {
+            this.closeEventStream();
+            this.loadSongs();
+            if (this.watching.size) this.openEventStream();
+        });
+        // Jobs may have finished before the stream (re)connected
+        this.events.onopen = () => this.watching.forEach(id => this.checkSong(id));
+        // Without a shared fan-out (GENERATION_EVENT_FANOUT) a job running in
+        // another server process never reaches this stream; a slow check
+        // still notices when it finishes
+        this.eventsCheck = setInterval(() => this.watching.forEach(id => this.checkSong(id)), 15000);
+        this.events.onerror = () => {
+            // The browser reconnects by itself unless the ticket was refused
+            if (this.events.readyState === EventSource.CLOSED) {
+                this.closeEventStream();
+                if (this.watching.size) setTimeout(() => this.openEventStream(), 3000);
+            }
+        };
+    }
+
+    async checkSong(id) {
+        try {
+            const song = await api.getSong(id);
+            if (song.status === 'completed' || song.status === 'failed') {
+                this.songFinished(id);
+            }
+        } catch (error) {
+            console.error('Failed to check song status:', error);
+        }
+    }
+
+    closeEventStream() {
+        if (this.events && this.events.close) this.events.close();
+        this.events = null;
+        clearInterval(this.eventsCheck);
+        this.eventsCheck = null;
+    }
+
+    songFinished(id) {
+        this.watching.delete(id);
+        this.loadSongs();
+        if (!this.watching.size) this.closeEventStream();
+    }
+
+    setSongStatus(id, statusClass, label) {
+        const status = document.querySelector(`#song-${id} .song-status`);
+        if (status) {
+            status.className = `song-status ${statusClass}`;
+            status.textContent = label;
+        }
+    }
+
+    // Fallback for browsers without EventSource
     async pollSongStatus(id, attempts = 0) {
         if (attempts > 60) return; // Stop after 5 minutes
 
@@ -339,9 +436,11 @@ class SongsManager {
             
             if (song.status === 'completed') {
                 showToast('Song generated successfully!', 'success');
+                this.watching.delete(id);
                 this.loadSongs();
             } else if (song.status === 'failed') {
                 showToast(`Song generation failed: ${song.error_message}`, 'error');
+                this.watching.delete(id);
                 this.loadSongs();
             } else {
                 setTimeout(() => this.pollSongStatus(id, attempts + 1), 5000);